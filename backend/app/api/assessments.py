@@ -1,19 +1,34 @@
 """
 Assessment management endpoints
 """
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session, joinedload
-from typing import List
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, status
+from fastapi.responses import Response as RawResponse
+from sqlalchemy import case, func, insert, select, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from contextlib import asynccontextmanager
 from datetime import datetime
 from uuid import UUID
+import base64
+import binascii
+import logging
 import random
+import uuid
 
+from config import settings
 from app.database import get_db
 from app.models import Assessment, Question, AssessmentQuestion, Response, AssessmentStatus, QuestionType
-from app.schemas import AssessmentCreate, AssessmentResponse, QuestionResponse
+from app.schemas import AssessmentCreate, AssessmentResponse, AssessmentSubmit, AssessmentSummary, QuestionResponse, ResponseSubmit
 from app.api.auth import get_current_user
 from app.models import User
 from app.services.question_generation_service import question_generator
+from app.services.question_bank_service import question_bank
+from app.services.assessment_cache import assessment_cache, dumps
+from app.services.storage_service import answer_prefix, decode_data_url, storage_service, StorageLimitError
+from app.services.image_uploads import IMAGE_TYPES, InvalidUploadError, multipart_schema, remove_files, spool_multipart
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -39,59 +54,155 @@ def _normalize_options(options):
     return options
 
 
-@router.get("/", response_model=List[AssessmentResponse])
+def _question_dict(question: Question) -> dict:
+    """Serialize a question for AssessmentResponse"""
+    return {
+        "id": question.id,
+        "type": question.type,
+        "subject": question.subject,
+        "topic": question.topic,
+        "difficulty": question.difficulty,
+        "question_text": question.question_text,
+        "options": _normalize_options(question.options),
+        "correct_answer": question.correct_answer,
+        "rubric": question.rubric,
+        "max_marks": question.max_marks,
+        "source_reference": question.source_reference,
+        "created_at": question.created_at
+    }
+
+
+# Columns read for list views (no question bodies)
+SUMMARY_COLUMNS = (
+    Assessment.id,
+    Assessment.user_id,
+    Assessment.subject,
+    Assessment.topic,
+    Assessment.difficulty_level,
+    Assessment.status,
+    Assessment.created_at,
+    Assessment.completed_at,
+    Assessment.total_score,
+    Assessment.time_taken_seconds
+)
+
+
+def _assessment_header(assessment: Assessment) -> dict:
+    """Serialize the mutable assessment fields (everything except questions)"""
+    return {
+        "id": assessment.id,
+        "user_id": assessment.user_id,
+        "subject": assessment.subject,
+        "topic": assessment.topic,
+        "difficulty_level": assessment.difficulty_level,
+        "status": assessment.status,
+        "created_at": assessment.created_at,
+        "completed_at": assessment.completed_at,
+        "total_score": assessment.total_score,
+        "time_taken_seconds": assessment.time_taken_seconds
+    }
+
+
+def _question_payloads(db: Session, assessment_ids: List[UUID]) -> Dict[UUID, bytes]:
+    """
+    Rendered question-set JSON per assessment
+    
+    Served from the payload cache; misses are loaded in one query, rendered
+    and cached (question sets are immutable once created).
+    """
+    payloads = assessment_cache.get_many(assessment_ids)
+    missing = [assessment_id for assessment_id in assessment_ids if assessment_id not in payloads]
+    
+    if missing:
+        rows = (
+            db.query(AssessmentQuestion.assessment_id, Question)
+            .join(Question, Question.id == AssessmentQuestion.question_id)
+            .filter(AssessmentQuestion.assessment_id.in_(missing))
+            .order_by(AssessmentQuestion.assessment_id, AssessmentQuestion.order)
+            .all()
+        )
+        grouped = {assessment_id: [] for assessment_id in missing}
+        for assessment_id, question in rows:
+            grouped[assessment_id].append(_question_dict(question))
+        for assessment_id, questions in grouped.items():
+            payloads[assessment_id] = assessment_cache.put(assessment_id, questions)
+    
+    return payloads
+
+
+def _encode_cursor(created_at: datetime, assessment_id: UUID) -> str:
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{assessment_id}".encode()).decode()
+
+
+def _decode_cursor(cursor: str):
+    try:
+        created_at, assessment_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), UUID(assessment_id)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+
+@router.get(
+    "/",
+    response_model=None,
+    responses={
+        200: {
+            "model": List[AssessmentSummary],
+            "description": "Assessment summaries (with `questions` when include=questions)",
+            "headers": {"X-Next-Cursor": {"description": "Cursor for the next page, if any", "schema": {"type": "string"}}}
+        }
+    }
+)
 async def list_assessments(
+    limit: Optional[int] = Query(None, ge=1, le=100, description="Page size; omit to list everything"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor from the previous page"),
+    include: Optional[str] = Query(None, description="Set to 'questions' to embed question sets"),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """List all assessments for current user"""
+    """
+    List the current user's assessments, newest first
     
-    # Load assessments with questions using eager loading
-    assessments = (
-        db.query(Assessment)
-        .options(
-            joinedload(Assessment.questions).joinedload(AssessmentQuestion.question)
-        )
+    Keyset-paginated on (created_at, id) when `limit` is given; the cursor
+    for the next page is returned in the X-Next-Cursor header. Without a
+    limit every assessment is returned, as existing clients expect. Only
+    summary columns are read unless include=questions is given.
+    """
+    
+    query = (
+        db.query(*SUMMARY_COLUMNS)
         .filter(Assessment.user_id == current_user.id)
-        .order_by(Assessment.created_at.desc())
-        .all()
+        .order_by(Assessment.created_at.desc(), Assessment.id.desc())
     )
+    if cursor:
+        created_at, assessment_id = _decode_cursor(cursor)
+        query = query.filter(tuple_(Assessment.created_at, Assessment.id) < (created_at, assessment_id))
     
-    # Format each assessment with its questions
-    formatted_assessments = []
-    for assessment in assessments:
-        assessment_dict = {
-            "id": assessment.id,
-            "user_id": assessment.user_id,
-            "subject": assessment.subject,
-            "topic": assessment.topic,
-            "difficulty_level": assessment.difficulty_level,
-            "status": assessment.status,
-            "created_at": assessment.created_at,
-            "completed_at": assessment.completed_at,
-            "total_score": assessment.total_score,
-            "time_taken_seconds": assessment.time_taken_seconds,
-            "questions": [
-                {
-                    "id": aq.question.id,
-                    "type": aq.question.type,
-                    "subject": aq.question.subject,
-                    "topic": aq.question.topic,
-                    "difficulty": aq.question.difficulty,
-                    "question_text": aq.question.question_text,
-                    "options": _normalize_options(aq.question.options),
-                    "correct_answer": aq.question.correct_answer,
-                    "rubric": aq.question.rubric,
-                    "max_marks": aq.question.max_marks,
-                    "source_reference": aq.question.source_reference,
-                    "created_at": aq.question.created_at
-                }
-                for aq in sorted(assessment.questions, key=lambda x: x.order)
-            ]
-        }
-        formatted_assessments.append(AssessmentResponse(**assessment_dict))
+    if limit is None:
+        rows = query.all()
+        has_more = False
+    else:
+        rows = query.limit(limit + 1).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
     
-    return formatted_assessments
+    if include == "questions":
+        payloads = _question_payloads(db, [row.id for row in rows])
+        body = b"[" + b",".join(
+            assessment_cache.render(_assessment_header(row), payloads[row.id])
+            for row in rows
+        ) + b"]"
+    else:
+        body = dumps([_assessment_header(row) for row in rows])
+    
+    headers = {}
+    if has_more:
+        headers["X-Next-Cursor"] = _encode_cursor(rows[-1].created_at, rows[-1].id)
+    
+    return RawResponse(content=body, media_type="application/json", headers=headers)
 
 
 @router.post("/", response_model=AssessmentResponse, status_code=status.HTTP_201_CREATED)
@@ -105,92 +216,103 @@ async def create_assessment(
     
     This endpoint:
     1. Creates an assessment record
-    2. Uses RAG to retrieve relevant content from NCERT PDFs
-    3. Uses LLM (Groq/OpenAI) to generate UPSC-style questions
-    4. Saves questions to database
-    5. Links questions to the assessment
+    2. Serves questions from the pre-generated question bank when the pool is warm
+    3. Otherwise uses RAG + LLM (Groq/OpenAI) to generate UPSC-style questions inline
+    4. Links questions to the assessment
+    5. Asks the background replenisher to top up the pool
     """
     
-    # Create assessment
+    # Create assessment (every column set here so the response needs no reload)
     new_assessment = Assessment(
+        id=uuid.uuid4(),
         user_id=current_user.id,
         subject=assessment_data.subject,
         topic=assessment_data.topic,
         difficulty_level=assessment_data.difficulty_level,
         status=AssessmentStatus.IN_PROGRESS,
-        created_at=datetime.utcnow()
+        created_at=datetime.utcnow(),
+        completed_at=None,
+        total_score=None,
+        time_taken_seconds=None
     )
     
     db.add(new_assessment)
-    db.flush()  # Get ID without committing
+    db.flush()  # Insert before the question links reference it
     
-    # Generate questions from NCERT PDFs using RAG + LLM
-    questions = await question_generator.generate_questions(
-        db=db,
+    question_bank.record_demand(
+        db,
+        subject=assessment_data.subject,
+        topic=assessment_data.topic,
+        difficulty=assessment_data.difficulty_level
+    )
+    
+    # Common case: pure database read from the pre-generated pool
+    questions = question_bank.take_from_pool(
+        db,
         subject=assessment_data.subject,
         topic=assessment_data.topic,
         difficulty=assessment_data.difficulty_level,
         num_mcq=8,
-        num_subjective=4
+        num_subjective=4,
+        user_id=current_user.id
     )
     
+    if questions is None:
+        # Cold pool: generate questions from NCERT PDFs using RAG + LLM
+        # (the pool was just sampled, so go straight to generation)
+        try:
+            questions = await question_generator.generate_new_questions(
+                db=db,
+                subject=assessment_data.subject,
+                topic=assessment_data.topic,
+                difficulty=assessment_data.difficulty_level,
+                num_mcq=8,
+                num_subjective=4,
+                include_duplicates=True
+            )
+        except Exception as e:
+            logger.error(f"Error generating questions: {e}")
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Could not generate questions for this topic right now, please try again"
+            )
+    
     # Select a random subset for this assessment (e.g., 10 questions)
     selected_questions = random.sample(questions, min(10, len(questions)))
+    question_bank.mark_served(db, selected_questions)
     
-    # Associate questions with assessment
-    for idx, question in enumerate(selected_questions):
-        assessment_question = AssessmentQuestion(
-            assessment_id=new_assessment.id,
-            question_id=question.id,
-            order=idx + 1
-        )
-        db.add(assessment_question)
+    # Associate questions with assessment in one multi-row INSERT
+    db.execute(
+        insert(AssessmentQuestion),
+        [
+            {
+                "id": uuid.uuid4(),
+                "assessment_id": new_assessment.id,
+                "question_id": question.id,
+                "order": idx + 1
+            }
+            for idx, question in enumerate(selected_questions)
+        ]
+    )
+    
+    # Build the response from in-memory objects before commit expires them,
+    # and warm the payload cache for the test page
+    questions_json = assessment_cache.put(
+        new_assessment.id,
+        [_question_dict(question) for question in selected_questions]
+    )
+    body = assessment_cache.render(_assessment_header(new_assessment), questions_json)
     
     db.commit()
-    db.refresh(new_assessment)
     
-    # Load assessment with questions using eager loading
-    assessment_with_questions = (
-        db.query(Assessment)
-        .options(
-            joinedload(Assessment.questions).joinedload(AssessmentQuestion.question)
-        )
-        .filter(Assessment.id == new_assessment.id)
-        .first()
+    # Keep the pool above its low-water mark for the next request
+    question_bank.request_replenish(
+        assessment_data.subject,
+        assessment_data.topic,
+        assessment_data.difficulty_level
     )
     
-    # Format response manually to ensure proper structure
-    response_dict = {
-        "id": assessment_with_questions.id,
-        "user_id": assessment_with_questions.user_id,
-        "subject": assessment_with_questions.subject,
-        "topic": assessment_with_questions.topic,
-        "difficulty_level": assessment_with_questions.difficulty_level,
-        "status": assessment_with_questions.status,
-        "created_at": assessment_with_questions.created_at,
-        "completed_at": assessment_with_questions.completed_at,
-        "total_score": assessment_with_questions.total_score,
-        "time_taken_seconds": assessment_with_questions.time_taken_seconds,
-        "questions": [
-            {
-                "id": aq.question.id,
-                "type": aq.question.type,
-                "subject": aq.question.subject,
-                "topic": aq.question.topic,
-                "difficulty": aq.question.difficulty,
-                "question_text": aq.question.question_text,
-                "options": aq.question.options,
-                "correct_answer": aq.question.correct_answer,
-                "rubric": aq.question.rubric,
-                "max_marks": aq.question.max_marks,
-                "source_reference": aq.question.source_reference,
-                "created_at": aq.question.created_at
-            }
-            for aq in sorted(assessment_with_questions.questions, key=lambda x: x.order)
-        ]
-    }
-    
-    return AssessmentResponse(**response_dict)
+    return RawResponse(content=body, media_type="application/json", status_code=status.HTTP_201_CREATED)
 
 
 @router.get("/{assessment_id}", response_model=AssessmentResponse)
@@ -201,96 +323,359 @@ async def get_assessment(
 ):
     """Get assessment details with questions"""
     
-    assessment = (
-        db.query(Assessment)
-        .options(
-            joinedload(Assessment.questions).joinedload(AssessmentQuestion.question)
-        )
-        .filter(
-            Assessment.id == assessment_id,
-            Assessment.user_id == current_user.id
+    assessment = db.query(Assessment).filter(
+        Assessment.id == assessment_id,
+        Assessment.user_id == current_user.id
+    ).first()
+    
+    if not assessment:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Assessment not found"
         )
-        .first()
+    
+    questions_json = _question_payloads(db, [assessment.id])[assessment.id]
+    
+    return RawResponse(
+        content=assessment_cache.render(_assessment_header(assessment), questions_json),
+        media_type="application/json"
     )
+
+
+def _owned_assessment(db: Session, assessment_id: UUID, user: User, for_update: bool = False) -> Assessment:
+    """
+    Load one of the user's assessments (404 otherwise)
+    
+    With for_update the row stays locked until commit, so concurrent
+    submits and autosaves of the same assessment run one at a time.
+    """
+    query = db.query(Assessment).filter(
+        Assessment.id == assessment_id,
+        Assessment.user_id == user.id
+    )
+    if for_update:
+        # Refresh an instance already loaded by this session with the locked row
+        query = query.with_for_update().populate_existing()
+    assessment = query.first()
     
     if not assessment:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Assessment not found"
         )
+    return assessment
+
+
+def _answer_prefix(assessment: Assessment, question_id: UUID) -> str:
+    return answer_prefix(assessment.user_id, assessment.id, question_id)
+
+
+def _inline_images(response: ResponseSubmit) -> List[str]:
+    """An answer's base64 images (legacy clients), in page order"""
+    images = response.image_pages or ([response.image_url] if response.image_url else [])
+    if len(images) > settings.OCR_MAX_PAGES:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"At most {settings.OCR_MAX_PAGES} pages per answer"
+        )
+    return images
+
+
+@asynccontextmanager
+async def _staged_images(
+    db: Session, assessment: Assessment, answers: Dict[UUID, ResponseSubmit]
+) -> AsyncIterator[Dict[UUID, List[str]]]:
+    """
+    Move the answers' base64 images to storage before the assessment is locked
     
-    # Format response manually
-    response_dict = {
-        "id": assessment.id,
-        "user_id": assessment.user_id,
-        "subject": assessment.subject,
-        "topic": assessment.topic,
-        "difficulty_level": assessment.difficulty_level,
-        "status": assessment.status,
-        "created_at": assessment.created_at,
-        "completed_at": assessment.completed_at,
-        "total_score": assessment.total_score,
-        "time_taken_seconds": assessment.time_taken_seconds,
-        "questions": [
-            {
-                "id": aq.question.id,
-                "type": aq.question.type,
-                "subject": aq.question.subject,
-                "topic": aq.question.topic,
-                "difficulty": aq.question.difficulty,
-                "question_text": aq.question.question_text,
-                "options": _normalize_options(aq.question.options),
-                "correct_answer": aq.question.correct_answer,
-                "rubric": aq.question.rubric,
-                "max_marks": aq.question.max_marks,
-                "source_reference": aq.question.source_reference,
-                "created_at": aq.question.created_at
-            }
-            for aq in sorted(assessment.questions, key=lambda x: x.order)
-        ]
+    Uploads run with no DB connection checked out (the session is committed
+    first). The block must commit to keep them: if it fails or leaves without
+    committing, the transaction is rolled back and objects this request added
+    are deleted. Keys already saved on an answer (images are keyed by
+    content) are kept.
+    
+    Yields:
+        Storage keys in page order, per question that has images
+    """
+    pages = {question_id: _inline_images(response) for question_id, response in answers.items()}
+    pages = {question_id: images for question_id, images in pages.items() if images}
+    prefixes = {question_id: _answer_prefix(assessment, question_id) for question_id in pages}
+    stored = {
+        key
+        for keys in _stored_image_keys(db, assessment.id, list(pages)).values()
+        for key in keys
     }
+    db.commit()  # Don't hold a connection (or the row lock) while uploading
     
-    return AssessmentResponse(**response_dict)
+    image_keys, added = {}, []
+    try:
+        for question_id, images in pages.items():
+            image_keys[question_id] = []
+            for image in images:
+                try:
+                    data, content_type = decode_data_url(image)
+                except binascii.Error:
+                    raise HTTPException(
+                        status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                        detail=f"Answer image for question {question_id} is not valid base64"
+                    )
+                key = await storage_service.save_bytes(data, prefixes[question_id], content_type)
+                image_keys[question_id].append(key)
+                if key not in stored:
+                    added.append(key)
+        
+        yield image_keys
+    except StorageLimitError as e:
+        await storage_service.delete(added)
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    except BaseException:
+        db.rollback()
+        await storage_service.delete(added)
+        raise
+    else:
+        if db.in_transaction():
+            db.rollback()
+            await storage_service.delete(added)
 
 
-@router.post("/{assessment_id}/submit", status_code=status.HTTP_200_OK)
-async def submit_assessment(
+def _check_questions(db: Session, assessment_id: UUID, question_ids: List[UUID]):
+    """Reject question ids that are not part of the assessment (one query)"""
+    member_ids = set(db.scalars(
+        select(AssessmentQuestion.question_id).where(
+            AssessmentQuestion.assessment_id == assessment_id,
+            AssessmentQuestion.question_id.in_(question_ids)
+        )
+    ))
+    unknown = [str(question_id) for question_id in question_ids if question_id not in member_ids]
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Questions not in this assessment: {', '.join(unknown)}"
+        )
+
+
+def _stored_image_keys(db: Session, assessment_id: UUID, question_ids: List[UUID]) -> Dict[UUID, List[str]]:
+    if not question_ids:
+        return {}
+    rows = db.query(Response.question_id, Response.image_keys).filter(
+        Response.assessment_id == assessment_id,
+        Response.question_id.in_(question_ids),
+        Response.image_keys.isnot(None)
+    ).all()
+    return {question_id: keys for question_id, keys in rows}
+
+
+def _upsert_responses(
+    db: Session, assessment_id: UUID, answers: Dict[UUID, ResponseSubmit], image_keys: Dict[UUID, List[str]]
+) -> Tuple[int, List[str]]:
+    """
+    Insert or update answers keyed on (assessment_id, question_id) in one statement
+    
+    Images are saved as the storage keys from `_staged_images`.
+    
+    Returns:
+        (number of answers written, storage keys no longer referenced; delete
+        them after committing)
+    """
+    if not answers:
+        return 0, []
+    
+    previous = _stored_image_keys(db, assessment_id, list(image_keys))
+    replaced = [
+        key
+        for question_id, keys in previous.items()
+        for key in keys
+        if key not in image_keys[question_id]
+    ]
+    
+    stmt = pg_insert(Response).values([
+        {
+            "id": uuid.uuid4(),
+            "assessment_id": assessment_id,
+            "question_id": question_id,
+            "user_answer": response.user_answer,
+            "image_keys": image_keys.get(question_id)
+        }
+        for question_id, response in answers.items()
+    ])
+    stmt = stmt.on_conflict_do_update(
+        constraint="uq_responses_assessment_question",
+        set_={
+            "user_answer": stmt.excluded.user_answer,
+            "image_keys": func.coalesce(stmt.excluded.image_keys, Response.image_keys),
+            # Recognized text belongs to the old images
+            "ocr_text": case((stmt.excluded.image_keys.is_(None), Response.ocr_text), else_=None)
+        }
+    )
+    db.execute(stmt)
+    return len(answers), replaced
+
+
+def _answers(db: Session, assessment_id: UUID, responses: List[ResponseSubmit]) -> Dict[UUID, ResponseSubmit]:
+    """
+    Answers by question, validated against assessment_questions in one query
+    
+    If a question appears more than once, the last answer wins.
+    """
+    answers = {response.question_id: response for response in responses}
+    if answers:
+        _check_questions(db, assessment_id, list(answers))
+    return answers
+
+
+def _check_open(assessment: Assessment):
+    if assessment.status == AssessmentStatus.COMPLETED:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Assessment already submitted"
+        )
+
+
+@router.put("/{assessment_id}/responses", status_code=status.HTTP_200_OK)
+async def autosave_responses(
     assessment_id: UUID,
-    responses: List[dict],  # Changed to accept list of responses
+    submission: AssessmentSubmit,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Submit assessment responses"""
+    """Save partial answers while the test is in progress (safe to repeat)"""
     
-    assessment = db.query(Assessment).filter(
-        Assessment.id == assessment_id,
-        Assessment.user_id == current_user.id
-    ).first()
+    assessment = _owned_assessment(db, assessment_id, current_user)
+    _check_open(assessment)
+    answers = _answers(db, assessment_id, submission.responses)
     
-    if not assessment:
+    async with _staged_images(db, assessment, answers) as image_keys:
+        # Images are stored; lock only for the write
+        assessment = _owned_assessment(db, assessment_id, current_user, for_update=True)
+        _check_open(assessment)
+        saved, replaced = _upsert_responses(db, assessment_id, answers, image_keys)
+        db.commit()
+    await storage_service.delete(replaced)
+    
+    return {"saved": saved, "assessment_id": str(assessment_id)}
+
+
+@router.put(
+    "/{assessment_id}/responses/{question_id}/images",
+    status_code=status.HTTP_200_OK,
+    openapi_extra=multipart_schema("files", multiple=True)
+)
+async def upload_answer_images(
+    assessment_id: UUID,
+    question_id: UUID,
+    request: Request,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Upload the handwritten pages of one answer, in page order (multipart field "files")
+    
+    Pages are streamed to temporary files and then to object storage,
+    replacing any earlier upload; the answer keeps only their storage keys
+    and is OCR'd when evaluated.
+    """
+    
+    assessment = _owned_assessment(db, assessment_id, current_user)
+    _check_open(assessment)
+    _check_questions(db, assessment_id, [question_id])
+    prefix = _answer_prefix(assessment, question_id)
+    db.commit()  # Don't hold a connection while the body streams in
+    
+    # Body is read only now, after the cheap checks
+    try:
+        files = await spool_multipart(request, "files", IMAGE_TYPES, settings.OCR_MAX_PAGES)
+    except InvalidUploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    
+    keys = []
+    try:
+        for file in files:
+            keys.append(await storage_service.save_file(file.path, prefix, file.content_type))
+    except Exception:
+        await storage_service.delete(keys)
+        raise
+    finally:
+        remove_files([file.path for file in files])
+    
+    # Uploads ran without the lock; re-check that the test is still open before writing
+    assessment = _owned_assessment(db, assessment_id, current_user, for_update=True)
+    if assessment.status == AssessmentStatus.COMPLETED:
+        await storage_service.delete(keys)
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Assessment not found"
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Assessment already submitted"
         )
     
-    # Save responses
-    for response_data in responses:
-        response = Response(
-            assessment_id=assessment_id,
-            question_id=UUID(response_data["question_id"]),
-            user_answer=response_data["user_answer"],
-            image_url=response_data.get("image_url"),
-            created_at=datetime.utcnow()
-        )
-        db.add(response)
+    previous = _stored_image_keys(db, assessment_id, [question_id]).get(question_id, [])
+    stmt = pg_insert(Response).values(
+        id=uuid.uuid4(),
+        assessment_id=assessment_id,
+        question_id=question_id,
+        image_keys=keys
+    )
+    stmt = stmt.on_conflict_do_update(
+        constraint="uq_responses_assessment_question",
+        set_={"image_keys": stmt.excluded.image_keys, "image_url": None, "image_pages": None, "ocr_text": None}
+    )
+    db.execute(stmt)
+    db.commit()
+    await storage_service.delete(previous)
     
-    # Update assessment status
-    assessment.status = AssessmentStatus.COMPLETED
-    assessment.completed_at = datetime.utcnow()
+    return {"question_id": str(question_id), "image_keys": keys}
+
+
+@router.post("/{assessment_id}/submit", status_code=status.HTTP_200_OK)
+async def submit_assessment(
+    assessment_id: UUID,
+    submission: AssessmentSubmit,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Submit assessment responses
     
-    db.commit()
+    Answers are upserted, so answers already autosaved need not be resent.
+    Retrying with the same Idempotency-Key after a successful submit
+    returns the original result without writing anything.
+    """
+    
+    result = {"message": "Assessment submitted successfully", "assessment_id": str(assessment_id)}
     
-    return {"message": "Assessment submitted successfully", "assessment_id": str(assessment_id)}
+    assessment = _owned_assessment(db, assessment_id, current_user)
+    if _already_submitted(assessment, idempotency_key):
+        return result
+    answers = _answers(db, assessment_id, submission.responses)
+    
+    async with _staged_images(db, assessment, answers) as image_keys:
+        # Images are stored; lock only for the write
+        assessment = _owned_assessment(db, assessment_id, current_user, for_update=True)
+        if _already_submitted(assessment, idempotency_key):
+            return result
+        _, replaced = _upsert_responses(db, assessment_id, answers, image_keys)
+        
+        # Update assessment status
+        assessment.status = AssessmentStatus.COMPLETED
+        assessment.completed_at = datetime.utcnow()
+        assessment.submit_idempotency_key = idempotency_key
+        
+        db.commit()
+    assessment_cache.invalidate(assessment_id)
+    await storage_service.delete(replaced)
+    
+    return result
+
+
+def _already_submitted(assessment: Assessment, idempotency_key: Optional[str]) -> bool:
+    """True for a retry of the submit that completed the assessment (same Idempotency-Key); 409 for any other"""
+    if assessment.status != AssessmentStatus.COMPLETED:
+        return False
+    if idempotency_key and idempotency_key == assessment.submit_idempotency_key:
+        return True
+    raise HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail="Assessment already submitted"
+    )
 
 
 def _create_sample_questions(db: Session, subject: str, topic: str, difficulty: str) -> List[Question]:
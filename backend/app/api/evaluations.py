@@ -2,26 +2,103 @@
 Answer evaluation endpoints
 """
 from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from sqlalchemy import update
 from sqlalchemy.orm import Session
 from typing import Dict
+from uuid import UUID
 import logging
 
 from app.database import get_db
-from app.models import Assessment, Response, Evaluation, Question, QuestionType
+from app.models import Assessment, Response, Evaluation, EvaluationStatus, Question, QuestionType
 from app.schemas import EvaluationResponse, ConceptGap, Recommendation
 from app.api.auth import get_current_user
 from app.models import User
 from app.services.llm_service import llm_service
 from app.services.rag_service import rag_service
 from app.services.ocr_service import ocr_service
+from app.services.rate_limiter import Priority
+from app.services.assessment_cache import assessment_cache
+from app.services.evaluation_analytics import evaluation_analytics, response_hash
+from app.services.concept_index_service import concept_index
+from app.services.pyq_service import pyq_service
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
 
+async def _grade_response(assessment: Assessment, response: Response, question: Question) -> Dict:
+    """
+    Grade one response
+    
+    Returns:
+        Dict with score, status ("evaluated" or "failed") and, where
+        applicable, is_correct / ocr_text / evaluation (the LLM result)
+    """
+    if question.type == QuestionType.MCQ:
+        # Auto-grade MCQ
+        is_correct = response.user_answer == question.correct_answer
+        return {
+            "score": question.max_marks if is_correct else 0,
+            "is_correct": is_correct,
+            "status": EvaluationStatus.EVALUATED.value
+        }
+    
+    result = {"status": EvaluationStatus.FAILED.value, "score": 0}
+    
+    # Extract text from image(s) if provided; text recognized on an earlier
+    # run is reused (it is cleared whenever the images change)
+    answer_text = response.user_answer
+    if not answer_text and response.ocr_text is not None:
+        answer_text = response.ocr_text
+    elif (response.image_keys or response.image_pages or response.image_url) and not answer_text:
+        try:
+            if response.image_keys:
+                # Stored pages are read only now, right before OCR
+                ocr_result = await ocr_service.extract_from_keys(response.image_keys)
+            elif response.image_pages:
+                ocr_result = await ocr_service.extract_from_base64_pages(response.image_pages)
+            else:
+                ocr_result = await ocr_service.extract_from_base64(response.image_url)
+        except Exception as e:
+            # Left as failed so the next run retries OCR instead of grading an empty answer
+            logger.error(f"OCR extraction failed: {e}")
+            return result
+        if not ocr_result.get("success"):
+            logger.error(f"OCR extraction failed for response {response.id}: {ocr_result.get('error')}")
+            return result
+        answer_text = ocr_result.get("extracted_text", "")
+        result["ocr_text"] = answer_text
+    
+    # Get context from RAG
+    context = await rag_service.get_context_for_evaluation(
+        question=question.question_text,
+        subject=assessment.subject,
+        topic=assessment.topic
+    )
+    
+    # Evaluate using LLM
+    try:
+        evaluation_result = await llm_service.evaluate_answer(
+            question=question.question_text,
+            user_answer=answer_text,
+            rubric=question.rubric or "Standard UPSC evaluation criteria",
+            context=context,
+            max_marks=question.max_marks
+        )
+    except Exception as e:
+        # Left as failed so the next run retries just this answer
+        logger.error(f"LLM evaluation failed: {e}")
+        return result
+    
+    result["score"] = evaluation_result.get("score", 0)
+    result["status"] = EvaluationStatus.EVALUATED.value
+    result["evaluation"] = evaluation_result
+    return result
+
+
 @router.get("/{assessment_id}", response_model=EvaluationResponse)
 async def get_evaluation(
-    assessment_id: int,
+    assessment_id: UUID,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -56,7 +133,7 @@ async def get_evaluation(
 
 @router.post("/{assessment_id}/evaluate", response_model=EvaluationResponse)
 async def evaluate_assessment(
-    assessment_id: int,
+    assessment_id: UUID,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -77,86 +154,60 @@ async def evaluate_assessment(
             detail="Assessment not found"
         )
     
-    # Get all responses
-    responses = db.query(Response).filter(
-        Response.assessment_id == assessment_id
-    ).all()
+    # Get all responses with their questions in one round trip
+    rows = (
+        db.query(Response, Question)
+        .join(Question, Question.id == Response.question_id)
+        .filter(Response.assessment_id == assessment_id)
+        .all()
+    )
     
-    if not responses:
+    if not rows:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="No responses found to evaluate"
         )
     
-    # Evaluate each response
-    total_score = 0
-    max_possible_score = 0
-    all_strengths = []
-    all_weaknesses = []
-    all_concept_gaps = []
+    # Grade only responses that are pending, failed or changed since last run
+    score_updates = []
+    graded = []
     
-    for response in responses:
-        question = db.query(Question).filter(Question.id == response.question_id).first()
-        
-        if question.type == QuestionType.MCQ:
-            # Auto-grade MCQ
-            is_correct = response.user_answer == question.correct_answer
-            response.is_correct = is_correct
-            response.score = question.max_marks if is_correct else 0
-            total_score += response.score
-            
-        elif question.type == QuestionType.SUBJECTIVE:
-            # Extract text from image if provided
-            answer_text = response.user_answer
-            if response.image_url and not answer_text:
-                try:
-                    ocr_result = await ocr_service.extract_from_base64(response.image_url)
-                    answer_text = ocr_result.get("extracted_text", "")
-                    response.ocr_text = answer_text
-                except Exception as e:
-                    logger.error(f"OCR extraction failed: {e}")
-            
-            # Get context from RAG
-            context = await rag_service.get_context_for_evaluation(
-                question=question.question_text,
-                subject=assessment.subject,
-                topic=assessment.topic
-            )
-            
-            # Evaluate using LLM
-            try:
-                evaluation_result = await llm_service.evaluate_answer(
-                    question=question.question_text,
-                    user_answer=answer_text,
-                    rubric=question.rubric or "Standard UPSC evaluation criteria",
-                    context=context,
-                    max_marks=question.max_marks
-                )
-                
-                response.score = evaluation_result.get("score", 0)
-                total_score += response.score
-                
-                # Collect feedback
-                all_strengths.extend(evaluation_result.get("strengths", []))
-                all_weaknesses.extend(evaluation_result.get("weaknesses", []))
-                all_concept_gaps.extend(evaluation_result.get("concept_gaps", []))
-                
-            except Exception as e:
-                logger.error(f"LLM evaluation failed: {e}")
-                response.score = 0
+    for response, question in rows:
+        content_hash = response_hash(response, question)
+        if response.evaluation_status == EvaluationStatus.EVALUATED and response.content_hash == content_hash:
+            continue
         
-        max_possible_score += question.max_marks
+        result = await _grade_response(assessment, response, question)
+        score_updates.append({
+            "id": response.id,
+            "score": result["score"],
+            "is_correct": result.get("is_correct"),
+            "ocr_text": result.get("ocr_text", response.ocr_text),
+            "evaluation_status": result["status"],
+            "content_hash": content_hash
+        })
+        graded.append((response, question, result.get("evaluation")))
     
-    db.commit()
+    logger.info(f"Graded {len(score_updates)} of {len(rows)} responses for assessment {assessment_id}")
     
-    # Calculate overall score percentage
+    # Write all results back in one executemany UPDATE (by primary key)
+    if score_updates:
+        db.execute(update(Response), score_updates)
+        evaluation_analytics.store_results(db, assessment, graded)
+        db.commit()
+    
+    # Aggregate from stored per-response results
+    total_score, max_possible_score = evaluation_analytics.score_totals(db, assessment_id)
     overall_score = (total_score / max_possible_score * 100) if max_possible_score > 0 else 0
+    concept_gaps = evaluation_analytics.gap_frequencies(db, assessment_id=assessment_id)
+    feedback = evaluation_analytics.common_feedback(db, assessment_id)
+    skill_analysis = evaluation_analytics.skill_averages(db, assessment_id=assessment_id)
     
-    # Get recommendations from RAG
-    unique_gaps = list({gap['concept']: gap for gap in all_concept_gaps}.values())
-    gap_concepts = [gap['concept'] for gap in unique_gaps[:5]]
+    # Get recommendations from the concept index (RAG for uncovered concepts)
+    gap_concepts = [gap['concept'] for gap in concept_gaps[:5]]
     
-    recommendations_data = await rag_service.get_recommendations(
+    recommendations_data = await concept_index.get_recommendations(
+        db,
         concept_gaps=gap_concepts,
         subject=assessment.subject
     )
@@ -169,47 +220,48 @@ async def evaluate_assessment(
         ncert_recs.append(Recommendation(
             type="NCERT",
             title=f"NCERT {assessment.subject}",
-            chapter=rec.get("concept", ""),
-            priority="high" if any(g['severity'] == 'high' for g in unique_gaps if g['concept'] == rec.get("concept")) else "medium"
+            chapter=rec.get("chapter") or rec.get("concept", ""),
+            pages=rec.get("pages"),
+            priority="high" if any(g['severity'] == 'high' for g in concept_gaps if g['concept'] == rec.get("concept")) else "medium"
         ))
     
-    # Sample PYQ recommendations (in production, fetch from database)
-    pyq_recs = [
-        Recommendation(
+    # Previous year questions closest to the gaps
+    severity_by_concept = {gap['concept']: gap['severity'] for gap in concept_gaps}
+    for pyq in await pyq_service.recommend(db, gap_concepts, assessment.subject):
+        pyq_recs.append(Recommendation(
             type="PYQ",
-            title="Previous Year Question",
-            year=2022,
-            question="Q5",
-            priority="high"
-        )
-    ]
+            title=f"{pyq['paper']} {pyq['year']}" + (f" Q{pyq['question_number']}" if pyq['question_number'] else ""),
+            year=pyq['year'],
+            question=pyq['question'],
+            marks=pyq['marks'],
+            topic=pyq['topic'] or pyq['concept'],
+            priority="high" if severity_by_concept.get(pyq['concept']) == 'high' else "medium"
+        ))
     
-    # Create evaluation record
-    evaluation = Evaluation(
-        assessment_id=assessment_id,
-        score=overall_score,
-        feedback_text=f"Your overall performance shows understanding of core concepts with room for improvement in depth and analysis.",
-        strengths=list(set(all_strengths[:5])),
-        weaknesses=list(set(all_weaknesses[:5])),
-        concept_gaps=[ConceptGap(**gap).dict() for gap in unique_gaps],
-        recommendations=[rec.dict() for rec in (ncert_recs + pyq_recs)[:10]],
-        skill_analysis={
-            "factual_recall": 75,
-            "analysis": 68,
-            "critical_thinking": 72,
-            "structure": 80,
-            "relevance": 76
-        },
-        llm_model_used="Groq/OpenAI",
-        evaluation_time_ms=5000
-    )
+    # Create or refresh the evaluation record
+    evaluation = db.query(Evaluation).filter(Evaluation.assessment_id == assessment_id).first()
+    if evaluation is None:
+        evaluation = Evaluation(assessment_id=assessment_id)
+        db.add(evaluation)
     
-    db.add(evaluation)
+    evaluation.score = overall_score
+    evaluation.feedback_text = f"Your overall performance shows understanding of core concepts with room for improvement in depth and analysis."
+    evaluation.strengths = feedback["strengths"]
+    evaluation.weaknesses = feedback["weaknesses"]
+    evaluation.concept_gaps = [
+        ConceptGap(concept=gap["concept"], severity=gap["severity"], description=gap["description"]).dict()
+        for gap in concept_gaps
+    ]
+    evaluation.recommendations = [rec.dict() for rec in (ncert_recs + pyq_recs)[:10]]
+    evaluation.skill_analysis = skill_analysis
+    evaluation.llm_model_used = "Groq/OpenAI"
+    evaluation.evaluation_time_ms = 5000
     
     # Update assessment total score
     assessment.total_score = overall_score
     
     db.commit()
+    assessment_cache.invalidate(assessment_id)
     db.refresh(evaluation)
     
     return evaluation
@@ -251,7 +303,8 @@ async def evaluate_subjective_answer(
         user_answer=answer,
         rubric=question.rubric or "Standard evaluation criteria",
         context=context,
-        max_marks=question.max_marks
+        max_marks=question.max_marks,
+        priority=Priority.INTERACTIVE
     )
     
     return result
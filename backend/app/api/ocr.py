@@ -1,12 +1,20 @@
 """
 OCR processing endpoints
 """
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
-from typing import Dict
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from typing import Dict, List, Optional, Union
+import asyncio
+import json
 import logging
 
-from app.services.ocr_service import ocr_service
-from app.schemas import OCRRequest, OCRResponse
+from config import settings
+from app.services.ocr_service import ocr_service, split_pdf, OCRBusyError
+from app.services.image_uploads import (
+    IMAGE_TYPES, PDF_TYPE, InvalidUploadError, check_pixels, multipart_schema, remove_files, spool_multipart, spooled_images
+)
+from app.schemas import OCRRequest, OCRResponse, MultiPageOCRResponse
 from app.api.auth import get_current_user
 from app.models import User
 
@@ -14,27 +22,28 @@ router = APIRouter()
 logger = logging.getLogger(__name__)
 
 
-@router.post("/extract", response_model=OCRResponse)
+@router.post("/extract", response_model=OCRResponse, openapi_extra=multipart_schema("file"))
 async def extract_text_from_image(
-    file: UploadFile = File(...),
+    request: Request,
     current_user: User = Depends(get_current_user)
 ):
-    """Extract text from uploaded image"""
+    """
+    Extract text from uploaded image (multipart field "file")
+    
+    The body is streamed to a single temporary file and checked (magic
+    bytes, size, pixel count) before it is decoded; the OCR worker opens
+    that file by path, so the image is never read whole into this process.
+    """
     
     try:
-        # Read file content
-        contents = await file.read()
+        async with spooled_images(request, "file") as files:
+            result = await ocr_service.extract_text(files[0].path)
         
-        # Validate file type
-        if not file.content_type.startswith('image/'):
+        if result.get("busy"):
             raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="File must be an image"
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="OCR is busy, please retry shortly"
             )
-        
-        # Extract text
-        result = await ocr_service.extract_text(contents)
-        
         if not result.get("success"):
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -46,6 +55,10 @@ async def extract_text_from_image(
             confidence=result["confidence"]
         )
         
+    except InvalidUploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"OCR endpoint error: {e}")
         raise HTTPException(
@@ -59,11 +72,32 @@ async def extract_text_from_base64(
     request: OCRRequest,
     current_user: User = Depends(get_current_user)
 ):
-    """Extract text from base64 encoded image"""
+    """Extract text from a base64 encoded image or an uploaded answer image (image_key)"""
+    
+    if request.image_key:
+        # Users may only read their own answer images
+        if not request.image_key.startswith(f"answers/{current_user.id}/"):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Image not found"
+            )
+    elif not request.image_url:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Provide image_url or image_key"
+        )
     
     try:
-        result = await ocr_service.extract_from_base64(request.image_url)
+        if request.image_key:
+            result = await ocr_service.extract_from_keys([request.image_key])
+        else:
+            result = await ocr_service.extract_from_base64(request.image_url)
         
+        if result.get("busy"):
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="OCR is busy, please retry shortly"
+            )
         if not result.get("success"):
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -75,6 +109,8 @@ async def extract_text_from_base64(
             confidence=result["confidence"]
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"OCR base64 endpoint error: {e}")
         raise HTTPException(
@@ -82,3 +118,135 @@ async def extract_text_from_base64(
             detail=str(e)
         )
 
+
+async def _read_pages(request: Request, spooled: List[str]) -> List[Optional[Union[bytes, str]]]:
+    """
+    Page images from uploaded images (in upload order) or a single PDF
+    
+    Uploads (multipart field "files") are streamed to temporary files whose
+    paths are appended to `spooled` (the caller removes them).
+    """
+    try:
+        files = await spool_multipart(request, "files", IMAGE_TYPES | {PDF_TYPE}, settings.OCR_MAX_PAGES)
+        spooled.extend(file.path for file in files)
+        
+        if any(file.content_type == PDF_TYPE for file in files):
+            if len(files) > 1:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Upload page images or a single PDF"
+                )
+            try:
+                pages = await asyncio.to_thread(split_pdf, files[0].path)
+            except Exception as e:
+                logger.error(f"PDF split failed: {e}")
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Could not read PDF"
+                )
+        else:
+            pages = []
+            for file in files:
+                await asyncio.to_thread(check_pixels, file.path)
+                pages.append(file.path)
+    except InvalidUploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    
+    if not pages:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No pages found"
+        )
+    if len(pages) > settings.OCR_MAX_PAGES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {settings.OCR_MAX_PAGES} pages per upload"
+        )
+    return pages
+
+
+def _page_summary(result: Dict) -> Dict:
+    return {
+        "page": result["page"],
+        "extracted_text": result["extracted_text"],
+        "confidence": result["confidence"],
+        "success": result.get("success", False),
+        "error": result.get("error")
+    }
+
+
+@router.post("/extract-pages", response_model=MultiPageOCRResponse, openapi_extra=multipart_schema("files", multiple=True))
+async def extract_text_from_pages(
+    request: Request,
+    stream: bool = Query(False, description="Stream NDJSON progress events as pages finish"),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Extract text from a multi-page answer (several page images or one PDF,
+    multipart field "files")
+    
+    Pages are OCR'd in parallel and the text is reassembled in page order.
+    With stream=true the response is NDJSON: one "page" event per finished
+    page (in completion order) and a final "done" event with the full text.
+    """
+    
+    spooled = []
+    try:
+        pages = await _read_pages(request, spooled)
+        ocr_service.check_capacity(sum(1 for page in pages if page))
+    except OCRBusyError:
+        remove_files(spooled)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="OCR is busy, please retry shortly"
+        )
+    except BaseException:
+        remove_files(spooled)
+        raise
+    
+    if not stream:
+        try:
+            result = await ocr_service.extract_document(pages)
+        finally:
+            remove_files(spooled)
+        if result.get("busy"):
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="OCR is busy, please retry shortly"
+            )
+        return MultiPageOCRResponse(
+            extracted_text=result["extracted_text"],
+            confidence=result["confidence"],
+            pages=[_page_summary(page) for page in result["pages"]]
+        )
+    
+    async def events():
+        results = []
+        try:
+            async for result in ocr_service.extract_pages(pages):
+                results.append(result)
+                yield json.dumps({
+                    "event": "page",
+                    "completed": len(results),
+                    "total": len(pages),
+                    **_page_summary(result)
+                }) + "\n"
+        except OCRBusyError as e:
+            yield json.dumps({"event": "error", "error": str(e)}) + "\n"
+            return
+        
+        combined = ocr_service.combine_pages(results)
+        yield json.dumps({
+            "event": "done",
+            "extracted_text": combined["extracted_text"],
+            "confidence": combined["confidence"],
+            "pages": [_page_summary(page) for page in combined["pages"]]
+        }) + "\n"
+    
+    # Spooled pages are removed once the stream has been sent
+    return StreamingResponse(
+        events(),
+        media_type="application/x-ndjson",
+        background=BackgroundTask(remove_files, spooled)
+    )
+
@@ -10,6 +10,7 @@ from app.database import get_db
 from app.models import Assessment, ProgressSnapshot, User
 from app.schemas import ProgressResponse
 from app.api.auth import get_current_user
+from app.services.evaluation_analytics import evaluation_analytics
 
 router = APIRouter()
 
@@ -135,3 +136,19 @@ async def get_progress_comparison(
         "total_attempts": len(assessments)
     }
 
+
+@router.get("/insights")
+async def get_progress_insights(
+    subject: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Skill profile, recurring concept gaps and score trend from stored evaluations"""
+    
+    return {
+        "subject": subject,
+        "skill_scores": evaluation_analytics.skill_averages(db, user_id=current_user.id, subject=subject),
+        "concept_gaps": evaluation_analytics.gap_frequencies(db, user_id=current_user.id, subject=subject),
+        "score_trend": evaluation_analytics.score_trend(db, current_user.id, subject=subject)
+    }
+
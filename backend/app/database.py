@@ -1,8 +1,9 @@
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from supabase import create_client, Client
 from config import settings
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
@@ -97,6 +98,36 @@ def get_db():
         db.close()
 
 
+class QueryCounter:
+    """
+    Count SQL statements sent to the database inside a block
+    
+    Used to catch N+1 regressions:
+        with QueryCounter() as queries:
+            ...
+        assert queries.count <= 4, queries.statements
+    
+    Counts every statement on the engine, including other threads', so use it
+    where nothing else is talking to the database.
+    """
+    
+    def __init__(self, bind=None):
+        self.bind = bind if bind is not None else engine
+        self.count = 0
+        self.statements = []
+    
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+        self.statements.append(statement)
+    
+    def __enter__(self):
+        event.listen(self.bind, "before_cursor_execute", self._on_execute)
+        return self
+    
+    def __exit__(self, *exc_info):
+        event.remove(self.bind, "before_cursor_execute", self._on_execute)
+
+
 # Supabase Storage helper
 class SupabaseStorage:
     """
@@ -143,6 +174,34 @@ class SupabaseStorage:
             logger.error(f"❌ Supabase Storage upload failed: {e}")
             raise
     
+    async def upload_local_file(
+        self,
+        file_path: str,
+        local_path: str,
+        content_type: str = "image/jpeg"
+    ):
+        """
+        Upload a file from disk to Supabase Storage
+        
+        The HTTP client streams the open file, so large uploads are never
+        held in memory.
+        """
+        await asyncio.to_thread(
+            self.client.storage.from_(self.bucket_name).upload,
+            file_path,
+            local_path,
+            {"content-type": content_type, "upsert": "true"}
+        )
+        logger.info(f"✅ File uploaded to Supabase Storage: {file_path}")
+    
+    async def download_file(self, file_path: str) -> bytes:
+        """Download a file's bytes from Supabase Storage"""
+        return await asyncio.to_thread(self.client.storage.from_(self.bucket_name).download, file_path)
+    
+    async def delete_files(self, file_paths: list):
+        """Delete several files from Supabase Storage in one request"""
+        await asyncio.to_thread(self.client.storage.from_(self.bucket_name).remove, file_paths)
+    
     async def delete_file(self, file_path: str):
         """Delete file from Supabase Storage"""
         try:
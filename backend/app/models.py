@@ -1,9 +1,11 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Text, JSON, Enum
+from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Text, JSON, Enum, UniqueConstraint, Index
 from sqlalchemy.dialects.postgresql import UUID
+from pgvector.sqlalchemy import Vector
 from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, text
 from datetime import datetime
 import enum
+import random
 import uuid
 
 from app.database import Base
@@ -26,6 +28,12 @@ class QuestionType(str, enum.Enum):
     SUBJECTIVE = "subjective"
 
 
+class EvaluationStatus(str, enum.Enum):
+    PENDING = "pending"
+    EVALUATED = "evaluated"
+    FAILED = "failed"
+
+
 class BookingStatus(str, enum.Enum):
     PENDING = "pending"
     CONFIRMED = "confirmed"
@@ -92,6 +100,10 @@ class MentorReview(Base):
 
 class Assessment(Base):
     __tablename__ = "assessments"
+    __table_args__ = (
+        # Keyset pagination of a user's history, newest first
+        Index("ix_assessments_user_created", "user_id", text("created_at DESC"), text("id DESC")),
+    )
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True)
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"))
@@ -103,6 +115,7 @@ class Assessment(Base):
     completed_at = Column(DateTime, nullable=True)
     total_score = Column(Float, nullable=True)
     time_taken_seconds = Column(Integer, nullable=True)
+    submit_idempotency_key = Column(String, nullable=True)  # Idempotency-Key of the accepted submit
     
     # Relationships
     user = relationship("User", back_populates="assessments")
@@ -113,6 +126,10 @@ class Assessment(Base):
 
 class Question(Base):
     __tablename__ = "questions"
+    __table_args__ = (
+        # Pool lookups + random sampling: range scan on random_key within a pool
+        Index("ix_questions_pool_sample", "subject", "topic", "difficulty", "type", "random_key"),
+    )
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True)
     type = Column(String, nullable=False)  # Changed from Enum to String
@@ -120,24 +137,44 @@ class Question(Base):
     topic = Column(String, nullable=False)
     difficulty = Column(String, nullable=False)
     question_text = Column(Text, nullable=False)
-    options = Column(JSON, nullable=True)  # For MCQ
+    options = Column(JSON(none_as_null=True), nullable=True)  # For MCQ
     correct_answer = Column(String, nullable=True)  # For MCQ
     rubric = Column(Text, nullable=True)  # For subjective
     max_marks = Column(Integer, default=1)
     source_reference = Column(String, nullable=True)
+    random_key = Column(Float, default=random.random, server_default=text("random()"), nullable=False)  # Sampling key in [0, 1)
+    times_served = Column(Integer, default=0, server_default=text("0"), nullable=False)  # Exposure count
+    duplicate_of = Column(UUID(as_uuid=True), ForeignKey("questions.id"), nullable=True)  # Near-duplicate kept for history, not served
     created_at = Column(DateTime, server_default=func.now())
     
     # Relationships
     assessments = relationship("AssessmentQuestion", back_populates="question")
 
 
+class QuestionPool(Base):
+    """Demand tracking per (subject, topic, difficulty) for background question pre-generation"""
+    __tablename__ = "question_pools"
+    __table_args__ = (
+        UniqueConstraint("subject", "topic", "difficulty", name="uq_question_pools_key"),
+    )
+    
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True)
+    subject = Column(String, nullable=False)
+    topic = Column(String, nullable=False)
+    difficulty = Column(String, nullable=False)
+    demand_count = Column(Integer, default=0)  # Assessments requested from this pool
+    last_requested_at = Column(DateTime, nullable=True)
+    last_replenished_at = Column(DateTime, nullable=True)
+    replenishing_until = Column(DateTime, nullable=True)  # Lease so only one worker refills a pool
+
+
 class AssessmentQuestion(Base):
     """Junction table for assessments and questions"""
     __tablename__ = "assessment_questions"
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True)
-    assessment_id = Column(UUID(as_uuid=True), ForeignKey("assessments.id"))
-    question_id = Column(UUID(as_uuid=True), ForeignKey("questions.id"))
+    assessment_id = Column(UUID(as_uuid=True), ForeignKey("assessments.id"), index=True)
+    question_id = Column(UUID(as_uuid=True), ForeignKey("questions.id"), index=True)
     order = Column(Integer)  # Question order in assessment
     
     # Relationships
@@ -147,21 +184,77 @@ class AssessmentQuestion(Base):
 
 class Response(Base):
     __tablename__ = "responses"
+    __table_args__ = (
+        # One answer per question; submit/autosave upsert on this key
+        UniqueConstraint("assessment_id", "question_id", name="uq_responses_assessment_question"),
+    )
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True)
     assessment_id = Column(UUID(as_uuid=True), ForeignKey("assessments.id"))
     question_id = Column(UUID(as_uuid=True), ForeignKey("questions.id"))
     user_answer = Column(Text)
-    image_url = Column(String, nullable=True)  # For handwritten answers
+    image_url = Column(String, nullable=True)  # Legacy inline image (new answers use image_keys)
+    image_pages = Column(JSON, nullable=True)  # Legacy inline page images
+    image_keys = Column(JSON, nullable=True)  # Storage keys of handwritten answer pages, in order
     ocr_text = Column(Text, nullable=True)
     is_correct = Column(Boolean, nullable=True)  # For MCQ
     score = Column(Float, nullable=True)  # For subjective
+    evaluation_status = Column(String, default="pending", server_default=text("'pending'"), nullable=False)
+    content_hash = Column(String(64), nullable=True)  # Hash of answer + question + rubric that was graded
     created_at = Column(DateTime, server_default=func.now())
     
     # Relationships
     assessment = relationship("Assessment", back_populates="responses")
 
 
+class ResponseEvaluation(Base):
+    """LLM grading details for one answer (aggregated in SQL for reports)"""
+    __tablename__ = "response_evaluations"
+    
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    response_id = Column(UUID(as_uuid=True), ForeignKey("responses.id", ondelete="CASCADE"), unique=True, nullable=False)
+    assessment_id = Column(UUID(as_uuid=True), ForeignKey("assessments.id"), index=True, nullable=False)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), index=True, nullable=False)
+    subject = Column(String, nullable=False)
+    score = Column(Float, nullable=False)
+    max_marks = Column(Integer, nullable=False)
+    factual_recall = Column(Float, nullable=True)
+    analysis = Column(Float, nullable=True)
+    critical_thinking = Column(Float, nullable=True)
+    structure = Column(Float, nullable=True)
+    relevance = Column(Float, nullable=True)
+    strengths = Column(JSON)
+    weaknesses = Column(JSON)
+    feedback = Column(Text, nullable=True)
+    model_used = Column(String, nullable=True)
+    created_at = Column(DateTime, server_default=func.now())
+    
+    # Relationships
+    concept_gaps = relationship("ResponseConceptGap", back_populates="response_evaluation", cascade="all, delete-orphan")
+
+
+class ResponseConceptGap(Base):
+    """One concept gap found in one answer"""
+    __tablename__ = "response_concept_gaps"
+    __table_args__ = (
+        Index("ix_response_concept_gaps_user_concept", "user_id", "concept"),
+    )
+    
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    response_evaluation_id = Column(
+        UUID(as_uuid=True), ForeignKey("response_evaluations.id", ondelete="CASCADE"), index=True, nullable=False
+    )
+    assessment_id = Column(UUID(as_uuid=True), ForeignKey("assessments.id"), index=True, nullable=False)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
+    subject = Column(String, nullable=False)
+    concept = Column(String, nullable=False)
+    severity = Column(String, nullable=False)  # high, medium, low
+    description = Column(Text, nullable=True)
+    
+    # Relationships
+    response_evaluation = relationship("ResponseEvaluation", back_populates="concept_gaps")
+
+
 class Evaluation(Base):
     __tablename__ = "evaluations"
     
@@ -217,6 +310,53 @@ class ProgressSnapshot(Base):
     created_at = Column(DateTime, server_default=func.now())
 
 
+class ConceptIndexEntry(Base):
+    """Offline-built mapping from a key concept to the NCERT pages that cover it"""
+    __tablename__ = "concept_index"
+    __table_args__ = (
+        Index("ix_concept_index_subject_key", "subject", "concept_key"),
+    )
+    
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    subject = Column(String, nullable=False)
+    concept = Column(String, nullable=False)
+    concept_key = Column(String, nullable=False)  # Normalized concept for exact/fuzzy matching
+    source_file = Column(String, nullable=False, index=True)  # Path relative to the data directory
+    source_hash = Column(String(64), nullable=False)  # SHA-256 of the file the entry was built from
+    chapter = Column(String, nullable=False)
+    page_start = Column(Integer, nullable=False)
+    page_end = Column(Integer, nullable=False)
+    embedding = Column(Vector(1536), nullable=True)  # text-embedding-3-small of the concept name
+    created_at = Column(DateTime, server_default=func.now())
+
+
+class PreviousYearQuestion(Base):
+    """UPSC previous year question with an embedding for similarity search"""
+    __tablename__ = "previous_year_questions"
+    __table_args__ = (
+        Index("ix_pyqs_subject_year", "subject", "year"),
+        Index(
+            "ix_pyqs_embedding",
+            "embedding",
+            postgresql_using="hnsw",
+            postgresql_ops={"embedding": "vector_cosine_ops"}
+        ),
+    )
+    
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    exam = Column(String, nullable=False, default="UPSC CSE Mains")
+    year = Column(Integer, nullable=False)
+    paper = Column(String, nullable=False)  # e.g. "GS Paper I"
+    question_number = Column(String, nullable=True)
+    question_text = Column(Text, nullable=False)
+    marks = Column(Integer, nullable=True)
+    subject = Column(String, nullable=False)
+    topic = Column(String, nullable=True)
+    embedding = Column(Vector(1536), nullable=True)  # text-embedding-3-small of topic + question
+    content_hash = Column(String(64), unique=True, nullable=False)  # Makes re-ingestion idempotent
+    created_at = Column(DateTime, server_default=func.now())
+
+
 class DocumentChunk(Base):
     """Store processed document chunks for RAG"""
     __tablename__ = "document_chunks"
@@ -78,7 +78,7 @@ class QuestionResponse(BaseModel):
         from_attributes = True
 
 
-class AssessmentResponse(BaseModel):
+class AssessmentSummary(BaseModel):
     id: UUID
     user_id: UUID
     subject: str
@@ -89,17 +89,21 @@ class AssessmentResponse(BaseModel):
     completed_at: Optional[datetime] = None
     total_score: Optional[float] = None
     time_taken_seconds: Optional[int] = None
-    questions: List[QuestionResponse] = []
     
     class Config:
         from_attributes = True
 
 
+class AssessmentResponse(AssessmentSummary):
+    questions: List[QuestionResponse] = []
+
+
 # Response Schemas
 class ResponseSubmit(BaseModel):
     question_id: UUID
     user_answer: str
     image_url: Optional[str] = None
+    image_pages: Optional[List[str]] = None  # Multi-page answers, one image per page in order
 
 
 class AssessmentSubmit(BaseModel):
@@ -120,6 +124,8 @@ class Recommendation(BaseModel):
     pages: Optional[str] = None
     year: Optional[int] = None
     question: Optional[str] = None
+    marks: Optional[int] = None
+    topic: Optional[str] = None
     priority: str = "medium"
 
 
@@ -140,7 +146,8 @@ class EvaluationResponse(BaseModel):
 
 # OCR Schemas
 class OCRRequest(BaseModel):
-    image_url: str
+    image_url: Optional[str] = None  # Base64 encoded image
+    image_key: Optional[str] = None  # Storage key of an uploaded answer image
 
 
 class OCRResponse(BaseModel):
@@ -148,6 +155,20 @@ class OCRResponse(BaseModel):
     confidence: float
 
 
+class OCRPageResult(BaseModel):
+    page: int
+    extracted_text: str
+    confidence: float
+    success: bool
+    error: Optional[str] = None
+
+
+class MultiPageOCRResponse(BaseModel):
+    extracted_text: str
+    confidence: float
+    pages: List[OCRPageResult]
+
+
 # Mentor Schemas
 class MentorProfileResponse(BaseModel):
     id: UUID
@@ -0,0 +1,88 @@
+"""
+Cache of pre-serialized assessment question sets
+
+An assessment's questions never change after creation, so their rendered
+JSON is cached per assessment ID and spliced into a freshly rendered header
+(status, scores) on every request. Entries are invalidated on submit and
+evaluate.
+"""
+import json
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+from enum import Enum
+from typing import Dict, Iterable, List, Optional
+from uuid import UUID
+
+from config import settings
+
+try:
+    import orjson
+except ImportError:  # Optional fast encoder
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, UUID):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.value
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(value) -> bytes:
+    """Compact JSON bytes (orjson when installed)"""
+    if orjson is not None:
+        return orjson.dumps(value, default=_default)
+    return json.dumps(value, default=_default, separators=(",", ":")).encode()
+
+
+class AssessmentPayloadCache:
+    """Bounded LRU of rendered question-set JSON keyed by assessment ID"""
+
+    def __init__(self, max_entries: int = None):
+        self.max_entries = max_entries or settings.ASSESSMENT_CACHE_MAX_ENTRIES
+        self._entries: "OrderedDict[UUID, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, assessment_id: UUID) -> Optional[bytes]:
+        with self._lock:
+            payload = self._entries.get(assessment_id)
+            if payload is not None:
+                self._entries.move_to_end(assessment_id)
+            return payload
+
+    def get_many(self, assessment_ids: Iterable[UUID]) -> Dict[UUID, bytes]:
+        with self._lock:
+            found = {}
+            for assessment_id in assessment_ids:
+                payload = self._entries.get(assessment_id)
+                if payload is not None:
+                    self._entries.move_to_end(assessment_id)
+                    found[assessment_id] = payload
+            return found
+
+    def put(self, assessment_id: UUID, questions: List[dict]) -> bytes:
+        """Render serialized question dicts and cache the JSON"""
+        payload = dumps(questions)
+        with self._lock:
+            self._entries[assessment_id] = payload
+            self._entries.move_to_end(assessment_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return payload
+
+    def invalidate(self, assessment_id: UUID):
+        with self._lock:
+            self._entries.pop(assessment_id, None)
+
+    @staticmethod
+    def render(header: dict, questions_json: bytes) -> bytes:
+        """Splice cached questions JSON into a rendered assessment header"""
+        return dumps(header)[:-1] + b',"questions":' + questions_json + b"}"
+
+
+# Global assessment payload cache
+assessment_cache = AssessmentPayloadCache()
@@ -0,0 +1,367 @@
+"""
+Concept Index Service
+Offline-built lookup table from key concepts to the NCERT pages that cover
+them, so evaluation recommendations are a table lookup instead of a RAG +
+LLM round per concept. Chapters come from the PDF outline, or from
+"Chapter N" headings when a book has none. Built incrementally (only changed
+PDFs are reindexed):
+    python -m app.services.concept_index_service [--subject history] [--force]
+"""
+import asyncio
+import difflib
+import hashlib
+import logging
+import re
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from llama_index.core import Settings
+from PyPDF2 import PdfReader
+from sqlalchemy import delete, func, insert
+from sqlalchemy.orm import Session
+
+from config import settings
+from app.models import ConceptIndexEntry
+from app.services.llm_service import llm_service
+from app.services.rag_service import rag_service
+
+logger = logging.getLogger(__name__)
+
+
+def concept_key(concept: str) -> str:
+    """Normalized form used for exact and fuzzy matching"""
+    return " ".join(re.sub(r"[^a-z0-9 ]", " ", concept.lower()).split())
+
+
+def _file_hash(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+CHAPTER_HEADING_RE = re.compile(r"^(chapter|unit|lesson)\s+(\d+|[ivxlc]+)\b[\s.:\-\u2013\u2014]*(.*)$", re.IGNORECASE)
+
+
+def _outline_chapters(reader: PdfReader) -> List[Tuple[int, str]]:
+    """(first page index, title) of each top-level outline entry"""
+    starts = []
+    try:
+        for item in reader.outline:
+            if isinstance(item, list):  # Children of the previous entry
+                continue
+            starts.append((reader.get_destination_page_number(item), item.title.strip()))
+    except Exception as e:
+        logger.warning(f"Unreadable PDF outline: {e}")
+        return []
+    return sorted(start for start in starts if start[0] is not None and start[0] >= 0 and start[1])
+
+
+def _heading_chapters(pages: List[str]) -> List[Tuple[int, str]]:
+    """(page index, title) of pages that open with a "Chapter N" heading (running headers ignored)"""
+    starts, current = [], None
+    for index, text in enumerate(pages):
+        lines = [line.strip() for line in text.splitlines() if line.strip()]
+        for position, line in enumerate(lines[:5]):
+            match = CHAPTER_HEADING_RE.match(line)
+            if not match:
+                continue
+            number = match.group(2).lower()
+            if number != current:
+                title = match.group(3).strip()
+                if not title and position + 1 < len(lines):
+                    title = lines[position + 1]
+                label = f"{match.group(1).title()} {match.group(2)}"
+                starts.append((index, f"{label}: {title}" if title else label))
+                current = number
+            break
+    return starts
+
+
+def _read_book(path: Path) -> Tuple[List[str], List[str]]:
+    """
+    Page texts and the chapter each page belongs to
+
+    Pages before the first detected chapter (or every page, when none is
+    found) are attributed to the file name.
+    """
+    reader = PdfReader(str(path))
+    pages = [page.extract_text() or "" for page in reader.pages]
+    starts = _outline_chapters(reader) or _heading_chapters(pages)
+
+    chapters, next_start, current = [], 0, path.stem
+    for index in range(len(pages)):
+        while next_start < len(starts) and starts[next_start][0] <= index:
+            current = starts[next_start][1]
+            next_start += 1
+        chapters.append(current)
+    return pages, chapters
+
+
+class ConceptIndexService:
+    """Builds and queries the concept -> chapter index"""
+
+    def __init__(self):
+        self.pages_per_window = settings.CONCEPT_INDEX_PAGES_PER_WINDOW
+        self.fuzzy_cutoff = settings.CONCEPT_INDEX_FUZZY_CUTOFF
+        self.max_distance = settings.CONCEPT_INDEX_MAX_DISTANCE
+        self.cache_ttl = settings.CONCEPT_INDEX_CACHE_TTL_SECONDS
+        # subject -> (concept_key -> entries, index version, time the version was checked)
+        self._keys: Dict[str, Tuple[Dict[str, List[Tuple]], Tuple[int, Optional[datetime]], float]] = {}
+        self._lock = threading.Lock()
+
+    async def build(self, db: Session, subject: Optional[str] = None, force: bool = False) -> Dict[str, int]:
+        """
+        Index every PDF under the data directory whose content changed
+
+        Args:
+            subject: Only index this subject's directory
+            force: Reindex files even if their hash is unchanged
+
+        Returns:
+            Counts of indexed and skipped files, and removed entries
+        """
+        data_dir = rag_service.data_dir
+        indexed = skipped = removed = 0
+        for subject_dir in sorted(data_dir.iterdir()):
+            if not subject_dir.is_dir() or (subject and subject_dir.name != subject):
+                continue
+            present = set()
+            for path in sorted(subject_dir.rglob("*.pdf")):
+                source_file = str(path.relative_to(data_dir))
+                present.add(source_file)
+                file_hash = await asyncio.to_thread(_file_hash, path)
+                current = db.query(ConceptIndexEntry.source_hash).filter(
+                    ConceptIndexEntry.source_file == source_file
+                ).first()
+                if current and current.source_hash == file_hash and not force:
+                    skipped += 1
+                    continue
+
+                await self._index_file(db, subject_dir.name, path, source_file, file_hash)
+                indexed += 1
+
+            # Drop entries of PDFs that were removed from the corpus
+            result = db.execute(
+                delete(ConceptIndexEntry).where(
+                    ConceptIndexEntry.subject == subject_dir.name,
+                    ConceptIndexEntry.source_file.notin_(present)
+                )
+            )
+            removed += result.rowcount
+            db.commit()
+
+        self.invalidate()
+        return {"indexed": indexed, "skipped": skipped, "removed": removed}
+
+    async def _index_file(self, db: Session, subject: str, path: Path, source_file: str, file_hash: str):
+        """Replace a file's entries with freshly extracted concepts per page window"""
+        pages, page_chapters = await asyncio.to_thread(_read_book, path)
+        rows, seen = [], set()
+
+        for chapter, page_start, page_end, text in self._windows(pages, page_chapters):
+            try:
+                concepts = await llm_service.extract_concepts(
+                    subject, f"{chapter}, pages {page_start}-{page_end}", text[:12000]
+                )
+            except Exception as e:
+                logger.error(f"Concept extraction failed for {source_file} p{page_start}-{page_end}: {e}")
+                continue
+
+            for concept in concepts:
+                key = concept_key(concept)
+                if not key or (key, page_start) in seen:
+                    continue
+                seen.add((key, page_start))
+                rows.append({
+                    "subject": subject,
+                    "concept": concept,
+                    "concept_key": key,
+                    "source_file": source_file,
+                    "source_hash": file_hash,
+                    "chapter": chapter,
+                    "page_start": page_start,
+                    "page_end": page_end
+                })
+
+        if rows:
+            embeddings = await asyncio.to_thread(
+                Settings.embed_model.get_text_embedding_batch, [row["concept"] for row in rows]
+            )
+            for row, embedding in zip(rows, embeddings):
+                row["embedding"] = embedding
+
+        db.execute(delete(ConceptIndexEntry).where(ConceptIndexEntry.source_file == source_file))
+        if rows:
+            db.execute(insert(ConceptIndexEntry), rows)
+        db.commit()
+        logger.info(f"Indexed {len(rows)} concepts from {source_file}")
+
+    def _windows(self, pages: List[str], page_chapters: List[str]):
+        """(chapter, first page, last page, text) windows that never span two chapters (1-based pages)"""
+        start = 0
+        while start < len(pages):
+            end = start + 1
+            while (
+                end < len(pages)
+                and end - start < self.pages_per_window
+                and page_chapters[end] == page_chapters[start]
+            ):
+                end += 1
+            text = "\n".join(pages[start:end]).strip()
+            if text:
+                yield page_chapters[start], start + 1, end, text
+            start = end
+
+    def invalidate(self):
+        """Drop the in-memory name index (after a rebuild)"""
+        with self._lock:
+            self._keys.clear()
+
+    @staticmethod
+    def _version(db: Session, subject: str) -> Tuple[int, Optional[datetime]]:
+        """(entry count, newest created_at) of a subject; changes whenever a build touches it"""
+        count, newest = db.query(func.count(ConceptIndexEntry.id), func.max(ConceptIndexEntry.created_at)).filter(
+            ConceptIndexEntry.subject == subject
+        ).one()
+        return count, newest
+
+    def _subject_keys(self, db: Session, subject: str) -> Dict[str, List[Tuple]]:
+        """
+        concept_key -> (chapter, page_start, page_end) rows for a subject
+
+        Cached in memory. After CONCEPT_INDEX_CACHE_TTL_SECONDS the index
+        version is re-read and the map reloaded only if a build (usually in
+        another process) changed it. Empty results are not cached, so a
+        subject indexed after startup is picked up on the next request.
+        """
+        with self._lock:
+            cached = self._keys.get(subject)
+        if cached is not None:
+            keys, version, checked_at = cached
+            if time.monotonic() - checked_at < self.cache_ttl:
+                return keys
+            current = self._version(db, subject)
+            if current == version:
+                with self._lock:
+                    self._keys[subject] = (keys, version, time.monotonic())
+                return keys
+        else:
+            current = self._version(db, subject)
+
+        keys: Dict[str, List[Tuple]] = {}
+        rows = db.query(
+            ConceptIndexEntry.concept_key,
+            ConceptIndexEntry.chapter,
+            ConceptIndexEntry.page_start,
+            ConceptIndexEntry.page_end
+        ).filter(ConceptIndexEntry.subject == subject).all()
+        for key, chapter, page_start, page_end in rows:
+            keys.setdefault(key, []).append((chapter, page_start, page_end))
+
+        with self._lock:
+            if keys:
+                self._keys[subject] = (keys, current, time.monotonic())
+            else:
+                self._keys.pop(subject, None)
+        return keys
+
+    async def _embedding_matches(self, db: Session, subject: str, concepts: List[str]) -> Dict[str, List[Tuple]]:
+        """Nearest indexed concepts by embedding (one batched embedding call)"""
+        embeddings = await asyncio.to_thread(Settings.embed_model.get_text_embedding_batch, concepts)
+        matches = {}
+        for concept, embedding in zip(concepts, embeddings):
+            distance = ConceptIndexEntry.embedding.cosine_distance(embedding)
+            rows = (
+                db.query(ConceptIndexEntry.chapter, ConceptIndexEntry.page_start, ConceptIndexEntry.page_end)
+                .filter(ConceptIndexEntry.subject == subject, distance <= self.max_distance)
+                .order_by(distance)
+                .limit(2)
+                .all()
+            )
+            if rows:
+                matches[concept] = [tuple(row) for row in rows]
+        return matches
+
+    @staticmethod
+    def _recommendation(concept: str, entries: List[Tuple]) -> Dict:
+        chapter = entries[0][0]
+        pages = sorted({(start, end) for entry_chapter, start, end in entries if entry_chapter == chapter})
+        return {
+            "concept": concept,
+            "chapter": chapter,
+            "pages": ", ".join(f"{start}-{end}" if start != end else str(start) for start, end in pages),
+            "recommendations": "",
+            "sources": []
+        }
+
+    async def get_recommendations(self, db: Session, concept_gaps: List[str], subject: str) -> Dict:
+        """
+        NCERT chapter recommendations for concept gaps from the index
+
+        Exact and fuzzy name matches are served from memory; remaining
+        concepts are matched by embedding, and concepts the index does not
+        cover fall back to RAG retrieval.
+
+        Returns:
+            Same shape as RAGService.get_recommendations
+        """
+        keys = self._subject_keys(db, subject)
+        found: Dict[str, List[Tuple]] = {}
+        unmatched = []
+        for concept in concept_gaps:
+            key = concept_key(concept)
+            if key not in keys:
+                close = difflib.get_close_matches(key, keys.keys(), n=1, cutoff=self.fuzzy_cutoff)
+                key = close[0] if close else None
+            if key:
+                found[concept] = keys[key]
+            else:
+                unmatched.append(concept)
+
+        if unmatched and keys:
+            try:
+                matches = await self._embedding_matches(db, subject, unmatched)
+            except Exception as e:
+                logger.error(f"Concept embedding lookup failed: {e}")
+                matches = {}
+            found.update(matches)
+            unmatched = [concept for concept in unmatched if concept not in matches]
+
+        recommendations = [
+            self._recommendation(concept, found[concept]) for concept in concept_gaps if concept in found
+        ]
+        if unmatched:
+            logger.info(f"Concept index miss for {len(unmatched)} concepts in {subject}, using RAG")
+            fallback = await rag_service.get_recommendations(unmatched, subject)
+            recommendations.extend(fallback.get("recommendations", []))
+
+        return {
+            "recommendations": recommendations,
+            "subject": subject
+        }
+
+
+# Global concept index instance
+concept_index = ConceptIndexService()
+
+
+if __name__ == "__main__":
+    import argparse
+    from app.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Build the concept -> NCERT chapter index")
+    parser.add_argument("--subject")
+    parser.add_argument("--force", action="store_true", help="Reindex unchanged files too")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        result = asyncio.run(concept_index.build(db, subject=args.subject, force=args.force))
+        print(f"{result['indexed']} files indexed, {result['skipped']} unchanged, {result['removed']} stale entries removed")
+    finally:
+        db.close()
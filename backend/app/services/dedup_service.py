@@ -0,0 +1,312 @@
+"""
+Near-duplicate question detection
+
+MinHash signatures over character shingles of normalized question text,
+indexed with LSH banding per (subject, topic) pool. Generated questions are
+checked before insert and join the cached pool index only once their
+transaction commits; a cached index is rebuilt when the pool's row count or
+newest timestamp no longer matches. `dedupe_pool` cleans existing pools in batch:
+    python -m app.services.dedup_service [--subject history] [--topic "Medieval India"]
+"""
+import hashlib
+import logging
+import random
+import struct
+import unicodedata
+from collections import OrderedDict, defaultdict
+from datetime import datetime
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from sqlalchemy import event, exists, func
+from sqlalchemy.orm import Session
+
+from config import settings
+from app.models import AssessmentQuestion, Question
+
+logger = logging.getLogger(__name__)
+
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+
+def normalize_text(text: str) -> str:
+    """Casefold, strip punctuation and collapse whitespace (letters, digits and marks of any script are kept)"""
+    text = unicodedata.normalize("NFKC", text or "").casefold()
+    return " ".join("".join(
+        char if unicodedata.category(char)[0] in "LNM" else " " for char in text
+    ).split())
+
+
+def shingles(text: str, size: int = 5) -> set:
+    """Character shingles of normalized text (robust to small rewordings)"""
+    text = normalize_text(text)
+    if len(text) <= size:
+        return {text} if text else set()
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+class MinHasher:
+    """Fixed family of universal hash permutations"""
+
+    def __init__(self, num_perm: int = 64, seed: int = 1):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self.params = [(rng.randrange(1, MERSENNE_PRIME), rng.randrange(0, MERSENNE_PRIME)) for _ in range(num_perm)]
+
+    def signature(self, text: str) -> Tuple[int, ...]:
+        hashes = [
+            struct.unpack("<I", hashlib.blake2b(s.encode(), digest_size=4).digest())[0]
+            for s in shingles(text)
+        ]
+        if not hashes:
+            return tuple([MAX_HASH] * self.num_perm)
+        return tuple(
+            min(((a * h + b) % MERSENNE_PRIME) & MAX_HASH for h in hashes)
+            for a, b in self.params
+        )
+
+    @staticmethod
+    def similarity(sig_a: Tuple[int, ...], sig_b: Tuple[int, ...]) -> float:
+        """Estimated Jaccard similarity"""
+        return sum(a == b for a, b in zip(sig_a, sig_b)) / len(sig_a)
+
+
+class NearDuplicateIndex:
+    """LSH index over MinHash signatures"""
+
+    def __init__(self, hasher: MinHasher, bands: int = 16, threshold: float = 0.6):
+        assert hasher.num_perm % bands == 0
+        self.hasher = hasher
+        self.bands = bands
+        self.rows = hasher.num_perm // bands
+        self.threshold = threshold
+        self.signatures: Dict[Hashable, Tuple[int, ...]] = {}
+        self.buckets = [defaultdict(list) for _ in range(bands)]
+
+    def _band_keys(self, signature: Tuple[int, ...]):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows]
+
+    def add(self, key: Hashable, text: str = None, signature: Tuple[int, ...] = None):
+        signature = signature or self.hasher.signature(text)
+        self.signatures[key] = signature
+        for band, band_key in self._band_keys(signature):
+            self.buckets[band][band_key].append(key)
+
+    def query(self, text: str = None, signature: Tuple[int, ...] = None) -> List[Tuple[Hashable, float]]:
+        """Indexed items at or above the similarity threshold, most similar first"""
+        signature = signature or self.hasher.signature(text)
+        candidates = set()
+        for band, band_key in self._band_keys(signature):
+            candidates.update(self.buckets[band].get(band_key, ()))
+
+        matches = []
+        for key in candidates:
+            score = MinHasher.similarity(signature, self.signatures[key])
+            if score >= self.threshold:
+                matches.append((key, score))
+        return sorted(matches, key=lambda match: match[1], reverse=True)
+
+    def __len__(self):
+        return len(self.signatures)
+
+
+class QuestionDeduplicator:
+    """Rejects generated questions that near-duplicate each other or the existing pool"""
+
+    def __init__(self, max_pools: int = 256):
+        self.hasher = MinHasher(num_perm=64)
+        self.threshold = settings.QUESTION_DEDUP_THRESHOLD
+        self.max_pools = max_pools
+        self._pools: "OrderedDict[Tuple[str, str], NearDuplicateIndex]" = OrderedDict()
+        self._versions: Dict[Tuple[str, str], Tuple[int, Optional[datetime]]] = {}
+
+    def _new_index(self) -> NearDuplicateIndex:
+        return NearDuplicateIndex(self.hasher, bands=16, threshold=self.threshold)
+
+    @staticmethod
+    def _pool_version(db: Session, subject: str, topic: str) -> Tuple[int, Optional[datetime]]:
+        """(row count, newest created_at) of a pool; changes when any worker adds or removes questions"""
+        count, newest = db.query(func.count(Question.id), func.max(Question.created_at)).filter(
+            Question.subject == subject,
+            Question.topic == topic,
+            Question.duplicate_of.is_(None)
+        ).one()
+        return count, newest
+
+    def _pool_index(self, db: Session, subject: str, topic: str) -> NearDuplicateIndex:
+        """LSH index of a pool's question texts, rebuilt from the DB when the pool has changed"""
+        key = (subject, topic)
+        version = self._pool_version(db, subject, topic)
+        if key in self._pools and self._versions.get(key) == version:
+            self._pools.move_to_end(key)
+            return self._pools[key]
+
+        index = self._new_index()
+        rows = db.query(Question.id, Question.question_text).filter(
+            Question.subject == subject,
+            Question.topic == topic,
+            Question.duplicate_of.is_(None)
+        ).all()
+        for question_id, question_text in rows:
+            index.add(question_id, question_text)
+
+        self._pools[key] = index
+        self._pools.move_to_end(key)
+        self._versions[key] = version
+        if len(self._pools) > self.max_pools:
+            evicted, _ = self._pools.popitem(last=False)
+            self._versions.pop(evicted, None)
+        return index
+
+    def dedupe_batch(self, questions: List[Dict]) -> List[Dict]:
+        """Drop near-duplicates within one batch of generated question dicts"""
+        index = self._new_index()
+        unique = []
+        for position, q_data in enumerate(questions):
+            text = q_data.get("question") if isinstance(q_data, dict) else None
+            if not text:
+                continue
+            signature = self.hasher.signature(text)
+            if index.query(signature=signature):
+                continue
+            index.add(position, signature=signature)
+            unique.append(q_data)
+        return unique
+
+    def filter_new(
+        self, db: Session, subject: str, topic: str, questions: List[Dict]
+    ) -> Tuple[List[Dict], List[Hashable]]:
+        """
+        Split generated questions into new ones and pool questions they repeat
+
+        The cached pool index is not changed here; call `record_inserted` with
+        the saved rows so they join it when the transaction commits.
+
+        Returns:
+            (question dicts to insert, ids of the existing pool questions that
+            the rejected ones near-duplicate, in order and without repeats)
+        """
+        index = self._pool_index(db, subject, topic)
+        accepted, matched = [], []
+        for q_data in self.dedupe_batch(questions):
+            matches = index.query(q_data["question"])
+            if not matches:
+                accepted.append(q_data)
+            elif matches[0][0] not in matched:
+                matched.append(matches[0][0])
+
+        if len(accepted) < len(questions):
+            logger.info(f"Rejected {len(questions) - len(accepted)} near-duplicate questions for {subject}/{topic}")
+        return accepted, matched
+
+    def record_inserted(self, db: Session, questions: List[Question]):
+        """Queue inserted questions for the pool indexes; applied on commit, dropped on rollback"""
+        pending = db.info.setdefault("dedup_pending", [])
+        for question in questions:
+            pending.append((
+                (question.subject, question.topic),
+                question.id,
+                question.created_at,
+                self.hasher.signature(question.question_text)
+            ))
+
+    def _apply_committed(self, pending: List[Tuple]):
+        for key, question_id, created_at, signature in pending:
+            index = self._pools.get(key)
+            if index is None:
+                continue
+            index.add(question_id, signature=signature)
+            count, newest = self._versions[key]
+            if created_at is not None and (newest is None or created_at > newest):
+                newest = created_at
+            self._versions[key] = (count + 1, newest)
+
+    def invalidate(self, subject: Optional[str] = None, topic: Optional[str] = None):
+        """Drop cached pool indexes (all, or one pool)"""
+        if subject is None:
+            self._pools.clear()
+            self._versions.clear()
+        else:
+            self._pools.pop((subject, topic), None)
+            self._versions.pop((subject, topic), None)
+
+    def dedupe_pool(self, db: Session, subject: str, topic: str) -> Dict[str, int]:
+        """
+        Batch-clean an existing pool (oldest question wins)
+
+        Duplicates never used in an assessment are deleted; used ones are kept
+        for history but marked `duplicate_of` so they are no longer served.
+
+        Returns:
+            Counts of deleted and merged questions
+        """
+        questions = db.query(Question).filter(
+            Question.subject == subject,
+            Question.topic == topic,
+            Question.duplicate_of.is_(None)
+        ).order_by(Question.created_at, Question.id).all()
+
+        index = self._new_index()
+        deleted = merged = 0
+        for question in questions:
+            signature = self.hasher.signature(question.question_text)
+            matches = index.query(signature=signature)
+            if not matches:
+                index.add(question.id, signature=signature)
+                continue
+
+            in_use = db.query(
+                exists().where(AssessmentQuestion.question_id == question.id)
+            ).scalar()
+            if in_use:
+                question.duplicate_of = matches[0][0]
+                merged += 1
+            else:
+                db.delete(question)
+                deleted += 1
+
+        db.commit()
+        self.invalidate(subject, topic)
+        logger.info(f"Deduplicated {subject}/{topic}: {deleted} deleted, {merged} merged")
+        return {"deleted": deleted, "merged": merged}
+
+
+# Global deduplicator instance
+question_deduplicator = QuestionDeduplicator()
+
+
+@event.listens_for(Session, "after_commit")
+def _index_committed_questions(session: Session):
+    pending = session.info.pop("dedup_pending", None)
+    if pending:
+        question_deduplicator._apply_committed(pending)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_rolled_back_questions(session: Session):
+    session.info.pop("dedup_pending", None)
+
+
+if __name__ == "__main__":
+    import argparse
+    from app.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Remove near-duplicate questions from question pools")
+    parser.add_argument("--subject")
+    parser.add_argument("--topic")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        pools = db.query(Question.subject, Question.topic).distinct()
+        if args.subject:
+            pools = pools.filter(Question.subject == args.subject)
+        if args.topic:
+            pools = pools.filter(Question.topic == args.topic)
+
+        for subject, topic in pools.all():
+            result = question_deduplicator.dedupe_pool(db, subject, topic)
+            print(f"{subject}/{topic}: {result['deleted']} deleted, {result['merged']} merged")
+    finally:
+        db.close()
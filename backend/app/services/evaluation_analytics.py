@@ -0,0 +1,251 @@
+"""
+Evaluation Analytics Service
+Stores per-answer grading details and computes report aggregates (scores,
+skill averages, concept-gap frequency and severity, trends) in SQL, so
+evaluation reports, progress and mentor summaries need no LLM calls.
+"""
+import hashlib
+import logging
+import uuid
+from typing import Dict, List, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import case, delete, func, insert, select
+from sqlalchemy.orm import Session
+
+from app.models import Assessment, Question, Response, ResponseConceptGap, ResponseEvaluation
+
+logger = logging.getLogger(__name__)
+
+SKILLS = ("factual_recall", "analysis", "critical_thinking", "structure", "relevance")
+SEVERITY_NAMES = {3: "high", 2: "medium", 1: "low"}
+
+
+def response_hash(response: Response, question: Question) -> str:
+    """Fingerprint of everything a grade depends on (answer, question, rubric, key)"""
+    parts = [
+        response.user_answer or "",
+        response.image_url or "",
+        *(response.image_pages or []),
+        *(response.image_keys or []),
+        question.question_text or "",
+        question.rubric or "",
+        question.correct_answer or "",
+        str(question.max_marks)
+    ]
+    return hashlib.sha256("\x1f".join(parts).encode()).hexdigest()
+
+
+def _severity_rank():
+    return case(
+        (ResponseConceptGap.severity == "high", 3),
+        (ResponseConceptGap.severity == "medium", 2),
+        else_=1
+    )
+
+
+class EvaluationAnalyticsService:
+    """Persistence and SQL aggregation of per-response evaluations"""
+
+    def store_results(
+        self,
+        db: Session,
+        assessment: Assessment,
+        graded: List[Tuple[Response, Question, Optional[Dict]]]
+    ):
+        """
+        Replace stored details for freshly graded responses (caller commits)
+
+        Args:
+            assessment: Assessment the responses belong to
+            graded: (response, question, evaluate_answer result or None) for
+                every response graded in this run; None clears old details
+        """
+        if not graded:
+            return
+
+        stale = select(ResponseEvaluation.id).where(
+            ResponseEvaluation.response_id.in_([response.id for response, _, _ in graded])
+        )
+        db.execute(delete(ResponseConceptGap).where(ResponseConceptGap.response_evaluation_id.in_(stale)))
+        db.execute(delete(ResponseEvaluation).where(ResponseEvaluation.id.in_(stale)))
+
+        evaluation_rows, gap_rows = [], []
+        for response, question, result in graded:
+            if not result:
+                continue
+            evaluation_id = uuid.uuid4()
+            skill_scores = result.get("skill_scores") or {}
+            evaluation_rows.append({
+                "id": evaluation_id,
+                "response_id": response.id,
+                "assessment_id": assessment.id,
+                "user_id": assessment.user_id,
+                "subject": assessment.subject,
+                "score": result.get("score", 0),
+                "max_marks": question.max_marks,
+                **{skill: skill_scores.get(skill) for skill in SKILLS},
+                "strengths": result.get("strengths", []),
+                "weaknesses": result.get("weaknesses", []),
+                "feedback": result.get("feedback"),
+                "model_used": result.get("model_used")
+            })
+            for gap in result.get("concept_gaps", []):
+                if not gap.get("concept"):
+                    continue
+                gap_rows.append({
+                    "id": uuid.uuid4(),
+                    "response_evaluation_id": evaluation_id,
+                    "assessment_id": assessment.id,
+                    "user_id": assessment.user_id,
+                    "subject": assessment.subject,
+                    "concept": gap["concept"],
+                    "severity": gap.get("severity", "medium"),
+                    "description": gap.get("description", "")
+                })
+
+        if evaluation_rows:
+            db.execute(insert(ResponseEvaluation), evaluation_rows)
+        if gap_rows:
+            db.execute(insert(ResponseConceptGap), gap_rows)
+
+    def score_totals(self, db: Session, assessment_id: UUID) -> Tuple[float, int]:
+        """(marks scored, marks possible) over all responses of an assessment"""
+        scored, possible = db.query(
+            func.coalesce(func.sum(Response.score), 0),
+            func.coalesce(func.sum(Question.max_marks), 0)
+        ).join(Question, Question.id == Response.question_id).filter(
+            Response.assessment_id == assessment_id
+        ).one()
+        return float(scored), int(possible)
+
+    def skill_averages(
+        self,
+        db: Session,
+        assessment_id: Optional[UUID] = None,
+        user_id: Optional[UUID] = None,
+        subject: Optional[str] = None
+    ) -> Dict[str, float]:
+        """Mean skill scores (0-100) over stored answer evaluations"""
+        query = db.query(*[func.avg(getattr(ResponseEvaluation, skill)) for skill in SKILLS])
+        query = self._scope(query, ResponseEvaluation, assessment_id, user_id, subject)
+        row = query.one()
+        return {skill: round(float(value), 1) for skill, value in zip(SKILLS, row) if value is not None}
+
+    def gap_frequencies(
+        self,
+        db: Session,
+        assessment_id: Optional[UUID] = None,
+        user_id: Optional[UUID] = None,
+        subject: Optional[str] = None,
+        limit: int = 10
+    ) -> List[Dict]:
+        """
+        Concept gaps grouped by concept, worst severity first, then most frequent
+
+        Returns:
+            Dicts with concept, severity, description, occurrences
+        """
+        severity = func.max(_severity_rank())
+        occurrences = func.count(ResponseConceptGap.id)
+        query = db.query(
+            ResponseConceptGap.concept,
+            severity,
+            occurrences,
+            func.max(ResponseConceptGap.description)
+        )
+        query = self._scope(query, ResponseConceptGap, assessment_id, user_id, subject)
+        rows = (
+            query.group_by(ResponseConceptGap.concept)
+            .order_by(severity.desc(), occurrences.desc(), ResponseConceptGap.concept)
+            .limit(limit)
+            .all()
+        )
+        return [
+            {
+                "concept": concept,
+                "severity": SEVERITY_NAMES[rank],
+                "description": description or "",
+                "occurrences": count
+            }
+            for concept, rank, count, description in rows
+        ]
+
+    def common_feedback(self, db: Session, assessment_id: UUID, limit: int = 5) -> Dict[str, List[str]]:
+        """Most repeated strengths and weaknesses across an assessment's answers (counted in SQL)"""
+        return {
+            "strengths": self._most_common(db, ResponseEvaluation.strengths, assessment_id, limit),
+            "weaknesses": self._most_common(db, ResponseEvaluation.weaknesses, assessment_id, limit)
+        }
+
+    @staticmethod
+    def _most_common(db: Session, column, assessment_id: UUID, limit: int) -> List[str]:
+        """Elements of a JSON array column over an assessment's answers, most frequent first"""
+        # Anything but an array (e.g. JSON null from the LLM) counts as empty
+        array = case((func.json_typeof(column) == "array", column), else_=func.json_build_array())
+        item = func.json_array_elements_text(array).column_valued("item")
+        occurrences = func.count()
+        rows = (
+            db.query(item)
+            .select_from(ResponseEvaluation)
+            .filter(ResponseEvaluation.assessment_id == assessment_id)
+            .group_by(item)
+            .order_by(occurrences.desc(), item)
+            .limit(limit)
+            .all()
+        )
+        return [value for value, in rows]
+
+    def score_trend(self, db: Session, user_id: UUID, subject: Optional[str] = None, window: int = 3) -> List[Dict]:
+        """
+        Completed assessment scores with a rolling average per subject
+
+        Args:
+            window: Number of attempts in the rolling average
+        """
+        rolling = func.avg(Assessment.total_score).over(
+            partition_by=Assessment.subject,
+            order_by=Assessment.completed_at,
+            rows=(-(window - 1), 0)
+        )
+        query = db.query(
+            Assessment.id,
+            Assessment.subject,
+            Assessment.topic,
+            Assessment.completed_at,
+            Assessment.total_score,
+            rolling
+        ).filter(
+            Assessment.user_id == user_id,
+            Assessment.status == "completed",
+            Assessment.total_score.isnot(None)
+        )
+        if subject:
+            query = query.filter(Assessment.subject == subject)
+
+        return [
+            {
+                "assessment_id": assessment_id,
+                "subject": row_subject,
+                "topic": topic,
+                "completed_at": completed_at,
+                "score": round(score, 2),
+                "rolling_average": round(float(average), 2)
+            }
+            for assessment_id, row_subject, topic, completed_at, score, average
+            in query.order_by(Assessment.completed_at).all()
+        ]
+
+    @staticmethod
+    def _scope(query, model, assessment_id, user_id, subject):
+        if assessment_id is not None:
+            query = query.filter(model.assessment_id == assessment_id)
+        if user_id is not None:
+            query = query.filter(model.user_id == user_id)
+        if subject is not None:
+            query = query.filter(model.subject == subject)
+        return query
+
+
+# Global evaluation analytics instance
+evaluation_analytics = EvaluationAnalyticsService()
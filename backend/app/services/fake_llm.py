@@ -0,0 +1,292 @@
+"""
+Offline LLM providers for load testing
+
+Drop-in replacements for the Groq/OpenAI clients used by LLMService and
+QuestionGenerationService (`client.chat.completions.create(...)`):
+
+- FakeLLMClient: deterministic synthetic responses with configurable latency,
+  token rate and error injection
+- RecordingLLMClient: wraps a real client and stores responses as fixtures
+- ReplayLLMClient: serves recorded fixtures, synthesizing on a miss
+
+Selected with settings.LLM_PROVIDER_MODE ("live", "fake", "record", "replay").
+"""
+import hashlib
+import json
+import logging
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Optional
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+PREFIX_BLOCK_CHARS = 512  # ~128 tokens, the granularity of provider prefix caches
+MAX_SEEN_PREFIXES = 100_000  # Prefix blocks remembered (least recently used are forgotten)
+
+
+class FakeLLMError(Exception):
+    """Injected provider failure"""
+
+
+def _request_key(provider: str, model: str, messages: List[Dict], temperature, max_tokens) -> str:
+    """Stable fixture key for a chat completion request"""
+    payload = json.dumps(
+        {
+            "provider": provider,
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens
+        },
+        sort_keys=True
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _completion(content: str, model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0):
+    """Build an object shaped like an SDK ChatCompletion"""
+    return SimpleNamespace(
+        model=model,
+        choices=[SimpleNamespace(message=SimpleNamespace(role="assistant", content=content), finish_reason="stop")],
+        usage=SimpleNamespace(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=prompt_tokens + completion_tokens,
+            prompt_tokens_details=SimpleNamespace(cached_tokens=cached_tokens)
+        )
+    )
+
+
+class FixtureStore:
+    """One JSON file per recorded response, keyed by request hash"""
+
+    def __init__(self, fixture_dir: str):
+        self.fixture_dir = Path(fixture_dir)
+        self.fixture_dir.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> Path:
+        return self.fixture_dir / f"{key}.json"
+
+    def load(self, key: str) -> Optional[Dict]:
+        path = self._path(key)
+        if not path.exists():
+            return None
+        return json.loads(path.read_text())
+
+    def save(self, key: str, record: Dict):
+        self._path(key).write_text(json.dumps(record, indent=2))
+
+
+class _Completions:
+    def __init__(self, create: Callable):
+        self.create = create
+
+
+class _Chat:
+    def __init__(self, create: Callable):
+        self.completions = _Completions(create)
+
+
+class FakeLLMClient:
+    """Deterministic fake provider with realistic latency and failure behaviour"""
+
+    def __init__(
+        self,
+        provider: str,
+        seed: int = None,
+        latency_median_ms: float = None,
+        latency_sigma: float = None,
+        tokens_per_second: float = None,
+        error_rate: float = None
+    ):
+        self.provider = provider
+        self.latency_median_ms = latency_median_ms if latency_median_ms is not None else settings.LLM_FAKE_LATENCY_MEDIAN_MS
+        self.latency_sigma = latency_sigma if latency_sigma is not None else settings.LLM_FAKE_LATENCY_SIGMA
+        self.tokens_per_second = tokens_per_second if tokens_per_second is not None else settings.LLM_FAKE_TOKENS_PER_SECOND
+        self.error_rate = error_rate if error_rate is not None else settings.LLM_FAKE_ERROR_RATE
+        self._rng = random.Random(seed if seed is not None else settings.LLM_FAKE_SEED)
+        self._rng_lock = threading.Lock()
+        self._seen_prefixes: "OrderedDict[str, None]" = OrderedDict()
+        self.chat = _Chat(self.create)
+
+    def create(self, model: str, messages: List[Dict], temperature: float = 0.7, max_tokens: int = 2000, **kwargs):
+        """Mimics `client.chat.completions.create`"""
+        with self._rng_lock:
+            # Log-normal time to first token, like real hosted models
+            first_token_ms = self._rng.lognormvariate(0, self.latency_sigma) * self.latency_median_ms
+            fail = self._rng.random() < self.error_rate
+
+        if fail:
+            time.sleep(first_token_ms / 1000 / 2)
+            raise FakeLLMError(f"{self.provider}: injected error (rate limit / 5xx)")
+
+        content = self._synthesize(messages)
+        prompt_tokens = sum(len(m["content"]) for m in messages) // 4
+        completion_tokens = min(max_tokens, max(1, len(content) // 4))
+        time.sleep(first_token_ms / 1000 + completion_tokens / self.tokens_per_second)
+
+        cached_tokens = self._cached_prefix_chars(messages) // 4
+        return _completion(content, model, prompt_tokens, completion_tokens, cached_tokens)
+
+    def _cached_prefix_chars(self, messages: List[Dict]) -> int:
+        """
+        Emulate provider prefix caching: the longest block-aligned prefix of
+        the whole prompt (system message, instructions, shared context, item)
+        already seen in an earlier request counts as cached (like a provider
+        cache, only the most recently used MAX_SEEN_PREFIXES blocks are kept)
+        """
+        text = "".join(f"{m['role']}:{m['content']}" for m in messages)
+        digest = hashlib.sha256()
+        cached = 0
+        with self._rng_lock:
+            for end in range(PREFIX_BLOCK_CHARS, len(text) + 1, PREFIX_BLOCK_CHARS):
+                digest.update(text[end - PREFIX_BLOCK_CHARS:end].encode())
+                block = digest.copy().hexdigest()
+                if block in self._seen_prefixes:
+                    self._seen_prefixes.move_to_end(block)
+                    cached = end
+                else:
+                    self._seen_prefixes[block] = None
+                    if len(self._seen_prefixes) > MAX_SEEN_PREFIXES:
+                        self._seen_prefixes.popitem(last=False)
+        return cached
+
+    def _synthesize(self, messages: List[Dict]) -> str:
+        """Produce a plausible JSON payload for the prompt type"""
+        prompt = messages[-1]["content"]
+        match = re.search(r"Number of questions: (\d+)", prompt)
+        num_questions = int(match.group(1)) if match else 5
+        digest = hashlib.sha256(prompt.encode()).hexdigest()[:8]
+
+        if "multiple-choice questions" in prompt:
+            return json.dumps([
+                {
+                    "question": f"Synthetic MCQ {digest}-{i + 1}: which statement is correct?",
+                    "options": {"A": "Statement A", "B": "Statement B", "C": "Statement C", "D": "Statement D"},
+                    "correct_answer": "ABCD"[i % 4],
+                    "source": "Fake provider"
+                }
+                for i in range(num_questions)
+            ])
+
+        if "subjective (descriptive/essay-type) questions" in prompt:
+            return json.dumps([
+                {
+                    "question": f"Synthetic subjective question {digest}-{i + 1}: discuss critically.",
+                    "marks": 10,
+                    "rubric": "Evaluation criteria: structure, accuracy, depth, examples",
+                    "source": "Fake provider"
+                }
+                for i in range(num_questions)
+            ])
+
+        if "NCERT excerpt for concept indexing" in prompt:
+            return json.dumps({"concepts": [f"Synthetic concept {digest[:4]}-{i + 1}" for i in range(5)]})
+
+        if "Performance Data:" in prompt:
+            return json.dumps({
+                "primary_gaps": [{"concept": "Synthetic concept", "severity": "medium", "description": "Fake gap"}],
+                "ncert_recommendations": [],
+                "overall_assessment": "Synthetic gap analysis."
+            })
+
+        match = re.search(r"Maximum marks: (\d+)", prompt)
+        max_marks = int(match.group(1)) if match else 10
+        score = round((int(digest, 16) % 100) / 100 * max_marks, 1)
+        return json.dumps({
+            "score": score,
+            "strengths": ["Relevant introduction"],
+            "weaknesses": ["Limited use of examples"],
+            "concept_gaps": [{"concept": f"Concept {digest[:4]}", "severity": "medium", "description": "Synthetic gap"}],
+            "feedback": "Synthetic feedback from the fake provider.",
+            "skill_scores": {
+                "factual_recall": 70,
+                "analysis": 65,
+                "critical_thinking": 60,
+                "structure": 75,
+                "relevance": 80
+            }
+        })
+
+
+class RecordingLLMClient:
+    """Passes calls to a real client and records the responses as fixtures"""
+
+    def __init__(self, provider: str, client, store: FixtureStore):
+        self.provider = provider
+        self.client = client
+        self.store = store
+        self.chat = _Chat(self.create)
+
+    def create(self, model: str, messages: List[Dict], temperature: float = 0.7, max_tokens: int = 2000, **kwargs):
+        start_time = time.time()
+        response = self.client.chat.completions.create(
+            model=model, messages=messages, temperature=temperature, max_tokens=max_tokens, **kwargs
+        )
+        usage = response.usage
+        details = getattr(usage, "prompt_tokens_details", None)
+        self.store.save(_request_key(self.provider, model, messages, temperature, max_tokens), {
+            "provider": self.provider,
+            "model": model,
+            "content": response.choices[0].message.content,
+            "prompt_tokens": usage.prompt_tokens,
+            "completion_tokens": usage.completion_tokens,
+            "cached_tokens": (getattr(details, "cached_tokens", 0) or 0) if details is not None else 0,
+            "latency_ms": int((time.time() - start_time) * 1000)
+        })
+        return response
+
+
+class ReplayLLMClient:
+    """Serves recorded fixtures with their original latency; synthesizes on a miss"""
+
+    def __init__(self, provider: str, store: FixtureStore, fallback: FakeLLMClient):
+        self.provider = provider
+        self.store = store
+        self.fallback = fallback
+        self.chat = _Chat(self.create)
+
+    def create(self, model: str, messages: List[Dict], temperature: float = 0.7, max_tokens: int = 2000, **kwargs):
+        record = self.store.load(_request_key(self.provider, model, messages, temperature, max_tokens))
+        if record is None:
+            logger.debug(f"No fixture for {self.provider}/{model} request, synthesizing")
+            return self.fallback.create(model, messages, temperature=temperature, max_tokens=max_tokens, **kwargs)
+
+        time.sleep(record["latency_ms"] / 1000)
+        return _completion(
+            record["content"], model, record["prompt_tokens"], record["completion_tokens"], record["cached_tokens"]
+        )
+
+
+def build_llm_client(provider: str, live_factory: Callable):
+    """
+    Create the chat client for `provider` according to settings.LLM_PROVIDER_MODE
+
+    Args:
+        provider: "groq" or "openai"
+        live_factory: Zero-argument callable creating the real SDK client
+
+    Returns:
+        Object exposing `chat.completions.create`
+    """
+    mode = settings.LLM_PROVIDER_MODE
+    if mode == "live":
+        return live_factory()
+
+    logger.info(f"Using {mode} LLM provider for {provider}")
+    store = FixtureStore(settings.LLM_FIXTURE_DIR)
+    if mode == "record":
+        return RecordingLLMClient(provider, live_factory(), store)
+    if mode == "replay":
+        return ReplayLLMClient(provider, store, FakeLLMClient(provider))
+    if mode == "fake":
+        return FakeLLMClient(provider)
+
+    raise ValueError(f"Unknown LLM_PROVIDER_MODE: {mode}")
@@ -0,0 +1,299 @@
+"""
+Image upload handling
+
+Multipart bodies are parsed as they arrive and each file part is written
+straight to its own named temporary file, so an upload is stored once (not
+spooled by the framework and then copied) and OCR workers open it by path.
+Parts are checked while streaming: magic bytes as soon as the first bytes
+arrive, then the size limit for the detected type; the pixel count is read
+from the image header afterwards. Nothing is decoded before these checks.
+"""
+import asyncio
+import logging
+import os
+import tempfile
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, BinaryIO, Dict, Iterable, List, Optional, Tuple
+
+from PIL import Image, UnidentifiedImageError
+from starlette.requests import Request
+
+try:
+    from python_multipart.exceptions import FormParserError
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ModuleNotFoundError:  # python-multipart < 0.0.13
+    from multipart.exceptions import FormParserError
+    from multipart.multipart import MultipartParser, parse_options_header
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+IMAGE_TYPES = {"image/jpeg", "image/png", "image/gif", "image/webp", "image/tiff", "image/bmp"}
+PDF_TYPE = "application/pdf"
+SNIFF_BYTES = 16
+MAX_FIELD_BYTES = 64 * 1024  # Non-file form fields
+
+
+class InvalidUploadError(Exception):
+    """Raised when an upload is rejected; status_code is the HTTP status to return"""
+
+    status_code = 400
+
+
+class UnsupportedUploadError(InvalidUploadError):
+    status_code = 415
+
+
+class UploadTooLargeError(InvalidUploadError):
+    status_code = 413
+
+
+def sniff_type(head: bytes) -> Optional[str]:
+    """MIME type from a file's first bytes (None if not a supported format)"""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[:4] in (b"II*\x00", b"MM\x00*"):
+        return "image/tiff"
+    if head.startswith(b"BM"):
+        return "image/bmp"
+    if head.startswith(b"%PDF-"):
+        return PDF_TYPE
+    return None
+
+
+@dataclass
+class SpooledFile:
+    """One uploaded file part, stored at `path`"""
+
+    path: str
+    filename: Optional[str]
+    content_type: Optional[str] = None  # Detected from the magic bytes
+    size: int = 0
+
+
+def _limit(content_type: Optional[str]) -> int:
+    return settings.UPLOAD_MAX_PDF_BYTES if content_type == PDF_TYPE else settings.UPLOAD_MAX_BYTES
+
+
+def _write_chunks(pending: List[Tuple[BinaryIO, bytes]]):
+    for handle, chunk in pending:
+        handle.write(chunk)
+
+
+class _MultipartSpooler:
+    """python-multipart callbacks writing the parts of one field to temporary files"""
+
+    def __init__(self, field: str, allowed_types: Iterable[str], max_files: int):
+        self.field = field
+        self.allowed_types = set(allowed_types)
+        self.max_limit = max(_limit(content_type) for content_type in self.allowed_types)
+        self.max_files = max_files
+        self.files: List[SpooledFile] = []
+        self._handles: List[BinaryIO] = []
+        self._pending: List[Tuple[BinaryIO, bytes]] = []
+        self._header_name = self._header_value = self._disposition = b""
+        self._current: Optional[SpooledFile] = None
+        self._head = b""
+        self._field_bytes = 0
+
+    def callbacks(self) -> Dict:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+        }
+
+    def on_part_begin(self):
+        self._disposition = b""
+        self._current = None
+        self._head = b""
+        self._field_bytes = 0
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self._header_name += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        if self._header_name.lower() == b"content-disposition":
+            self._disposition = self._header_value
+        self._header_name = self._header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._disposition)
+        if b"filename" not in options or options.get(b"name", b"").decode("latin-1") != self.field:
+            return  # Other fields are read past, not stored
+        if len(self.files) >= self.max_files:
+            raise InvalidUploadError(f"At most {self.max_files} files per upload")
+
+        fd, path = tempfile.mkstemp(prefix="upload-", dir=settings.UPLOAD_SPOOL_DIR)
+        self._handles.append(os.fdopen(fd, "wb"))
+        self._current = SpooledFile(path=path, filename=options[b"filename"].decode("utf-8", "replace"))
+        self.files.append(self._current)
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        chunk = data[start:end]
+        part = self._current
+        if part is None:
+            self._field_bytes += len(chunk)
+            if self._field_bytes > MAX_FIELD_BYTES:
+                raise InvalidUploadError("Form field too large")
+            return
+
+        part.size += len(chunk)
+        if part.content_type is None:
+            self._head += chunk[:SNIFF_BYTES]
+            if len(self._head) >= SNIFF_BYTES:
+                self._detect(part)
+        limit = _limit(part.content_type) if part.content_type else self.max_limit
+        if part.size > limit:
+            raise UploadTooLargeError(f"File exceeds {limit // (1 << 20)} MB")
+        self._pending.append((self._handles[-1], chunk))
+
+    def on_part_end(self):
+        if self._current is not None and self._current.content_type is None:
+            self._detect(self._current)
+        self._current = None
+
+    def _detect(self, part: SpooledFile):
+        content_type = sniff_type(self._head)
+        if content_type not in self.allowed_types:
+            raise UnsupportedUploadError("File content is not a supported image")
+        part.content_type = content_type
+
+    async def flush(self):
+        """Write data received so far (off the event loop)"""
+        if self._pending:
+            pending, self._pending = self._pending, []
+            await asyncio.to_thread(_write_chunks, pending)
+
+    def close(self):
+        for handle in self._handles:
+            handle.close()
+
+
+async def spool_multipart(
+    request: Request,
+    field: str,
+    allowed_types: Iterable[str] = IMAGE_TYPES,
+    max_files: int = 1
+) -> List[SpooledFile]:
+    """
+    Stream the files of one multipart form field to temporary files (caller removes them)
+
+    Args:
+        field: Form field holding the file(s)
+        allowed_types: Accepted types, checked against the magic bytes
+        max_files: Most files accepted in the field
+
+    Returns:
+        The stored files in upload order
+
+    Raises:
+        UploadTooLargeError: A file is over UPLOAD_MAX_BYTES (UPLOAD_MAX_PDF_BYTES for PDFs)
+        UnsupportedUploadError: A file's content is not an allowed type
+        InvalidUploadError: Not a multipart body, malformed, too many files or none
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise InvalidUploadError("Expected a multipart/form-data upload")
+
+    spooler = _MultipartSpooler(field, allowed_types, max_files)
+    parser = MultipartParser(params[b"boundary"], spooler.callbacks())
+    try:
+        try:
+            async for chunk in request.stream():
+                parser.write(chunk)
+                await spooler.flush()
+            parser.finalize()
+        except FormParserError as e:
+            raise InvalidUploadError(f"Malformed multipart body: {e}")
+    except BaseException:
+        spooler.close()
+        remove_files(part.path for part in spooler.files)
+        raise
+    spooler.close()
+
+    if not spooler.files:
+        raise InvalidUploadError(f"No file in form field '{field}'")
+    return spooler.files
+
+
+def check_pixels(path: str, max_pixels: Optional[int] = None):
+    """
+    Reject images with too many pixels, reading only the header
+
+    Raises:
+        UploadTooLargeError: Width x height is over the limit
+        InvalidUploadError: The file cannot be parsed as an image
+    """
+    limit = max_pixels or settings.OCR_MAX_PIXELS
+    try:
+        with Image.open(path) as image:
+            width, height = image.size
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+        raise InvalidUploadError(f"Unreadable image: {e}")
+    if width * height > limit:
+        raise UploadTooLargeError(
+            f"Image is {width}x{height}; the limit is {limit / 1e6:.0f} megapixels"
+        )
+
+
+def remove_files(paths: Iterable[str]):
+    for path in paths:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+@asynccontextmanager
+async def spooled_images(request: Request, field: str, max_files: int = 1) -> AsyncIterator[List[SpooledFile]]:
+    """
+    Stream and validate the image uploads of a form field for the duration of the block
+
+    Yields:
+        The stored images, pixel counts checked
+
+    Raises:
+        InvalidUploadError: (or a subclass) the upload was rejected
+    """
+    files = await spool_multipart(request, field, IMAGE_TYPES, max_files)
+    try:
+        for file in files:
+            await asyncio.to_thread(check_pixels, file.path)
+        yield files
+    finally:
+        remove_files([file.path for file in files])
+
+
+def multipart_schema(field: str, multiple: bool = False) -> Dict:
+    """OpenAPI request body for routes that read their upload with spool_multipart"""
+    binary = {"type": "string", "format": "binary"}
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "required": [field],
+                        "properties": {field: {"type": "array", "items": binary} if multiple else binary}
+                    }
+                }
+            }
+        }
+    }
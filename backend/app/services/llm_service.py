@@ -1,6 +1,7 @@
 """
 LLM Service with Groq primary and OpenAI fallback
 """
+import asyncio
 import json
 import time
 import logging
@@ -9,6 +10,15 @@ from groq import Groq
 from openai import OpenAI
 
 from config import settings
+from app.services.fake_llm import build_llm_client
+from app.services.rate_limiter import rate_limiter, Priority, estimate_tokens
+from app.services.local_scoring_service import local_scorer
+from app.services.prompt_templates import (
+    CONCEPT_EXTRACTION_TEMPLATE,
+    EVALUATION_TEMPLATE,
+    GAP_ANALYSIS_TEMPLATE,
+    prompt_cache_stats,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -17,8 +27,8 @@ class LLMService:
     """Service for LLM interactions with fallback support"""
     
     def __init__(self):
-        self.groq_client = Groq(api_key=settings.GROQ_API_KEY)
-        self.openai_client = OpenAI(api_key=settings.OPENAI_API_KEY)
+        self.groq_client = build_llm_client("groq", lambda: Groq(api_key=settings.GROQ_API_KEY))
+        self.openai_client = build_llm_client("openai", lambda: OpenAI(api_key=settings.OPENAI_API_KEY))
         self.groq_model = "llama-3.1-70b-versatile"
         self.openai_model = settings.OPENAI_MODEL
         
@@ -28,7 +38,8 @@ class LLMService:
         user_answer: str,
         rubric: str,
         context: str,
-        max_marks: int = 10
+        max_marks: int = 10,
+        priority: Priority = Priority.EVALUATION
     ) -> Dict:
         """
         Evaluate a subjective answer using LLM
@@ -39,11 +50,24 @@ class LLMService:
             rubric: Evaluation rubric
             context: Relevant context from NCERT/RAG
             max_marks: Maximum marks for the question
+            priority: Rate limiter priority (INTERACTIVE for real-time feedback)
             
         Returns:
             Evaluation results as dictionary
         """
-        prompt = self._create_evaluation_prompt(
+        # Trivial answers (empty, one-liners, OCR garbage) are scored locally
+        provisional = await local_scorer.prescore(
+            question=question,
+            user_answer=user_answer,
+            rubric=rubric,
+            context=context,
+            max_marks=max_marks
+        )
+        if provisional is not None:
+            logger.info(f"Answer scored locally ({provisional['score']}/{max_marks}), skipping hosted LLM")
+            return provisional
+        
+        messages = self._create_evaluation_messages(
             question=question,
             user_answer=user_answer,
             rubric=rubric,
@@ -54,7 +78,7 @@ class LLMService:
         # Try Groq first, fallback to OpenAI
         try:
             start_time = time.time()
-            result = await self._call_groq(prompt)
+            result = await self._call_groq(messages, priority)
             evaluation_time = int((time.time() - start_time) * 1000)
             model_used = f"Groq ({self.groq_model})"
             
@@ -62,7 +86,7 @@ class LLMService:
             logger.warning(f"Groq failed: {e}. Falling back to OpenAI...")
             try:
                 start_time = time.time()
-                result = await self._call_openai(prompt)
+                result = await self._call_openai(messages, priority)
                 evaluation_time = int((time.time() - start_time) * 1000)
                 model_used = f"OpenAI ({self.openai_model})"
             except Exception as e2:
@@ -97,17 +121,17 @@ class LLMService:
         Returns:
             Gap analysis with recommendations
         """
-        prompt = self._create_gap_analysis_prompt(
+        messages = self._create_gap_analysis_messages(
             assessment_data=assessment_data,
             subject=subject,
             topic=topic
         )
         
         try:
-            result = await self._call_groq(prompt)
+            result = await self._call_groq(messages, template=GAP_ANALYSIS_TEMPLATE.name)
         except Exception as e:
             logger.warning(f"Groq failed for gap analysis: {e}")
-            result = await self._call_openai(prompt)
+            result = await self._call_openai(messages, template=GAP_ANALYSIS_TEMPLATE.name)
         
         try:
             return json.loads(result)
@@ -115,152 +139,127 @@ class LLMService:
             logger.error("Failed to parse gap analysis response")
             raise
     
-    async def _call_groq(self, prompt: str) -> str:
+    async def extract_concepts(self, subject: str, source: str, text: str) -> List[str]:
+        """
+        Extract key concepts from an NCERT excerpt (offline concept indexing)
+        
+        Args:
+            subject: Subject name
+            source: Book / chapter label for the excerpt
+            text: Excerpt text
+            
+        Returns:
+            Concept names
+        """
+        messages = CONCEPT_EXTRACTION_TEMPLATE.render(
+            item=f"""Subject: {subject}
+Source: {source}
+
+Excerpt:
+{text}"""
+        )
+        
+        try:
+            result = await self._call_groq(messages, Priority.PREGENERATION, CONCEPT_EXTRACTION_TEMPLATE.name)
+        except Exception as e:
+            logger.warning(f"Groq failed for concept extraction: {e}")
+            result = await self._call_openai(messages, Priority.PREGENERATION, CONCEPT_EXTRACTION_TEMPLATE.name)
+        
+        try:
+            concepts = json.loads(result).get("concepts", [])
+        except (json.JSONDecodeError, AttributeError):
+            logger.error("Failed to parse concept extraction response")
+            return []
+        return [concept.strip() for concept in concepts if isinstance(concept, str) and concept.strip()]
+    
+    async def _call_groq(
+        self,
+        messages: List[Dict],
+        priority: Priority = Priority.EVALUATION,
+        template: str = EVALUATION_TEMPLATE.name
+    ) -> str:
         """Call Groq API"""
+        tokens = estimate_tokens("".join(m["content"] for m in messages), max_tokens=2000)
+        charged = await rate_limiter.acquire("groq", self.groq_model, tokens, priority)
         try:
-            response = self.groq_client.chat.completions.create(
+            # SDK clients are blocking; keep the event loop free for concurrent requests
+            response = await asyncio.to_thread(
+                self.groq_client.chat.completions.create,
                 model=self.groq_model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are an expert UPSC examiner. Provide detailed, accurate, and constructive feedback. Always respond with valid JSON."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
+                messages=messages,
                 temperature=0.3,
                 max_tokens=2000,
             )
+            await rate_limiter.settle("groq", self.groq_model, charged, response.usage)
+            prompt_cache_stats.record(f"groq:{template}", response.usage)
             return response.choices[0].message.content
         except Exception as e:
             logger.error(f"Groq API error: {e}")
             raise
     
-    async def _call_openai(self, prompt: str) -> str:
+    async def _call_openai(
+        self,
+        messages: List[Dict],
+        priority: Priority = Priority.EVALUATION,
+        template: str = EVALUATION_TEMPLATE.name
+    ) -> str:
         """Call OpenAI API"""
+        tokens = estimate_tokens("".join(m["content"] for m in messages), max_tokens=2000)
+        charged = await rate_limiter.acquire("openai", self.openai_model, tokens, priority)
         try:
-            response = self.openai_client.chat.completions.create(
+            response = await asyncio.to_thread(
+                self.openai_client.chat.completions.create,
                 model=self.openai_model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are an expert UPSC examiner. Provide detailed, accurate, and constructive feedback. Always respond with valid JSON."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
+                messages=messages,
                 temperature=0.3,
                 max_tokens=2000,
                 response_format={"type": "json_object"}
             )
+            await rate_limiter.settle("openai", self.openai_model, charged, response.usage)
+            prompt_cache_stats.record(f"openai:{template}", response.usage)
             return response.choices[0].message.content
         except Exception as e:
             logger.error(f"OpenAI API error: {e}")
             raise
     
-    def _create_evaluation_prompt(
+    def _create_evaluation_messages(
         self,
         question: str,
         user_answer: str,
         rubric: str,
         context: str,
         max_marks: int
-    ) -> str:
-        """Create evaluation prompt"""
-        return f"""You are an expert UPSC examiner. Evaluate the following answer.
+    ) -> List[Dict]:
+        """Create evaluation messages (static instructions first, answer last)"""
+        return EVALUATION_TEMPLATE.render(
+            shared_context=f"Relevant Context from NCERT/Study Material:\n{context}",
+            item=f"""Question: {question}
 
-Question: {question}
+Maximum marks: {max_marks}
 
 Evaluation Rubric:
 {rubric}
 
 Student Answer:
-{user_answer}
-
-Relevant Context from NCERT/Study Material:
-{context}
-
-Evaluate the answer based on:
-1. Structure and organization
-2. Factual accuracy (compare with context)
-3. Relevance to the question
-4. Depth of understanding
-5. Use of examples and evidence
-
-Provide response in JSON format:
-{{
-  "score": <float between 0 and {max_marks}>,
-  "strengths": ["strength1", "strength2", "strength3"],
-  "weaknesses": ["weakness1", "weakness2", "weakness3"],
-  "concept_gaps": [
-    {{
-      "concept": "concept name",
-      "severity": "high|medium|low",
-      "description": "brief description"
-    }}
-  ],
-  "feedback": "detailed constructive feedback in 3-4 sentences",
-  "skill_scores": {{
-    "factual_recall": <0-100>,
-    "analysis": <0-100>,
-    "critical_thinking": <0-100>,
-    "structure": <0-100>,
-    "relevance": <0-100>
-  }}
-}}"""
+{user_answer}"""
+        )
     
-    def _create_gap_analysis_prompt(
+    def _create_gap_analysis_messages(
         self,
         assessment_data: Dict,
         subject: str,
         topic: str
-    ) -> str:
-        """Create gap analysis prompt"""
+    ) -> List[Dict]:
+        """Create gap analysis messages"""
         performance_summary = json.dumps(assessment_data, indent=2)
         
-        return f"""Analyze the student's overall performance in {subject} - {topic}.
+        return GAP_ANALYSIS_TEMPLATE.render(
+            item=f"""Subject: {subject}
+Topic: {topic}
 
 Performance Data:
-{performance_summary}
-
-Identify:
-1. Top 3-5 primary conceptual gaps
-2. Specific NCERT chapter references to address gaps
-3. Relevant PYQ (Previous Year Questions) topics for practice
-
-Provide response in JSON format:
-{{
-  "primary_gaps": [
-    {{
-      "concept": "concept name",
-      "severity": "high|medium|low",
-      "description": "what the student is missing"
-    }}
-  ],
-  "ncert_recommendations": [
-    {{
-      "title": "NCERT Book Title",
-      "chapter": "Chapter name",
-      "pages": "page range",
-      "priority": "high|medium|low",
-      "reason": "why this is recommended"
-    }}
-  ],
-  "pyq_recommendations": [
-    {{
-      "year": 2022,
-      "question_number": "Q5",
-      "topic": "topic name",
-      "marks": 10,
-      "relevance": "why practice this"
-    }}
-  ],
-  "overall_assessment": "2-3 sentence summary of performance"
-}}"""
+{performance_summary}"""
+        )
 
 
 # Global LLM service instance
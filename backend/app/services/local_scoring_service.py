@@ -0,0 +1,192 @@
+"""
+Local first-pass scoring for subjective answers
+
+Runs on CPU before the hosted LLM. Trivial answers (empty, a line or two,
+OCR garbage, off-topic) get a provisional score immediately; everything else,
+including short answers that stay close to the reference material, is
+escalated to LLMService.evaluate_answer.
+"""
+import asyncio
+import logging
+import re
+import threading
+import time
+import unicodedata
+from typing import Dict, Optional
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Letters of any script; combining marks (e.g. Devanagari matras) are not \w,
+# so the Indic blocks are listed to keep Hindi words whole
+WORD_RE = re.compile(r"(?:[^\W\d_]|[\u0300-\u036F\u0900-\u0DFF])+", re.UNICODE)
+
+
+def _is_letter(char: str) -> bool:
+    return char.isalpha() or unicodedata.category(char).startswith("M")
+
+
+class LocalScoringService:
+    """Cheap structural + embedding-similarity scorer that short-circuits trivial answers"""
+
+    def __init__(self):
+        self.enabled = settings.LOCAL_SCORING_ENABLED
+        self.model_name = settings.LOCAL_SCORING_MODEL
+        self.min_words = settings.LOCAL_SCORING_MIN_WORDS
+        self.escalate_similarity = settings.LOCAL_SCORING_ESCALATE_SIMILARITY
+        self._model = None
+        self._model_failed = False
+        self._model_lock = threading.Lock()
+
+    def _get_model(self):
+        """Lazily load the sentence-transformers model (None if unavailable)"""
+        if self._model is None and not self._model_failed:
+            # Concurrent requests (worker threads) must not load the model twice
+            with self._model_lock:
+                if self._model is None and not self._model_failed:
+                    try:
+                        from sentence_transformers import SentenceTransformer
+                        self._model = SentenceTransformer(self.model_name, device="cpu")
+                        logger.info(f"Local scoring model loaded: {self.model_name}")
+                    except Exception as e:
+                        logger.warning(f"Local scoring model unavailable, using structural features only: {e}")
+                        self._model_failed = True
+        return self._model
+
+    def _similarity(self, answer: str, reference: str) -> Optional[float]:
+        """Cosine similarity between answer and reference text"""
+        model = self._get_model()
+        if model is None or not reference.strip():
+            return None
+        embeddings = model.encode([answer, reference], normalize_embeddings=True)
+        return float((embeddings[0] * embeddings[1]).sum())
+
+    @staticmethod
+    def structural_features(answer: str) -> Dict:
+        """Word count, vocabulary and character-level signals"""
+        text = (answer or "").strip()
+        words = WORD_RE.findall(text)
+        non_space = [c for c in text if not c.isspace()]
+        alpha_ratio = (sum(_is_letter(c) for c in non_space) / len(non_space)) if non_space else 0.0
+        # OCR garbage is dominated by 1-2 letter fragments
+        real_words = [w for w in words if len(w) >= 3]
+
+        return {
+            "word_count": len(words),
+            "unique_ratio": len({w.lower() for w in words}) / len(words) if words else 0.0,
+            "alpha_ratio": alpha_ratio,
+            "real_word_ratio": len(real_words) / len(words) if words else 0.0,
+            "sentence_count": len([s for s in re.split(r"[.!?।]+", text) if s.strip()]),
+        }
+
+    async def prescore(
+        self,
+        question: str,
+        user_answer: str,
+        rubric: str,
+        context: str,
+        max_marks: int
+    ) -> Optional[Dict]:
+        """
+        Provisional evaluation for trivial answers
+
+        Args:
+            question: The question text
+            user_answer: Student's answer
+            rubric: Evaluation rubric
+            context: Relevant context from NCERT/RAG
+            max_marks: Maximum marks for the question
+
+        Returns:
+            Evaluation dict in the same shape as LLMService.evaluate_answer,
+            or None if the answer needs the hosted LLM
+        """
+        if not self.enabled:
+            return None
+
+        start_time = time.time()
+        features = self.structural_features(user_answer)
+
+        if features["word_count"] < 3:
+            return self._result(
+                0.0, max_marks, start_time, features,
+                weakness="No meaningful answer was provided",
+                feedback="The answer is empty or too short to evaluate. Attempt the question with a structured response."
+            )
+
+        if features["alpha_ratio"] < 0.5 or features["real_word_ratio"] < 0.4:
+            return self._result(
+                0.0, max_marks, start_time, features,
+                weakness="Answer text could not be read reliably",
+                feedback="The answer could not be read. If it was handwritten, upload a clearer image or type the answer."
+            )
+
+        similarity = None
+        reference = "\n".join(part for part in (question, rubric, context[:2000]) if part)
+        try:
+            similarity = await asyncio.to_thread(self._similarity, user_answer, reference)
+        except Exception as e:
+            logger.warning(f"Local similarity scoring failed: {e}")
+
+        if features["word_count"] < self.min_words:
+            # The cap is provisional: a brief answer that stays on the reference
+            # material (or can't be compared) may still be worth more, so the LLM grades it
+            if similarity is None or similarity >= self.escalate_similarity:
+                return None
+            # Loosely related one-liners cannot earn more than a fifth of the marks
+            score = round(max_marks * 0.2 * min(1.0, max(similarity, 0.0) / self.escalate_similarity), 1)
+            return self._result(
+                score, max_marks, start_time, features, similarity=similarity,
+                weakness="Answer is too brief for a UPSC Mains response",
+                feedback=(
+                    f"The answer is too brief (under {self.min_words} words), so it was scored locally and capped "
+                    f"at 20% of the marks. Develop an introduction, a body with facts and examples, and a conclusion."
+                )
+            )
+
+        if similarity is not None and similarity < 0.15:
+            return self._result(
+                0.0, max_marks, start_time, features, similarity=similarity,
+                weakness="Answer does not address the question",
+                feedback="The answer does not appear to address the question. Re-read the question and focus on what it asks."
+            )
+
+        return None
+
+    def _result(
+        self,
+        score: float,
+        max_marks: int,
+        start_time: float,
+        features: Dict,
+        weakness: str,
+        feedback: str,
+        similarity: Optional[float] = None
+    ) -> Dict:
+        """Build a provisional evaluation result"""
+        relevance = int(max(0.0, min(1.0, similarity or 0.0)) * 100)
+        structure = min(100, features["sentence_count"] * 10)
+        percent = int(score / max_marks * 100) if max_marks else 0
+
+        return {
+            "score": score,
+            "strengths": [],
+            "weaknesses": [weakness],
+            "concept_gaps": [],
+            "feedback": feedback,
+            "skill_scores": {
+                "factual_recall": percent,
+                "analysis": percent,
+                "critical_thinking": percent,
+                "structure": structure,
+                "relevance": relevance
+            },
+            "provisional": True,
+            "model_used": "local",
+            "evaluation_time_ms": int((time.time() - start_time) * 1000)
+        }
+
+
+# Global local scoring instance
+local_scorer = LocalScoringService()
@@ -0,0 +1,125 @@
+"""
+OCR Cache
+Content-addressed on-disk store of OCR results, so an image is recognized
+once no matter which endpoint sees it (preview, evaluation, subjective
+feedback). Keys combine the image's SHA-256 with everything that changes the
+output: Tesseract version, language, preprocessing pipeline version and DPI.
+The store is bounded by size; least recently used entries are evicted.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_SIZE = 1 << 20
+
+
+def image_digest(image_data: Union[bytes, str]) -> str:
+    """SHA-256 of image bytes, or of a file's contents read in chunks"""
+    if not isinstance(image_data, str):
+        return hashlib.sha256(image_data).hexdigest()
+    digest = hashlib.sha256()
+    with open(image_data, "rb") as f:
+        for block in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class OCRCache:
+    """Bounded LRU store of OCR results, one JSON file per entry (blocking I/O)"""
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._size: Optional[int] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(image_data: Union[bytes, str], engine: str) -> str:
+        """
+        Cache key for an image
+
+        Args:
+            image_data: Image bytes or a local file path
+            engine: Description of the OCR configuration (version, language, preprocessing)
+        """
+        return hashlib.sha256(f"{image_digest(image_data)}|{engine}".encode()).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Dict]:
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                result = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.misses += 1
+            return None
+        os.utime(path)  # Mark as recently used for eviction
+        self.hits += 1
+        return result
+
+    def put(self, key: str, result: Dict):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = json.dumps(result).encode()
+
+        # Write to a temp file and rename so readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        previous = path.stat().st_size if path.exists() else 0
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += len(data) - previous
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _scan_size(self) -> int:
+        return sum(path.stat().st_size for path in self.directory.glob("*/*.json"))
+
+    def _evict(self):
+        """Delete least recently used entries until the store is at 90% of its limit"""
+        entries = []
+        for path in self.directory.glob("*/*.json"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+
+        size = sum(entry_size for _, entry_size, _ in entries)
+        target = int(self.max_bytes * 0.9)
+        removed = 0
+        for _, entry_size, path in entries:
+            if size <= target:
+                break
+            path.unlink(missing_ok=True)
+            size -= entry_size
+            removed += 1
+
+        self._size = size
+        logger.info(f"OCR cache evicted {removed} entries ({size} bytes kept)")
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "size_bytes": self._size
+        }
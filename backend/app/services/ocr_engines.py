@@ -0,0 +1,289 @@
+"""
+OCR engines
+
+Every page gets a fast local Tesseract pass. Pages whose mean word
+confidence falls below a threshold are escalated to a heavier engine: Google
+Cloud Vision when GOOGLE_VISION_API_KEY is set, otherwise a slower Tesseract
+configuration (higher DPI, column layout, optionally tessdata_best models).
+Latency and confidence histograms per engine show how often the expensive
+path is taken and whether it pays off.
+"""
+import asyncio
+import base64
+import bisect
+import io
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Optional, Union
+
+import httpx
+import pytesseract
+
+from config import settings
+from app.services.image_preprocessing import PIPELINE_VERSION, load_grayscale, preprocess
+
+logger = logging.getLogger(__name__)
+
+VISION_URL = "https://vision.googleapis.com/v1/images:annotate"
+LATENCY_BUCKETS_MS = (100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+CONFIDENCE_BUCKETS = (10, 20, 30, 40, 50, 60, 70, 80, 90, 100)
+
+
+def _text_from_data(data: Dict) -> str:
+    """Rebuild page text from image_to_data words (lines and paragraphs kept)"""
+    lines = []
+    current_line = current_paragraph = None
+    for i, word in enumerate(data["text"]):
+        word = word.strip()
+        if not word:
+            continue
+        paragraph = (data["block_num"][i], data["par_num"][i])
+        line = paragraph + (data["line_num"][i],)
+        if line != current_line:
+            if current_paragraph is not None and paragraph != current_paragraph:
+                lines.append("")
+            lines.append(word)
+            current_line, current_paragraph = line, paragraph
+        else:
+            lines[-1] += " " + word
+    return "\n".join(lines)
+
+
+def run_tesseract(
+    image_data: Union[bytes, str],
+    lang: str = "eng",
+    timeout: int = 0,
+    preprocess_image: bool = True,
+    target_dpi: int = 300,
+    psm: Optional[int] = None,
+    tessdata_dir: Optional[str] = None,
+    max_pixels: Optional[int] = None
+) -> Dict:
+    """
+    OCR one image in a single Tesseract pass (runs in a worker process)
+
+    Args:
+        image_data: Image bytes, or a file path the worker reads itself
+        preprocess_image: Downscale, deskew, binarize and crop before OCR
+        target_dpi: Resolution the page is normalized to
+        psm: Tesseract page segmentation mode (default: automatic)
+        tessdata_dir: Directory with alternative models (e.g. tessdata_best)
+        max_pixels: Refuse larger images before decoding them
+
+    Returns:
+        Dictionary with extracted text, mean word confidence, word count and
+        per-stage timings in ms
+    """
+    timings = {}
+    # Grayscale, JPEGs reduced in the decoder when they will be downscaled anyway
+    image = load_grayscale(
+        image_data if isinstance(image_data, str) else io.BytesIO(image_data),
+        target_dpi if preprocess_image else None,
+        max_pixels
+    )
+
+    if preprocess_image:
+        image, timings = preprocess(image, target_dpi)
+
+    config = f"--dpi {target_dpi}"
+    if psm is not None:
+        config += f" --psm {psm}"
+    if tessdata_dir:
+        config += f' --tessdata-dir "{tessdata_dir}"'
+
+    start = time.perf_counter()
+    data = pytesseract.image_to_data(
+        image,
+        lang=lang,
+        config=config,
+        output_type=pytesseract.Output.DICT,
+        timeout=timeout
+    )
+    text = _text_from_data(data)
+    timings["ocr"] = round((time.perf_counter() - start) * 1000, 1)
+
+    confidences = [float(conf) for conf in data['conf'] if float(conf) > 0]
+    avg_confidence = sum(confidences) / len(confidences) if confidences else 0
+
+    return {
+        "extracted_text": text.strip(),
+        "confidence": avg_confidence,
+        "word_count": len(text.split()),
+        "timings_ms": timings,
+        "success": True
+    }
+
+
+class OCREngine:
+    """One way of recognizing a page image"""
+
+    name = "base"
+
+    def signature(self) -> str:
+        """Configuration that determines the output (part of OCR cache keys)"""
+        raise NotImplementedError
+
+    async def recognize(self, image_data: Union[bytes, str]) -> Dict:
+        """
+        Recognize one page
+
+        Args:
+            image_data: Image bytes or a local file path
+
+        Returns:
+            Dictionary with extracted_text, confidence (0-100), word_count,
+            timings_ms and success
+        """
+        raise NotImplementedError
+
+
+class TesseractEngine(OCREngine):
+    """Tesseract in the OCR worker pool"""
+
+    def __init__(
+        self,
+        name: str,
+        runner: Callable[..., Awaitable[Dict]],
+        lang: str = "eng",
+        timeout: int = 30,
+        preprocess_image: bool = True,
+        target_dpi: int = 300,
+        psm: Optional[int] = None,
+        tessdata_dir: Optional[str] = None
+    ):
+        """
+        Args:
+            runner: Runs a CPU-bound function in the worker pool (OCRService._run)
+        """
+        self.name = name
+        self.runner = runner
+        self.lang = lang
+        self.timeout = timeout
+        self.preprocess_image = preprocess_image
+        self.target_dpi = target_dpi
+        self.psm = psm
+        self.tessdata_dir = tessdata_dir
+        self._version: Optional[str] = None
+
+    def signature(self) -> str:
+        if self._version is None:
+            try:
+                self._version = str(pytesseract.get_tesseract_version())
+            except Exception:
+                self._version = "unknown"
+        preprocessing = f"v{PIPELINE_VERSION}" if self.preprocess_image else "off"
+        models = Path(self.tessdata_dir).name if self.tessdata_dir else "default"
+        return (
+            f"tesseract={self._version}|lang={self.lang}|preprocess={preprocessing}"
+            f"|dpi={self.target_dpi}|psm={self.psm or 'auto'}|models={models}"
+        )
+
+    async def recognize(self, image_data: Union[bytes, str]) -> Dict:
+        return await self.runner(
+            run_tesseract, image_data, self.lang, self.timeout,
+            self.preprocess_image, self.target_dpi, self.psm, self.tessdata_dir, settings.OCR_MAX_PIXELS
+        )
+
+
+class GoogleVisionEngine(OCREngine):
+    """Google Cloud Vision document text detection (handwriting capable)"""
+
+    name = "google_vision"
+
+    def __init__(self, api_key: str, timeout: int = 30):
+        self.api_key = api_key
+        self.timeout = timeout
+
+    def signature(self) -> str:
+        return "google_vision=document_text_detection"
+
+    async def recognize(self, image_data: Union[bytes, str]) -> Dict:
+        if isinstance(image_data, str):
+            image_data = await asyncio.to_thread(Path(image_data).read_bytes)
+
+        start = time.perf_counter()
+        async with httpx.AsyncClient(timeout=self.timeout) as client:
+            response = await client.post(
+                VISION_URL,
+                params={"key": self.api_key},
+                json={"requests": [{
+                    "image": {"content": base64.b64encode(image_data).decode()},
+                    "features": [{"type": "DOCUMENT_TEXT_DETECTION"}]
+                }]}
+            )
+        response.raise_for_status()
+        result = response.json()["responses"][0]
+        if "error" in result:
+            raise RuntimeError(f"Vision API error: {result['error'].get('message')}")
+
+        annotation = result.get("fullTextAnnotation") or {}
+        text = annotation.get("text", "").strip()
+        pages = annotation.get("pages") or []
+        confidence = sum(page.get("confidence", 0.0) for page in pages) / len(pages) * 100 if pages else 0.0
+
+        return {
+            "extracted_text": text,
+            "confidence": confidence,
+            "word_count": len(text.split()),
+            "timings_ms": {"ocr": round((time.perf_counter() - start) * 1000, 1)},
+            "success": True
+        }
+
+
+class OCRMetrics:
+    """Per-engine latency and confidence histograms plus escalation counts"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._engines: Dict[str, Dict] = {}
+        self._escalations = {"pages": 0, "escalated": 0, "improved": 0}
+
+    def record(self, engine: str, latency_ms: float, confidence: Optional[float]):
+        """Record one engine call (confidence None when it failed)"""
+        with self._lock:
+            stats = self._engines.setdefault(engine, {
+                "calls": 0,
+                "failures": 0,
+                "latency_ms": [0] * (len(LATENCY_BUCKETS_MS) + 1),
+                "confidence": [0] * len(CONFIDENCE_BUCKETS)
+            })
+            stats["calls"] += 1
+            stats["latency_ms"][bisect.bisect_left(LATENCY_BUCKETS_MS, latency_ms)] += 1
+            if confidence is None:
+                stats["failures"] += 1
+            else:
+                index = min(bisect.bisect_right(CONFIDENCE_BUCKETS, confidence), len(CONFIDENCE_BUCKETS) - 1)
+                stats["confidence"][index] += 1
+
+    def record_page(self, escalated: bool, improved: bool = False):
+        """Record whether a page needed the heavy engine and whether it helped"""
+        with self._lock:
+            self._escalations["pages"] += 1
+            self._escalations["escalated"] += 1 if escalated else 0
+            self._escalations["improved"] += 1 if improved else 0
+
+    def snapshot(self) -> Dict:
+        """Histograms as {upper bound: count}, with the escalation rate"""
+        latency_labels = [f"<={bound}" for bound in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}"]
+        confidence_labels = [f"<{bound}" for bound in CONFIDENCE_BUCKETS[:-1]] + [f">={CONFIDENCE_BUCKETS[-2]}"]
+        with self._lock:
+            pages = self._escalations["pages"]
+            return {
+                "engines": {
+                    engine: {
+                        "calls": stats["calls"],
+                        "failures": stats["failures"],
+                        "latency_ms": dict(zip(latency_labels, stats["latency_ms"])),
+                        "confidence": dict(zip(confidence_labels, stats["confidence"]))
+                    }
+                    for engine, stats in self._engines.items()
+                },
+                **self._escalations,
+                "escalation_rate": round(self._escalations["escalated"] / pages, 3) if pages else 0.0
+            }
+
+
+# Global OCR metrics instance
+ocr_metrics = OCRMetrics()
@@ -1,61 +1,239 @@
 """
 OCR Service for processing handwritten answers
+
+Tesseract is CPU-bound, so it runs in a process pool sized to the cores
+instead of on the event loop. Each image gets a single `image_to_data` pass
+from which both the text and the word confidences are derived; pages with
+low confidence are escalated to a heavier engine (see ocr_engines).
 """
+import asyncio
 import logging
-from typing import Dict
-from PIL import Image
-import pytesseract
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+from PyPDF2 import PdfReader
 import io
 import base64
 
+from config import settings
+from app.services.ocr_cache import OCRCache
+from app.services.ocr_engines import GoogleVisionEngine, OCREngine, TesseractEngine, ocr_metrics
+from app.services.storage_service import storage_service
+
 logger = logging.getLogger(__name__)
 
 
+class OCRBusyError(Exception):
+    """Raised when the OCR queue is full"""
+
+
+def split_pdf(pdf_data: Union[bytes, str]) -> List[Optional[bytes]]:
+    """
+    Page images of a scanned PDF (given as bytes or a file path)
+    
+    Returns:
+        The largest embedded image of each page (None for pages without one)
+    """
+    pages = []
+    for page in PdfReader(pdf_data if isinstance(pdf_data, str) else io.BytesIO(pdf_data)).pages:
+        images = list(page.images)
+        pages.append(max(images, key=lambda image: len(image.data)).data if images else None)
+    return pages
+
+
+def _decode_base64(base64_image: str) -> bytes:
+    # Remove data:image prefix if present
+    if ',' in base64_image:
+        base64_image = base64_image.split(',')[1]
+    return base64.b64decode(base64_image)
+
+
 class OCRService:
     """Service for extracting text from images"""
     
-    async def extract_text(self, image_data: bytes) -> Dict:
+    def __init__(self):
+        self.workers = settings.OCR_WORKERS or os.cpu_count() or 1
+        self.max_pending = settings.OCR_MAX_PENDING
+        self.timeout = settings.OCR_TIMEOUT_SECONDS
+        self.queue_timeout = settings.OCR_QUEUE_TIMEOUT_SECONDS
+        self.preprocess = settings.OCR_PREPROCESS
+        self.target_dpi = settings.OCR_TARGET_DPI
+        self.lang = "eng"
+        self.escalation_threshold = settings.OCR_ESCALATION_THRESHOLD
+        self.engine = TesseractEngine(
+            "tesseract", self._run, self.lang, self.timeout, self.preprocess, self.target_dpi
+        )
+        self.heavy_engine = self._heavy_engine(settings.OCR_ESCALATION_ENGINE)
+        self.cache = None
+        if settings.OCR_CACHE_ENABLED:
+            self.cache = OCRCache(settings.OCR_CACHE_DIR, settings.OCR_CACHE_MAX_MB << 20)
+        self._signature: Optional[str] = None
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending = 0
+    
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            logger.info(f"OCR pool started with {self.workers} workers")
+        return self._executor
+    
+    def shutdown(self):
+        """Stop the worker processes"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+    
+    def check_capacity(self, pages: int = 1):
         """
-        Extract text from image using Tesseract OCR
+        Raises:
+            OCRBusyError: Queuing `pages` more images would exceed the limit
+        """
+        if self._pending + pages > self.max_pending:
+            raise OCRBusyError(f"OCR queue full ({self._pending} pending)")
+    
+    async def _run(self, func, *args):
+        """
+        Run a CPU-bound OCR function in the pool with admission control
+        
+        Raises:
+            OCRBusyError: Too many images already queued
+            asyncio.TimeoutError: Queued + run time exceeded the limit
+        """
+        self.check_capacity()
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            try:
+                future = loop.run_in_executor(self._pool(), func, *args)
+            except BrokenProcessPool:
+                # A worker died (e.g. OOM on a huge image); start a fresh pool
+                self._executor = None
+                future = loop.run_in_executor(self._pool(), func, *args)
+            return await asyncio.wait_for(future, timeout=self.queue_timeout)
+        finally:
+            self._pending -= 1
+    
+    def _heavy_engine(self, choice: str) -> Optional[OCREngine]:
+        """
+        Engine for low-confidence pages
         
         Args:
-            image_data: Image bytes
-            
+            choice: "auto" (Google Vision if an API key is set, else the slow
+                Tesseract config), "google_vision", "tesseract_best" or "none"
+        """
+        if choice == "none":
+            return None
+        if choice == "google_vision" or (choice == "auto" and settings.GOOGLE_VISION_API_KEY):
+            if settings.GOOGLE_VISION_API_KEY:
+                return GoogleVisionEngine(settings.GOOGLE_VISION_API_KEY, self.timeout)
+            logger.warning("GOOGLE_VISION_API_KEY not set, escalating to Tesseract instead")
+        
+        # Local stand-in: more pixels, single-column layout, optionally tessdata_best models
+        return TesseractEngine(
+            "tesseract_best", self._run, self.lang, self.timeout * 2, self.preprocess,
+            settings.OCR_HEAVY_DPI, psm=4, tessdata_dir=settings.OCR_HEAVY_TESSDATA_DIR
+        )
+    
+    def engine_signature(self) -> str:
+        """Everything besides the image that determines OCR output (part of the cache key)"""
+        if self._signature is None:
+            self._signature = self.engine.signature()
+            if self.heavy_engine is not None:
+                self._signature += f"|escalate<{self.escalation_threshold}:{self.heavy_engine.signature()}"
+        return self._signature
+    
+    async def _recognize(self, engine: OCREngine, image_data: Union[bytes, str]) -> Dict:
+        """Run one engine, recording its latency and confidence"""
+        start = time.perf_counter()
+        try:
+            result = await engine.recognize(image_data)
+        except OCRBusyError:
+            raise
+        except Exception:
+            ocr_metrics.record(engine.name, (time.perf_counter() - start) * 1000, None)
+            raise
+        ocr_metrics.record(engine.name, (time.perf_counter() - start) * 1000, result["confidence"])
+        result["engine"] = engine.name
+        return result
+    
+    async def _recognize_page(self, image_data: Union[bytes, str]) -> Tuple[Dict, bool]:
+        """
+        Fast pass, then the heavy engine only if confidence is below the threshold
+        
+        Returns:
+            (result, cacheable); a result is not cacheable when the heavy
+            engine failed, so the page is escalated again next time instead
+            of the low-confidence fallback being served from the cache
+        """
+        result = await self._recognize(self.engine, image_data)
+        if self.heavy_engine is None or result["confidence"] >= self.escalation_threshold:
+            ocr_metrics.record_page(escalated=False)
+            return result, True
+        
+        try:
+            heavy = await self._recognize(self.heavy_engine, image_data)
+        except Exception as e:
+            logger.warning(f"OCR escalation to {self.heavy_engine.name} failed: {e!r}")
+            ocr_metrics.record_page(escalated=True)
+            return {**result, "escalated": True, "escalation_failed": True}, False
+        
+        improved = heavy["confidence"] > result["confidence"]
+        ocr_metrics.record_page(escalated=True, improved=improved)
+        logger.info(
+            f"OCR escalated to {heavy['engine']}: confidence {result['confidence']:.1f} -> {heavy['confidence']:.1f}"
+        )
+        best = heavy if improved else result
+        return {**best, "escalated": True}, True
+    
+    async def _cached(self, image_data: Union[bytes, str]):
+        """(cache key, cached result or None); key is None when caching is off or fails"""
+        if self.cache is None:
+            return None, None
+        try:
+            key = await asyncio.to_thread(self.cache.key, image_data, self.engine_signature())
+            return key, await asyncio.to_thread(self.cache.get, key)
+        except Exception as e:
+            logger.warning(f"OCR cache lookup failed: {e}")
+            return None, None
+    
+    async def extract_text(self, image_data: Union[bytes, str]) -> Dict:
+        """
+        Extract text from image (Tesseract, escalated for low confidence)
+        
+        Args:
+            image_data: Image bytes or a local file path
+        
         Returns:
             Dictionary with extracted text and confidence
         """
+        cache_key, cached = await self._cached(image_data)
+        if cached is not None:
+            logger.info(f"OCR cache hit ({len(cached['extracted_text'])} characters)")
+            return {**cached, "cached": True}
+        
         try:
-            # Open image
-            image = Image.open(io.BytesIO(image_data))
-            
-            # Preprocess image (convert to grayscale, enhance)
-            image = image.convert('L')  # Convert to grayscale
-            
-            # Extract text with confidence
-            text = pytesseract.image_to_string(image, lang='eng')
-            
-            # Get detailed data with confidence scores
-            data = pytesseract.image_to_data(image, output_type=pytesseract.Output.DICT)
-            
-            # Calculate average confidence
-            confidences = [int(conf) for conf in data['conf'] if int(conf) > 0]
-            avg_confidence = sum(confidences) / len(confidences) if confidences else 0
-            
-            logger.info(f"OCR extracted {len(text)} characters with {avg_confidence:.2f}% confidence")
-            
-            return {
-                "extracted_text": text.strip(),
-                "confidence": avg_confidence,
-                "word_count": len(text.split()),
-                "success": True
-            }
+            result, cacheable = await self._recognize_page(image_data)
             
+            logger.info(
+                f"OCR extracted {len(result['extracted_text'])} characters "
+                f"with {result['confidence']:.2f}% confidence (timings ms: {result['timings_ms']})"
+            )
+            if cache_key is not None and cacheable:
+                try:
+                    await asyncio.to_thread(self.cache.put, cache_key, result)
+                except Exception as e:
+                    logger.warning(f"OCR cache write failed: {e}")
+            return result
+        
         except Exception as e:
-            logger.error(f"OCR extraction failed: {e}")
+            logger.error(f"OCR extraction failed: {e!r}")
             return {
                 "extracted_text": "",
                 "confidence": 0.0,
-                "error": str(e),
+                "error": str(e) or type(e).__name__,
+                "busy": isinstance(e, OCRBusyError),
                 "success": False
             }
     
@@ -65,20 +243,14 @@ class OCRService:
         
         Args:
             base64_image: Base64 encoded image string
-            
+        
         Returns:
             Dictionary with extracted text and confidence
         """
         try:
-            # Remove data:image prefix if present
-            if ',' in base64_image:
-                base64_image = base64_image.split(',')[1]
-            
-            # Decode base64
-            image_data = base64.b64decode(base64_image)
-            
+            image_data = _decode_base64(base64_image)
             return await self.extract_text(image_data)
-            
+        
         except Exception as e:
             logger.error(f"Failed to decode base64 image: {e}")
             return {
@@ -88,7 +260,109 @@ class OCRService:
                 "success": False
             }
 
+    
+    async def extract_pages(
+        self,
+        pages: List,
+        load: Optional[Callable[[str], Awaitable[Union[bytes, str]]]] = None
+    ) -> AsyncIterator[Dict]:
+        """
+        OCR the pages of one answer in parallel, yielding results as they finish
+        
+        Args:
+            pages: Image bytes per page, in page order (None marks a page with no image)
+            load: Optional async loader turning each page entry (e.g. a storage
+                key) into image bytes or a path, called just before that page's OCR
+        
+        Yields:
+            Per-page result dicts (as from extract_text) with a 1-based "page"
+        
+        Raises:
+            OCRBusyError: Not enough queue capacity for all pages
+        """
+        self.check_capacity(sum(1 for page in pages if page))
+        
+        async def run_page(number: int, image_data) -> Dict:
+            if image_data and load:
+                try:
+                    image_data = await load(image_data)
+                except Exception as e:
+                    logger.error(f"Failed to load page {number}: {e}")
+                    return {"extracted_text": "", "confidence": 0.0, "error": str(e), "success": False, "page": number}
+            if image_data:
+                result = await self.extract_text(image_data)
+            else:
+                result = {"extracted_text": "", "confidence": 0.0, "error": "No image on page", "success": False}
+            result["page"] = number
+            return result
+        
+        tasks = [asyncio.ensure_future(run_page(number, data)) for number, data in enumerate(pages, 1)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    @staticmethod
+    def combine_pages(results: List[Dict]) -> Dict:
+        """
+        Reassemble per-page results in page order
+        
+        Returns:
+            Dictionary with the joined text, word-weighted confidence and pages
+        """
+        pages = sorted(results, key=lambda result: result["page"])
+        succeeded = [page for page in pages if page.get("success")]
+        words = sum(page.get("word_count", 0) for page in succeeded)
+        confidence = (
+            sum(page["confidence"] * page.get("word_count", 0) for page in succeeded) / words if words else 0.0
+        )
+        
+        return {
+            "extracted_text": "\n\n".join(page["extracted_text"] for page in pages if page["extracted_text"]),
+            "confidence": confidence,
+            "word_count": words,
+            "pages": pages,
+            "error": None if succeeded else next((page.get("error") for page in pages if page.get("error")), None),
+            "success": bool(succeeded)
+        }
+    
+    async def extract_document(self, pages: List, load=None) -> Dict:
+        """OCR a multi-page answer and return the combined result (see extract_pages)"""
+        try:
+            results = [result async for result in self.extract_pages(pages, load)]
+        except OCRBusyError as e:
+            return {"extracted_text": "", "confidence": 0.0, "error": str(e), "busy": True, "success": False}
+        return self.combine_pages(results)
+    
+    async def extract_from_base64_pages(self, base64_images: List[str]) -> Dict:
+        """OCR a multi-page answer given as base64 encoded page images"""
+        try:
+            pages = [_decode_base64(image) for image in base64_images]
+        except Exception as e:
+            logger.error(f"Failed to decode base64 image: {e}")
+            return {"extracted_text": "", "confidence": 0.0, "error": str(e), "success": False}
+        return await self.extract_document(pages)
+
+    
+    @staticmethod
+    async def _load_stored(key: str) -> Union[bytes, str]:
+        # Local files are opened by the worker process; remote objects are downloaded
+        return storage_service.local_path(key) or await storage_service.read(key)
+    
+    async def extract_from_keys(self, keys: List[str]) -> Dict:
+        """
+        OCR a stored handwritten answer
+        
+        Args:
+            keys: Storage keys of the answer's page images, in page order
+        
+        Returns:
+            Combined result as from extract_document
+        """
+        return await self.extract_document(keys, load=self._load_stored)
+
 
 # Global OCR service instance
 ocr_service = OCRService()
-
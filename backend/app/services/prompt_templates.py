@@ -0,0 +1,236 @@
+"""
+Prompt templates with a prefix-stable layout
+
+Providers cache prompt prefixes, so every template is rendered in the same
+order: static system message, static instructions + JSON schema, shared
+per-topic context, and finally the per-item content (question, answer, counts).
+Only the tail changes between calls for the same template and topic.
+"""
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Dict, List
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class PromptTemplate:
+    """A chat prompt split into static and variable segments"""
+    name: str
+    system: str
+    instructions: str
+
+    def render(self, shared_context: str = "", item: str = "") -> List[Dict]:
+        """
+        Render chat messages with static segments first
+
+        Args:
+            shared_context: Content shared by many calls (e.g. NCERT context for a topic)
+            item: Per-call content (question, answer, counts)
+
+        Returns:
+            List of chat messages
+        """
+        parts = [self.instructions]
+        if shared_context:
+            parts.append(shared_context)
+        if item:
+            parts.append(item)
+
+        return [
+            {"role": "system", "content": self.system},
+            {"role": "user", "content": "\n\n".join(parts)}
+        ]
+
+
+class PromptCacheStats:
+    """Prefix-cache hit rates per template, from provider usage fields"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def record(self, template: str, usage) -> None:
+        """Record prompt and cached tokens reported by the provider"""
+        if usage is None:
+            return
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = (getattr(details, "cached_tokens", 0) or 0) if details is not None else 0
+
+        with self._lock:
+            stats = self._stats.setdefault(
+                template, {"calls": 0, "cache_hits": 0, "prompt_tokens": 0, "cached_tokens": 0}
+            )
+            stats["calls"] += 1
+            stats["cache_hits"] += 1 if cached_tokens else 0
+            stats["prompt_tokens"] += prompt_tokens
+            stats["cached_tokens"] += cached_tokens
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """Per-template hit rate (calls with any cached tokens) and cached token share"""
+        with self._lock:
+            return {
+                template: {
+                    **stats,
+                    "hit_rate": round(stats["cache_hits"] / stats["calls"], 3) if stats["calls"] else 0.0,
+                    "cached_token_ratio": round(stats["cached_tokens"] / stats["prompt_tokens"], 3)
+                    if stats["prompt_tokens"] else 0.0
+                }
+                for template, stats in self._stats.items()
+            }
+
+
+EXAMINER_SYSTEM = (
+    "You are an expert UPSC examiner. Provide detailed, accurate, and constructive "
+    "feedback. Always respond with valid JSON."
+)
+
+GENERATOR_SYSTEM = "You are a UPSC exam question generator. Always respond with valid JSON only."
+
+
+EVALUATION_TEMPLATE = PromptTemplate(
+    name="evaluation",
+    system=EXAMINER_SYSTEM,
+    instructions="""You are an expert UPSC examiner. Evaluate the student answer given at the end of this message.
+
+Evaluate the answer based on:
+1. Structure and organization
+2. Factual accuracy (compare with context)
+3. Relevance to the question
+4. Depth of understanding
+5. Use of examples and evidence
+
+Provide response in JSON format:
+{
+  "score": <float between 0 and the maximum marks>,
+  "strengths": ["strength1", "strength2", "strength3"],
+  "weaknesses": ["weakness1", "weakness2", "weakness3"],
+  "concept_gaps": [
+    {
+      "concept": "concept name",
+      "severity": "high|medium|low",
+      "description": "brief description"
+    }
+  ],
+  "feedback": "detailed constructive feedback in 3-4 sentences",
+  "skill_scores": {
+    "factual_recall": <0-100>,
+    "analysis": <0-100>,
+    "critical_thinking": <0-100>,
+    "structure": <0-100>,
+    "relevance": <0-100>
+  }
+}"""
+)
+
+
+GAP_ANALYSIS_TEMPLATE = PromptTemplate(
+    name="gap_analysis",
+    system=EXAMINER_SYSTEM,
+    instructions="""Analyze the student's overall performance using the performance data at the end of this message.
+
+Identify:
+1. Top 3-5 primary conceptual gaps
+2. Specific NCERT chapter references to address gaps
+
+Previous year questions are looked up separately; do not suggest any.
+
+Provide response in JSON format:
+{
+  "primary_gaps": [
+    {
+      "concept": "concept name",
+      "severity": "high|medium|low",
+      "description": "what the student is missing"
+    }
+  ],
+  "ncert_recommendations": [
+    {
+      "title": "NCERT Book Title",
+      "chapter": "Chapter name",
+      "pages": "page range",
+      "priority": "high|medium|low",
+      "reason": "why this is recommended"
+    }
+  ],
+  "overall_assessment": "2-3 sentence summary of performance"
+}"""
+)
+
+
+MCQ_TEMPLATE = PromptTemplate(
+    name="mcq_generation",
+    system=GENERATOR_SYSTEM,
+    instructions="""You are an expert UPSC exam question paper setter. Generate multiple-choice questions (MCQs) based on the NCERT content below, following the request at the end of this message.
+
+Requirements:
+1. Questions should be UPSC-style (factual, analytical, application-based)
+2. Each question should have 4 options (A, B, C, D)
+3. Only one correct answer
+4. Match the requested difficulty level:
+   - Easy: Direct recall, basic concepts
+   - Medium: Understanding, application of concepts
+   - Hard: Analysis, evaluation, synthesis
+5. Questions should be based strictly on the provided NCERT content
+
+Return ONLY a valid JSON array with this exact format:
+[
+  {
+    "question": "Question text here?",
+    "options": {"A": "Option A", "B": "Option B", "C": "Option C", "D": "Option D"},
+    "correct_answer": "A",
+    "source": "Brief reference to NCERT content"
+  }
+]"""
+)
+
+
+SUBJECTIVE_TEMPLATE = PromptTemplate(
+    name="subjective_generation",
+    system=GENERATOR_SYSTEM,
+    instructions="""You are an expert UPSC exam question paper setter. Generate subjective (descriptive/essay-type) questions based on the NCERT content below, following the request at the end of this message.
+
+Requirements:
+1. Questions should be UPSC Mains-style (analytical, evaluative, comprehensive)
+2. Each question should require detailed written answers
+3. Include marks allocation (5, 10, or 15 marks based on depth required)
+4. Include evaluation rubric for each question
+5. Match the requested difficulty level:
+   - Easy: Explain, describe (5-10 marks)
+   - Medium: Analyze, compare (10-15 marks)
+   - Hard: Critically evaluate, synthesize (15+ marks)
+6. Questions should be based strictly on the provided NCERT content
+
+Return ONLY a valid JSON array with this exact format:
+[
+  {
+    "question": "Question text here",
+    "marks": 10,
+    "rubric": "Evaluation criteria: structure, accuracy, depth, examples",
+    "source": "Brief reference to NCERT content"
+  }
+]"""
+)
+
+
+CONCEPT_EXTRACTION_TEMPLATE = PromptTemplate(
+    name="concept_extraction",
+    system=GENERATOR_SYSTEM,
+    instructions="""List the key concepts covered in the NCERT excerpt for concept indexing at the end of this message.
+
+Requirements:
+1. 5-15 concepts, each a short noun phrase a student would search for (e.g. "Mughal revenue system")
+2. Only concepts explained in the excerpt, not ones merely mentioned
+3. No duplicates or near-duplicates
+
+Provide response in JSON format:
+{
+  "concepts": ["concept 1", "concept 2"]
+}"""
+)
+
+
+# Global prompt cache statistics
+prompt_cache_stats = PromptCacheStats()
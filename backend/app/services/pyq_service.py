@@ -0,0 +1,197 @@
+"""
+PYQ Service
+Ingests UPSC previous year questions into a structured, embedded table and
+recommends the ones closest to a student's concept gaps.
+
+Ingest JSON Lines or CSV files with the columns year, paper, question and
+subject (optional: exam, question_number, marks, topic):
+    python -m app.services.pyq_service data/pyq/gs1.jsonl data/pyq/gs2.csv
+"""
+import asyncio
+import csv
+import hashlib
+import json
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from llama_index.core import Settings
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from config import settings
+from app.models import PreviousYearQuestion
+from app.services.rag_service import rag_service  # noqa: F401  (configures Settings.embed_model)
+
+logger = logging.getLogger(__name__)
+
+EMBED_BATCH_SIZE = 100
+
+
+def _load_records(path: Path) -> List[Dict]:
+    if path.suffix == ".csv":
+        with open(path, newline="", encoding="utf-8") as f:
+            return list(csv.DictReader(f))
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _row(record: Dict) -> Optional[Dict]:
+    """Validate and normalize one input record (None if unusable)"""
+    try:
+        question_text = " ".join(str(record["question"]).split())
+        row = {
+            "exam": record.get("exam") or "UPSC CSE Mains",
+            "year": int(record["year"]),
+            "paper": str(record["paper"]).strip(),
+            "question_number": str(record.get("question_number") or "").strip() or None,
+            "question_text": question_text,
+            "marks": int(record["marks"]) if record.get("marks") else None,
+            "subject": str(record["subject"]).strip().lower(),
+            "topic": str(record.get("topic") or "").strip() or None
+        }
+    except (KeyError, TypeError, ValueError):
+        return None
+    if not question_text:
+        return None
+
+    identity = f"{row['exam']}|{row['year']}|{row['paper']}|{question_text.lower()}"
+    row["content_hash"] = hashlib.sha256(identity.encode()).hexdigest()
+    return row
+
+
+class PYQService:
+    """Ingestion and similarity search over previous year questions"""
+
+    def __init__(self):
+        self.max_distance = settings.PYQ_MAX_DISTANCE
+
+    async def ingest(self, db: Session, paths: List[Path]) -> Dict[str, int]:
+        """
+        Load PYQ files, embed new questions and insert them
+
+        Questions already ingested (same exam, year, paper and text) are skipped.
+
+        Returns:
+            Counts of inserted, duplicate and invalid records
+        """
+        rows, invalid = [], 0
+        for path in paths:
+            for record in _load_records(path):
+                row = _row(record)
+                if row is None:
+                    invalid += 1
+                else:
+                    rows.append(row)
+
+        existing = {
+            content_hash for (content_hash,) in db.query(PreviousYearQuestion.content_hash).filter(
+                PreviousYearQuestion.content_hash.in_([row["content_hash"] for row in rows])
+            )
+        } if rows else set()
+        new_rows = list({row["content_hash"]: row for row in rows if row["content_hash"] not in existing}.values())
+
+        inserted = 0
+        for start in range(0, len(new_rows), EMBED_BATCH_SIZE):
+            batch = new_rows[start:start + EMBED_BATCH_SIZE]
+            embeddings = await asyncio.to_thread(
+                Settings.embed_model.get_text_embedding_batch,
+                [f"{row['topic'] or row['subject']}: {row['question_text']}" for row in batch]
+            )
+            for row, embedding in zip(batch, embeddings):
+                row["embedding"] = embedding
+
+            result = db.execute(
+                insert(PreviousYearQuestion).values(batch).on_conflict_do_nothing(index_elements=["content_hash"])
+            )
+            db.commit()
+            inserted += result.rowcount
+
+        logger.info(f"Ingested {inserted} PYQs ({len(rows) - inserted} duplicates, {invalid} invalid)")
+        return {"inserted": inserted, "duplicates": len(rows) - inserted, "invalid": invalid}
+
+    async def recommend(
+        self,
+        db: Session,
+        concept_gaps: List[str],
+        subject: str,
+        per_concept: int = 2,
+        limit: int = 5
+    ) -> List[Dict]:
+        """
+        Previous year questions closest to the given concept gaps
+
+        All concepts are embedded in one call; each is matched with an
+        HNSW-indexed cosine search filtered by subject.
+
+        Returns:
+            Dicts with concept, year, paper, question_number, question, marks, topic
+        """
+        if not concept_gaps:
+            return []
+
+        try:
+            embeddings = await asyncio.to_thread(
+                Settings.embed_model.get_text_embedding_batch,
+                [f"{subject}: {concept}" for concept in concept_gaps]
+            )
+        except Exception as e:
+            logger.error(f"PYQ lookup embedding failed: {e}")
+            return []
+
+        matches = []
+        try:
+            # Savepoint: a failed lookup (e.g. table not migrated yet) must not
+            # abort the caller's transaction
+            with db.begin_nested():
+                for concept, embedding in zip(concept_gaps, embeddings):
+                    distance = PreviousYearQuestion.embedding.cosine_distance(embedding)
+                    rows = (
+                        db.query(PreviousYearQuestion)
+                        .filter(PreviousYearQuestion.subject == subject.lower(), distance <= self.max_distance)
+                        .order_by(distance)
+                        .limit(per_concept)
+                        .all()
+                    )
+                    matches.extend((concept, pyq) for pyq in rows)
+        except SQLAlchemyError as e:
+            logger.error(f"PYQ lookup failed: {e}")
+            return []
+
+        recommendations, seen = [], set()
+        for concept, pyq in matches:
+            if pyq.id in seen:
+                continue
+            seen.add(pyq.id)
+            recommendations.append({
+                "concept": concept,
+                "year": pyq.year,
+                "paper": pyq.paper,
+                "question_number": pyq.question_number,
+                "question": pyq.question_text,
+                "marks": pyq.marks,
+                "topic": pyq.topic
+            })
+
+        return recommendations[:limit]
+
+
+# Global PYQ service instance
+pyq_service = PYQService()
+
+
+if __name__ == "__main__":
+    import argparse
+    from app.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Ingest previous year questions")
+    parser.add_argument("files", nargs="+", type=Path, help="JSON Lines or CSV files")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        result = asyncio.run(pyq_service.ingest(db, args.files))
+        print(f"{result['inserted']} inserted, {result['duplicates']} duplicates, {result['invalid']} invalid")
+    finally:
+        db.close()
@@ -0,0 +1,386 @@
+"""
+Question Bank Service
+Tracks demand and inventory per (subject, topic, difficulty) pool and keeps
+pools above a low-water mark by generating questions in the background, so
+assessment creation is a database read in the common case.
+"""
+import asyncio
+import logging
+import random
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+from uuid import UUID
+
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from config import settings
+from app.database import SessionLocal
+from app.models import Assessment, AssessmentQuestion, Question, QuestionPool, QuestionType
+from app.services.question_generation_service import question_generator
+
+logger = logging.getLogger(__name__)
+
+PoolKey = Tuple[str, str, str]  # (subject, topic, difficulty)
+
+
+class QuestionBankService:
+    """Serves assessments from pre-generated pools and replenishes them in the background"""
+
+    def __init__(self):
+        self.low_water = {
+            QuestionType.MCQ.value: settings.QUESTION_POOL_LOW_WATER_MCQ,
+            QuestionType.SUBJECTIVE.value: settings.QUESTION_POOL_LOW_WATER_SUBJECTIVE,
+        }
+        self.batch_size = {
+            QuestionType.MCQ.value: settings.QUESTION_POOL_BATCH_MCQ,
+            QuestionType.SUBJECTIVE.value: settings.QUESTION_POOL_BATCH_SUBJECTIVE,
+        }
+        self.interval = settings.QUESTION_REPLENISH_INTERVAL_SECONDS
+        self.lease = timedelta(seconds=settings.QUESTION_REPLENISH_LEASE_SECONDS)
+        self.max_rounds = settings.QUESTION_REPLENISH_MAX_ROUNDS
+        self._queue: Optional[asyncio.Queue] = None
+        self._queued: Set[PoolKey] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    def inventory(self, db: Session, subject: str, topic: str, difficulty: str) -> Dict[str, int]:
+        """Question counts per type for one pool"""
+        rows = db.query(Question.type, func.count(Question.id)).filter(
+            Question.subject == subject,
+            Question.topic == topic,
+            Question.difficulty == difficulty,
+            Question.duplicate_of.is_(None)
+        ).group_by(Question.type).all()
+        return {question_type: count for question_type, count in rows}
+
+    def record_demand(self, db: Session, subject: str, topic: str, difficulty: str):
+        """Count an assessment request against its pool (committed with the caller's transaction)"""
+        now = datetime.utcnow()
+        stmt = insert(QuestionPool).values(
+            subject=subject,
+            topic=topic,
+            difficulty=difficulty,
+            demand_count=1,
+            last_requested_at=now
+        )
+        stmt = stmt.on_conflict_do_update(
+            constraint="uq_question_pools_key",
+            set_={
+                "demand_count": QuestionPool.demand_count + 1,
+                "last_requested_at": now
+            }
+        )
+        db.execute(stmt)
+
+    def sample_questions(
+        self,
+        db: Session,
+        subject: str,
+        topic: str,
+        difficulty: str,
+        question_type: str,
+        count: int,
+        user_id: Optional[UUID] = None
+    ) -> List[Question]:
+        """
+        Random, exposure-balanced sample from a pool without loading the pool
+
+        Picks a random pivot on Question.random_key and range-scans a small
+        window from there (wrapping around), skipping questions the user has
+        already seen. The least-served questions in the window win, so cost
+        depends on `count`, not on pool size.
+
+        Args:
+            question_type: "mcq" or "subjective"
+            count: Number of questions wanted
+            user_id: Exclude questions from this user's earlier assessments
+
+        Returns:
+            Up to `count` questions
+        """
+        if count <= 0:
+            return []
+
+        window = count * settings.QUESTION_SAMPLE_OVERFETCH
+        base = db.query(Question).filter(
+            Question.subject == subject,
+            Question.topic == topic,
+            Question.difficulty == difficulty,
+            Question.type == question_type,
+            Question.duplicate_of.is_(None)
+        )
+
+        unseen = base
+        if user_id is not None:
+            seen = (
+                select(AssessmentQuestion.id)
+                .join(Assessment, Assessment.id == AssessmentQuestion.assessment_id)
+                .where(AssessmentQuestion.question_id == Question.id, Assessment.user_id == user_id)
+                .exists()
+            )
+            unseen = base.filter(~seen)
+
+        candidates = self._window(unseen, window)
+        if len(candidates) < count and user_id is not None:
+            # User has seen most of the pool: top up with repeats
+            chosen_ids = [question.id for question in candidates]
+            candidates.extend(self._window(base.filter(Question.id.notin_(chosen_ids)), count - len(candidates)))
+
+        # Exposure balancing: least-served first (window order is already random)
+        candidates.sort(key=lambda question: question.times_served or 0)
+        return candidates[:count]
+
+    @staticmethod
+    def _window(query, size: int) -> List[Question]:
+        """Up to `size` rows starting at a random point of the random_key index"""
+        pivot = random.random()
+        rows = query.filter(Question.random_key >= pivot).order_by(Question.random_key).limit(size).all()
+        if len(rows) < size:
+            rows.extend(query.filter(Question.random_key < pivot).order_by(Question.random_key).limit(size - len(rows)).all())
+        return rows
+
+    def mark_served(self, db: Session, questions: List[Question]):
+        """Increment exposure counters in one UPDATE"""
+        if not questions:
+            return
+        db.execute(
+            update(Question)
+            .where(Question.id.in_([question.id for question in questions]))
+            .values(times_served=Question.times_served + 1)
+            .execution_options(synchronize_session=False)
+        )
+
+    def take_from_pool(
+        self,
+        db: Session,
+        subject: str,
+        topic: str,
+        difficulty: str,
+        num_mcq: int,
+        num_subjective: int,
+        user_id: Optional[UUID] = None
+    ) -> Optional[List[Question]]:
+        """
+        Pick questions for an assessment from an existing pool
+
+        Nothing is marked served here: call `mark_served` with the questions
+        actually put in front of the user.
+
+        Returns:
+            MCQs followed by subjective questions, or None if the pool is too small
+        """
+        questions = []
+        for question_type, count in ((QuestionType.MCQ.value, num_mcq), (QuestionType.SUBJECTIVE.value, num_subjective)):
+            sampled = self.sample_questions(db, subject, topic, difficulty, question_type, count, user_id)
+            if len(sampled) < count:
+                return None
+            questions.extend(sampled)
+        return questions
+
+    def request_replenish(self, subject: str, topic: str, difficulty: str):
+        """Ask the background worker to top up a pool soon (no-op if not running)"""
+        key = (subject, topic, difficulty)
+        if self._queue is None or key in self._queued:
+            return
+        self._queued.add(key)
+        self._queue.put_nowait(key)
+
+    def _pools_below_low_water(self, db: Session, limit: int = 10) -> List[PoolKey]:
+        """Pools with demand whose inventory is below the low-water mark, busiest first"""
+        mcq_count = func.count(Question.id).filter(Question.type == QuestionType.MCQ.value)
+        subjective_count = func.count(Question.id).filter(Question.type == QuestionType.SUBJECTIVE.value)
+
+        rows = (
+            db.query(QuestionPool.subject, QuestionPool.topic, QuestionPool.difficulty)
+            .outerjoin(Question, and_(
+                Question.subject == QuestionPool.subject,
+                Question.topic == QuestionPool.topic,
+                Question.difficulty == QuestionPool.difficulty,
+                Question.duplicate_of.is_(None)
+            ))
+            .filter(QuestionPool.demand_count > 0)
+            .group_by(QuestionPool.id)
+            .having(or_(
+                mcq_count < self.low_water[QuestionType.MCQ.value],
+                subjective_count < self.low_water[QuestionType.SUBJECTIVE.value]
+            ))
+            .order_by(QuestionPool.demand_count.desc())
+            .limit(limit)
+            .all()
+        )
+        return [tuple(row) for row in rows]
+
+    def _claim(self, db: Session, key: PoolKey) -> Optional[datetime]:
+        """
+        Take the refill lease for a pool so concurrent workers don't double-generate
+
+        Returns:
+            Lease expiry (identifies this holder when renewing), or None if another worker holds it
+        """
+        subject, topic, difficulty = key
+        now = datetime.utcnow()
+        until = now + self.lease
+        result = db.execute(
+            update(QuestionPool)
+            .where(
+                QuestionPool.subject == subject,
+                QuestionPool.topic == topic,
+                QuestionPool.difficulty == difficulty,
+                or_(QuestionPool.replenishing_until.is_(None), QuestionPool.replenishing_until < now)
+            )
+            .values(replenishing_until=until)
+        )
+        db.commit()
+        return until if result.rowcount == 1 else None
+
+    def _renew(self, db: Session, key: PoolKey, held_until: datetime) -> Optional[datetime]:
+        """
+        Extend a lease this worker still holds
+
+        Returns:
+            New lease expiry, or None if the lease expired and was taken over
+        """
+        subject, topic, difficulty = key
+        until = datetime.utcnow() + self.lease
+        result = db.execute(
+            update(QuestionPool)
+            .where(
+                QuestionPool.subject == subject,
+                QuestionPool.topic == topic,
+                QuestionPool.difficulty == difficulty,
+                QuestionPool.replenishing_until == held_until
+            )
+            .values(replenishing_until=until)
+        )
+        db.commit()
+        return until if result.rowcount == 1 else None
+
+    def _release(self, db: Session, key: PoolKey, held_until: datetime, replenished: bool):
+        """Give up the lease (only if still held) and record a successful refill"""
+        subject, topic, difficulty = key
+        pool = and_(
+            QuestionPool.subject == subject,
+            QuestionPool.topic == topic,
+            QuestionPool.difficulty == difficulty
+        )
+        db.execute(
+            update(QuestionPool)
+            .where(pool, QuestionPool.replenishing_until == held_until)
+            .values(replenishing_until=None)
+        )
+        if replenished:
+            db.execute(update(QuestionPool).where(pool).values(last_replenished_at=datetime.utcnow()))
+        db.commit()
+
+    async def replenish_pool(self, key: PoolKey) -> int:
+        """
+        Generate questions until a pool reaches its low-water mark
+
+        Runs at most QUESTION_REPLENISH_MAX_ROUNDS batches and renews the lease
+        before each one, so a slow LLM can't outlive the lease and a pool that
+        keeps producing duplicates can't loop forever.
+
+        Returns:
+            Number of questions generated
+        """
+        subject, topic, difficulty = key
+        db = SessionLocal()
+        generated = 0
+        try:
+            held_until = self._claim(db, key)
+            if held_until is None:
+                return 0
+
+            try:
+                for _ in range(self.max_rounds):
+                    inventory = self.inventory(db, subject, topic, difficulty)
+                    missing = {
+                        question_type: max(0, low_water - inventory.get(question_type, 0))
+                        for question_type, low_water in self.low_water.items()
+                    }
+                    if not any(missing.values()):
+                        break
+
+                    held_until = self._renew(db, key, held_until)
+                    if held_until is None:
+                        logger.warning(f"Lost refill lease for {subject}/{topic} ({difficulty}); stopping")
+                        return generated
+
+                    questions = await question_generator.generate_new_questions(
+                        db=db,
+                        subject=subject,
+                        topic=topic,
+                        difficulty=difficulty,
+                        num_mcq=min(missing[QuestionType.MCQ.value], self.batch_size[QuestionType.MCQ.value]),
+                        num_subjective=min(
+                            missing[QuestionType.SUBJECTIVE.value],
+                            self.batch_size[QuestionType.SUBJECTIVE.value]
+                        )
+                    )
+                    db.commit()
+                    generated += len(questions)
+                    if not questions:
+                        logger.warning(f"No new questions for {subject}/{topic} ({difficulty}); stopping")
+                        break
+                else:
+                    logger.warning(
+                        f"{subject}/{topic} ({difficulty}) still below low-water after {self.max_rounds} rounds"
+                    )
+
+                logger.info(f"✅ Replenished {subject}/{topic} ({difficulty}) with {generated} questions")
+                self._release(db, key, held_until, replenished=generated > 0)
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Replenishing {subject}/{topic} ({difficulty}) failed: {e}")
+                self._release(db, key, held_until, replenished=generated > 0)
+
+            return generated
+        finally:
+            db.close()
+
+    async def run(self):
+        """Background loop: refill requested pools immediately, scan all pools periodically"""
+        while True:
+            try:
+                try:
+                    key = await asyncio.wait_for(self._queue.get(), timeout=self.interval)
+                    self._queued.discard(key)
+                    keys = [key]
+                except asyncio.TimeoutError:
+                    db = SessionLocal()
+                    try:
+                        keys = self._pools_below_low_water(db)
+                    finally:
+                        db.close()
+
+                for key in keys:
+                    await self.replenish_pool(key)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Question replenisher error: {e}")
+                await asyncio.sleep(self.interval)
+
+    def start(self):
+        """Start the background replenisher on the running event loop"""
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self.run())
+            logger.info("Question bank replenisher started")
+
+    async def stop(self):
+        """Stop the background replenisher"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self._queue = None
+            self._queued.clear()
+
+
+# Global question bank instance
+question_bank = QuestionBankService()
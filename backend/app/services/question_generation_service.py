@@ -2,15 +2,24 @@
 Question Generation Service
 Generates UPSC-style questions from NCERT PDFs using RAG + LLM
 """
+import asyncio
 import logging
-from typing import List, Dict, Optional
+import random
+import uuid
+from datetime import datetime
+from typing import List, Dict, Optional, Tuple
 import json
 from groq import Groq
 from openai import OpenAI
 
 from config import settings
 from app.services.rag_service import rag_service
+from app.services.fake_llm import build_llm_client
+from app.services.rate_limiter import rate_limiter, Priority, estimate_tokens
+from app.services.prompt_templates import MCQ_TEMPLATE, SUBJECTIVE_TEMPLATE, prompt_cache_stats
+from app.services.dedup_service import question_deduplicator
 from app.models import Question, QuestionType
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 
 logger = logging.getLogger(__name__)
@@ -21,8 +30,8 @@ class QuestionGenerationService:
     
     def __init__(self):
         # Initialize LLM clients
-        self.groq_client = Groq(api_key=settings.GROQ_API_KEY)
-        self.openai_client = OpenAI(api_key=settings.OPENAI_API_KEY)
+        self.groq_client = build_llm_client("groq", lambda: Groq(api_key=settings.GROQ_API_KEY))
+        self.openai_client = build_llm_client("openai", lambda: OpenAI(api_key=settings.OPENAI_API_KEY))
         self.primary_model = "llama-3.3-70b-versatile"  # Groq
         self.fallback_model = settings.OPENAI_MODEL
     
@@ -33,7 +42,8 @@ class QuestionGenerationService:
         topic: str,
         difficulty: str,
         num_mcq: int = 10,
-        num_subjective: int = 5
+        num_subjective: int = 5,
+        user_id: Optional[uuid.UUID] = None
     ) -> List[Question]:
         """
         Generate questions from NCERT PDFs using RAG
@@ -45,91 +55,245 @@ class QuestionGenerationService:
             difficulty: "easy", "medium", or "hard"
             num_mcq: Number of MCQ questions
             num_subjective: Number of subjective questions
+            user_id: Prefer questions this user hasn't seen when reusing stored ones
             
         Returns:
-            List of generated Question objects
+            List of Question objects (not marked served; see question_bank.mark_served)
+            
+        Raises:
+            Exception: If the pool is too small and generation failed
         """
+        # Imported here: the question bank imports this module
+        from app.services.question_bank_service import question_bank
+        
         try:
-            # Check if questions already exist in DB for this topic
-            existing_questions = db.query(Question).filter(
-                Question.subject == subject,
-                Question.topic == topic,
-                Question.difficulty == difficulty
-            ).all()
+            # Reuse stored questions when the pool has enough of each type
+            existing_questions = question_bank.take_from_pool(
+                db,
+                subject=subject,
+                topic=topic,
+                difficulty=difficulty,
+                num_mcq=num_mcq,
+                num_subjective=num_subjective,
+                user_id=user_id
+            )
             
-            if len(existing_questions) >= (num_mcq + num_subjective):
+            if existing_questions is not None:
                 logger.info(f"Using {len(existing_questions)} existing questions for {subject}/{topic}")
-                return existing_questions[:num_mcq + num_subjective]
-            
-            # Generate new questions using RAG
-            logger.info(f"Generating questions for {subject}/{topic} ({difficulty})")
-            
-            # Step 1: Get relevant content from NCERT PDFs using RAG
-            context = await self._get_relevant_content(subject, topic)
+                return existing_questions
             
-            if not context or len(context.strip()) < 100:
-                logger.warning(f"Insufficient context from RAG, using fallback")
-                context = f"Generate UPSC preparation questions on {topic} in {subject}."
-            
-            # Step 2: Generate MCQ questions
-            mcq_questions = await self._generate_mcq_questions(
-                context=context,
+            return await self.generate_new_questions(
+                db=db,
                 subject=subject,
                 topic=topic,
                 difficulty=difficulty,
-                num_questions=num_mcq
+                num_mcq=num_mcq,
+                num_subjective=num_subjective,
+                include_duplicates=True
             )
             
-            # Step 3: Generate subjective questions
-            subjective_questions = await self._generate_subjective_questions(
+        except Exception as e:
+            # No placeholder questions: they would stay in the pool and be served again
+            logger.error(f"Error generating questions: {e}")
+            raise
+    
+    async def generate_new_questions(
+        self,
+        db: Session,
+        subject: str,
+        topic: str,
+        difficulty: str,
+        num_mcq: int,
+        num_subjective: int,
+        include_duplicates: bool = False
+    ) -> List[Question]:
+        """
+        Generate and store fresh questions (no pool lookup, no fallback)
+        
+        Used inline by generate_questions and by the background replenisher.
+        Generated questions that near-duplicate the pool are not inserted; with
+        `include_duplicates` the existing questions they repeat are returned in
+        their place, so an inline request still gets a full set.
+        
+        Raises:
+            ValueError: If the LLM returned no usable questions
+        """
+        # Generate new questions using RAG
+        logger.info(f"Generating questions for {subject}/{topic} ({difficulty})")
+        
+        # Step 1: Get relevant content from NCERT PDFs using RAG
+        context = await self._get_relevant_content(subject, topic)
+        
+        if not context or len(context.strip()) < 100:
+            logger.warning(f"Insufficient context from RAG, using fallback")
+            context = f"Generate UPSC preparation questions on {topic} in {subject}."
+        
+        # Step 2: Generate MCQ and subjective questions concurrently,
+        # splitting large requests into parallel shards
+        mcq_questions, subjective_questions = await asyncio.gather(
+            self._generate_sharded(
+                self._generate_mcq_questions,
                 context=context,
                 subject=subject,
                 topic=topic,
                 difficulty=difficulty,
-                num_questions=num_subjective
+                num_questions=num_mcq,
+                shard_size=settings.QUESTION_GEN_MCQ_SHARD_SIZE
+            ),
+            self._generate_sharded(
+                self._generate_subjective_questions,
+                context=context,
+                subject=subject,
+                topic=topic,
+                difficulty=difficulty,
+                num_questions=num_subjective,
+                shard_size=settings.QUESTION_GEN_SUBJECTIVE_SHARD_SIZE
             )
+        )
+        
+        # Reject near-duplicates of questions already in the pool
+        mcq_questions, mcq_matches = question_deduplicator.filter_new(db, subject, topic, mcq_questions)
+        subjective_questions, subjective_matches = question_deduplicator.filter_new(
+            db, subject, topic, subjective_questions
+        )
+        duplicates = self._matched_questions(db, mcq_matches, subjective_matches) if include_duplicates else []
+        
+        if not mcq_questions and not subjective_questions and not duplicates:
+            raise ValueError("LLM returned no new questions")
+        
+        # Step 3: Save to database in one multi-row INSERT ... RETURNING
+        now = datetime.utcnow()
+        rows = [
+            {
+                "id": uuid.uuid4(),
+                "type": "mcq",
+                "subject": subject,
+                "topic": topic,
+                "difficulty": difficulty,
+                "question_text": q_data["question"],
+                "options": q_data["options"],
+                "correct_answer": q_data["correct_answer"],
+                "max_marks": 1,
+                "source_reference": q_data.get("source", "NCERT"),
+                "random_key": random.random(),
+                "times_served": 0,
+                "created_at": now
+            }
+            for q_data in mcq_questions
+        ] + [
+            {
+                "id": uuid.uuid4(),
+                "type": "subjective",
+                "subject": subject,
+                "topic": topic,
+                "difficulty": difficulty,
+                "question_text": q_data["question"],
+                "rubric": q_data["rubric"],
+                "max_marks": q_data["marks"],
+                "source_reference": q_data.get("source", "NCERT"),
+                "random_key": random.random(),
+                "times_served": 0,
+                "created_at": now
+            }
+            for q_data in subjective_questions
+        ]
+        
+        all_questions = self.bulk_insert_questions(db, rows)
+        question_deduplicator.record_inserted(db, all_questions)
+        logger.info(f"✅ Generated {len(all_questions)} questions for {subject}/{topic}")
+        
+        if duplicates:
+            logger.info(f"Reusing {len(duplicates)} pool questions in place of near-duplicates")
+            mcqs = [q for q in all_questions if q.type == QuestionType.MCQ.value]
+            subjective = [q for q in all_questions if q.type == QuestionType.SUBJECTIVE.value]
+            all_questions = (
+                mcqs + [q for q in duplicates if q.type == QuestionType.MCQ.value]
+                + subjective + [q for q in duplicates if q.type == QuestionType.SUBJECTIVE.value]
+            )
+        
+        return all_questions
+    
+    @staticmethod
+    def _matched_questions(db: Session, mcq_ids: List[uuid.UUID], subjective_ids: List[uuid.UUID]) -> List[Question]:
+        """Existing pool questions matched by rejected near-duplicates, keeping each one's generated type"""
+        if not mcq_ids and not subjective_ids:
+            return []
+        wanted = {question_id: QuestionType.MCQ.value for question_id in mcq_ids}
+        wanted.update({question_id: QuestionType.SUBJECTIVE.value for question_id in subjective_ids})
+        questions = db.query(Question).filter(Question.id.in_(list(wanted))).all()
+        return [question for question in questions if question.type == wanted[question.id]]
+    
+    @staticmethod
+    def bulk_insert_questions(db: Session, rows: List[Dict]) -> List[Question]:
+        """
+        Insert question rows in one round trip and return them as loaded ORM objects
+        
+        Rows must carry every column the caller will read back (IDs are assigned
+        client-side), so no follow-up SELECT is needed.
+        """
+        if not rows:
+            return []
+        # Rows need the same keys for a single multi-row statement (missing -> NULL)
+        columns = set().union(*rows)
+        rows = [{column: row.get(column) for column in columns} for row in rows]
+        return db.scalars(
+            insert(Question).returning(Question, sort_by_parameter_order=True),
+            rows
+        ).all()
+    
+    async def _generate_sharded(
+        self,
+        generate,
+        context: str,
+        subject: str,
+        topic: str,
+        difficulty: str,
+        num_questions: int,
+        shard_size: int
+    ) -> List[Dict]:
+        """
+        Run a generator in parallel shards and merge the results
+        
+        Args:
+            generate: _generate_mcq_questions or _generate_subjective_questions
+            num_questions: Total number of questions wanted
+            shard_size: Maximum questions per LLM call
             
-            # Step 4: Save to database
-            all_questions = []
-            
-            for q_data in mcq_questions:
-                question = Question(
-                    type="mcq",
-                    subject=subject,
-                    topic=topic,
-                    difficulty=difficulty,
-                    question_text=q_data["question"],
-                    options=q_data["options"],
-                    correct_answer=q_data["correct_answer"],
-                    max_marks=1,
-                    source_reference=q_data.get("source", "NCERT")
-                )
-                db.add(question)
-                all_questions.append(question)
-            
-            for q_data in subjective_questions:
-                question = Question(
-                    type="subjective",
+        Returns:
+            De-duplicated questions (at most num_questions)
+        """
+        if num_questions <= 0:
+            return []
+        
+        shard_size = max(1, shard_size)
+        sizes = [min(shard_size, num_questions - start) for start in range(0, num_questions, shard_size)]
+        
+        results = await asyncio.gather(
+            *(
+                generate(
+                    context=context,
                     subject=subject,
                     topic=topic,
                     difficulty=difficulty,
-                    question_text=q_data["question"],
-                    rubric=q_data["rubric"],
-                    max_marks=q_data["marks"],
-                    source_reference=q_data.get("source", "NCERT")
+                    num_questions=size,
+                    shard=(index + 1, len(sizes))
                 )
-                db.add(question)
-                all_questions.append(question)
-            
-            db.flush()  # Get IDs without committing
-            logger.info(f"✅ Generated {len(all_questions)} questions for {subject}/{topic}")
-            
-            return all_questions
-            
-        except Exception as e:
-            logger.error(f"Error generating questions: {e}")
-            # Fallback to sample questions
-            return self._create_fallback_questions(db, subject, topic, difficulty)
+                for index, size in enumerate(sizes)
+            ),
+            return_exceptions=True
+        )
+        
+        merged = []
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"Question generation shard failed: {result}")
+                continue
+            merged.extend(result)
+        
+        unique = question_deduplicator.dedupe_batch(merged)
+        if len(unique) < len(merged):
+            logger.info(f"Dropped {len(merged) - len(unique)} overlapping questions across shards")
+        return unique[:num_questions]
     
     async def _get_relevant_content(self, subject: str, topic: str) -> str:
         """Get relevant content from NCERT PDFs using RAG"""
@@ -166,69 +330,19 @@ class QuestionGenerationService:
         subject: str,
         topic: str,
         difficulty: str,
-        num_questions: int
+        num_questions: int,
+        shard: Tuple[int, int] = (1, 1)
     ) -> List[Dict]:
         """Generate MCQ questions using LLM"""
         
-        prompt = f"""You are an expert UPSC exam question paper setter. Generate {num_questions} multiple-choice questions (MCQs) based on the following NCERT content.
-
-Subject: {subject}
-Topic: {topic}
-Difficulty: {difficulty}
-Number of questions: {num_questions}
-
-NCERT Content:
-{context}
-
-Requirements:
-1. Questions should be UPSC-style (factual, analytical, application-based)
-2. Each question should have 4 options (A, B, C, D)
-3. Only one correct answer
-4. Difficulty level: {difficulty}
-   - Easy: Direct recall, basic concepts
-   - Medium: Understanding, application of concepts
-   - Hard: Analysis, evaluation, synthesis
-5. Questions should be based strictly on the provided NCERT content
-
-Return ONLY a valid JSON array with this exact format:
-[
-  {{
-    "question": "Question text here?",
-    "options": {{"A": "Option A", "B": "Option B", "C": "Option C", "D": "Option D"}},
-    "correct_answer": "A",
-    "source": "Brief reference to NCERT content"
-  }}
-]
-
-JSON array:"""
+        messages = MCQ_TEMPLATE.render(
+            shared_context=f"NCERT Content:\n{context}",
+            item=self._generation_request(subject, topic, difficulty, num_questions, shard)
+        )
         
-        try:
-            # Try Groq first
-            response = self.groq_client.chat.completions.create(
-                model=self.primary_model,
-                messages=[
-                    {"role": "system", "content": "You are a UPSC exam question generator. Always respond with valid JSON only."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                max_tokens=4000
-            )
-            
-            content = response.choices[0].message.content.strip()
-            
-        except Exception as e:
-            logger.warning(f"Groq failed, using OpenAI fallback: {e}")
-            # Fallback to OpenAI
-            response = self.openai_client.chat.completions.create(
-                model=self.fallback_model,
-                messages=[
-                    {"role": "system", "content": "You are a UPSC exam question generator. Always respond with valid JSON only."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                max_tokens=4000
-            )
-            content = response.choices[0].message.content.strip()
+        # ~400 completion tokens per MCQ, capped at the original 4000 budget
+        max_tokens = min(4000, 400 * num_questions + 200)
+        content = await self._complete(messages, max_tokens=max_tokens, template=MCQ_TEMPLATE.name)
         
         # Parse JSON
         try:
@@ -257,70 +371,19 @@ JSON array:"""
         subject: str,
         topic: str,
         difficulty: str,
-        num_questions: int
+        num_questions: int,
+        shard: Tuple[int, int] = (1, 1)
     ) -> List[Dict]:
         """Generate subjective questions using LLM"""
         
-        prompt = f"""You are an expert UPSC exam question paper setter. Generate {num_questions} subjective (descriptive/essay-type) questions based on the following NCERT content.
-
-Subject: {subject}
-Topic: {topic}
-Difficulty: {difficulty}
-Number of questions: {num_questions}
-
-NCERT Content:
-{context}
-
-Requirements:
-1. Questions should be UPSC Mains-style (analytical, evaluative, comprehensive)
-2. Each question should require detailed written answers
-3. Include marks allocation (5, 10, or 15 marks based on depth required)
-4. Include evaluation rubric for each question
-5. Difficulty level: {difficulty}
-   - Easy: Explain, describe (5-10 marks)
-   - Medium: Analyze, compare (10-15 marks)
-   - Hard: Critically evaluate, synthesize (15+ marks)
-6. Questions should be based strictly on the provided NCERT content
-
-Return ONLY a valid JSON array with this exact format:
-[
-  {{
-    "question": "Question text here",
-    "marks": 10,
-    "rubric": "Evaluation criteria: structure, accuracy, depth, examples",
-    "source": "Brief reference to NCERT content"
-  }}
-]
-
-JSON array:"""
+        messages = SUBJECTIVE_TEMPLATE.render(
+            shared_context=f"NCERT Content:\n{context}",
+            item=self._generation_request(subject, topic, difficulty, num_questions, shard)
+        )
         
-        try:
-            # Try Groq first
-            response = self.groq_client.chat.completions.create(
-                model=self.primary_model,
-                messages=[
-                    {"role": "system", "content": "You are a UPSC exam question generator. Always respond with valid JSON only."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                max_tokens=3000
-            )
-            
-            content = response.choices[0].message.content.strip()
-            
-        except Exception as e:
-            logger.warning(f"Groq failed, using OpenAI fallback: {e}")
-            # Fallback to OpenAI
-            response = self.openai_client.chat.completions.create(
-                model=self.fallback_model,
-                messages=[
-                    {"role": "system", "content": "You are a UPSC exam question generator. Always respond with valid JSON only."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                max_tokens=3000
-            )
-            content = response.choices[0].message.content.strip()
+        # ~500 completion tokens per question (with rubric), capped at 3000
+        max_tokens = min(3000, 500 * num_questions + 200)
+        content = await self._complete(messages, max_tokens=max_tokens, template=SUBJECTIVE_TEMPLATE.name)
         
         # Parse JSON
         try:
@@ -343,45 +406,61 @@ JSON array:"""
             logger.error(f"Content: {content[:500]}")
             return []
     
-    def _create_fallback_questions(
-        self,
-        db: Session,
+    @staticmethod
+    def _generation_request(
         subject: str,
         topic: str,
-        difficulty: str
-    ) -> List[Question]:
-        """Create basic fallback questions if generation fails"""
-        logger.warning("Using fallback questions due to generation failure")
-        
-        questions = [
-            Question(
-                type="mcq",
-                subject=subject,
-                topic=topic,
-                difficulty=difficulty,
-                question_text=f"Which of the following is a key characteristic of {topic}?",
-                options={"A": "Option A", "B": "Option B", "C": "Option C", "D": "Option D"},
-                correct_answer="B",
-                max_marks=1,
-                source_reference="Generated"
-            ),
-            Question(
-                type="subjective",
-                subject=subject,
-                topic=topic,
-                difficulty=difficulty,
-                question_text=f"Discuss the significance of {topic} in {subject}. (10 marks)",
-                rubric="Evaluate structure, factual accuracy, depth of analysis, and use of relevant examples.",
-                max_marks=10,
-                source_reference="Generated"
-            ),
-        ]
+        difficulty: str,
+        num_questions: int,
+        shard: Tuple[int, int] = (1, 1)
+    ) -> str:
+        """Per-request tail of a generation prompt"""
+        shard_index, shard_count = shard
+        shard_note = ""
+        if shard_count > 1:
+            shard_note = (
+                f"\nQuestion set: {shard_index} of {shard_count}. Other sets are generated in parallel, "
+                f"so focus on different sub-topics and facts (set {shard_index}'s share of the content).\n"
+            )
+        return f"""Subject: {subject}
+Topic: {topic}
+Difficulty: {difficulty}
+Number of questions: {num_questions}
+{shard_note}
+JSON array:"""
+    
+    async def _complete(self, messages: List[Dict], max_tokens: int, template: str) -> str:
+        """Run generation messages on Groq, falling back to OpenAI (rate limited)"""
+        tokens = estimate_tokens("".join(m["content"] for m in messages), max_tokens=max_tokens)
         
-        for q in questions:
-            db.add(q)
+        try:
+            # Try Groq first
+            charged = await rate_limiter.acquire("groq", self.primary_model, tokens, Priority.PREGENERATION)
+            response = await asyncio.to_thread(
+                self.groq_client.chat.completions.create,
+                model=self.primary_model,
+                messages=messages,
+                temperature=0.7,
+                max_tokens=max_tokens
+            )
+            await rate_limiter.settle("groq", self.primary_model, charged, response.usage)
+            prompt_cache_stats.record(f"groq:{template}", response.usage)
+            
+        except Exception as e:
+            logger.warning(f"Groq failed, using OpenAI fallback: {e}")
+            # Fallback to OpenAI
+            charged = await rate_limiter.acquire("openai", self.fallback_model, tokens, Priority.PREGENERATION)
+            response = await asyncio.to_thread(
+                self.openai_client.chat.completions.create,
+                model=self.fallback_model,
+                messages=messages,
+                temperature=0.7,
+                max_tokens=max_tokens
+            )
+            await rate_limiter.settle("openai", self.fallback_model, charged, response.usage)
+            prompt_cache_stats.record(f"openai:{template}", response.usage)
         
-        db.flush()
-        return questions
+        return response.choices[0].message.content.strip()
 
 
 # Global instance
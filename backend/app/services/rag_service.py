@@ -1,11 +1,15 @@
 """
 RAG Service for processing and querying NCERT documents with Supabase vector storage
 """
+import asyncio
 import os
+import re
 from typing import List, Dict, Optional
 from pathlib import Path
 import logging
 
+import numpy as np
+
 from llama_index.core import (
     VectorStoreIndex,
     SimpleDirectoryReader,
@@ -15,6 +19,7 @@ from llama_index.core import (
     Document
 )
 from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.vector_stores import ExactMatchFilter, MetadataFilters, VectorStoreQuery
 from llama_index.embeddings.openai import OpenAIEmbedding
 from llama_index.vector_stores.supabase import SupabaseVectorStore
 from sqlalchemy import create_engine
@@ -35,6 +40,7 @@ class RAGService:
         self.index = None
         self.query_engine = None
         self.vector_store = None
+        self._matrix_cache = {}  # subject -> (node IDs, normalized embeddings) of the local index
         
         logger.info(f"RAG Service initialized with data_dir: {self.data_dir}")
         
@@ -172,6 +178,8 @@ class RAGService:
                 show_progress=True
             )
             
+            self._matrix_cache.clear()
+            
             # Persist index locally as backup
             if not self.vector_store:
                 self.index_dir.mkdir(exist_ok=True)
@@ -272,42 +280,174 @@ class RAGService:
         
         return "\n".join(context_parts)
     
+    def _local_matrix(self, subject: Optional[str]):
+        """
+        Normalized embedding matrix of the local index (cached per subject)
+        
+        Returns:
+            (node IDs, matrix of shape [nodes, dim])
+        """
+        if subject in self._matrix_cache:
+            return self._matrix_cache[subject]
+        
+        vector_data = self.index.vector_store.data
+        node_ids = [
+            node_id for node_id in vector_data.embedding_dict
+            if subject is None or (vector_data.metadata_dict.get(node_id) or {}).get("subject") == subject
+        ]
+        matrix = np.array([vector_data.embedding_dict[node_id] for node_id in node_ids], dtype=np.float32)
+        if len(node_ids):
+            matrix /= np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-12
+        
+        self._matrix_cache[subject] = (node_ids, matrix)
+        return node_ids, matrix
+    
+    async def _search_batch(
+        self,
+        embeddings: List[List[float]],
+        subject: Optional[str],
+        top_k: int
+    ) -> List[List[Dict]]:
+        """
+        Top-k chunks for several query embeddings at once
+        
+        The local index is searched with one matrix product over all queries;
+        pgvector-backed stores get the precomputed embeddings concurrently.
+        
+        Returns:
+            Per query, a list of {"text", "score", "metadata"} hits
+        """
+        if self.vector_store is None:
+            node_ids, matrix = self._local_matrix(subject)
+            if not node_ids:
+                return [[] for _ in embeddings]
+            
+            queries = np.array(embeddings, dtype=np.float32)
+            queries /= np.linalg.norm(queries, axis=1, keepdims=True) + 1e-12
+            scores = queries @ matrix.T
+            k = min(top_k, len(node_ids))
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            
+            results = []
+            for row, candidates in enumerate(top):
+                ranked = candidates[np.argsort(-scores[row, candidates])]
+                hits = []
+                for column in ranked:
+                    node = self.index.docstore.get_node(node_ids[column])
+                    hits.append({"text": node.text, "score": float(scores[row, column]), "metadata": node.metadata})
+                results.append(hits)
+            return results
+        
+        filters = MetadataFilters(filters=[ExactMatchFilter(key="subject", value=subject)]) if subject else None
+        
+        def search(embedding):
+            result = self.vector_store.query(
+                VectorStoreQuery(query_embedding=embedding, similarity_top_k=top_k, filters=filters)
+            )
+            return [
+                {"text": node.text, "score": score, "metadata": node.metadata}
+                for node, score in zip(result.nodes or [], result.similarities or [])
+            ]
+        
+        return await asyncio.gather(*(asyncio.to_thread(search, embedding) for embedding in embeddings))
+    
+    @staticmethod
+    def _chapter_reference(hits: List[Dict]) -> Dict:
+        """Chapter name and page labels from retrieved chunk metadata"""
+        chapter = None
+        pages = []
+        for hit in hits:
+            metadata = hit["metadata"] or {}
+            if chapter is None:
+                file_name = metadata.get("file_name") or metadata.get("source")
+                chapter = Path(file_name).stem if file_name else None
+            page = metadata.get("page_label")
+            if page and page not in pages:
+                pages.append(page)
+        return {"chapter": chapter, "pages": ", ".join(pages) or None}
+    
     async def get_recommendations(
         self,
         concept_gaps: List[str],
-        subject: str
+        subject: str,
+        top_k: int = 2,
+        summarize: bool = False
     ) -> Dict:
         """
         Get NCERT chapter recommendations for concept gaps
         
+        All concepts are embedded in one call and searched together; chapters
+        and pages come from chunk metadata, so no LLM call is made unless
+        `summarize` asks for one combined summary.
+        
         Args:
             concept_gaps: List of concepts the student needs to work on
             subject: Subject name
+            top_k: Chunks retrieved per concept
+            summarize: Add a short LLM-written study note per concept
             
         Returns:
             Dictionary with NCERT recommendations
         """
-        recommendations = []
+        if not concept_gaps:
+            return {"recommendations": [], "subject": subject}
         
-        for concept in concept_gaps:
-            result = await self.query(
-                query=f"Which NCERT chapter covers {concept}? Provide chapter name, pages, and key topics.",
-                subject=subject,
-                top_k=2
-            )
+        try:
+            if not self.index:
+                await self.initialize()
             
-            if result["sources"]:
-                rec = {
-                    "concept": concept,
-                    "recommendations": result["response"],
-                    "sources": result["sources"]
-                }
-                recommendations.append(rec)
+            embeddings = await asyncio.to_thread(
+                Settings.embed_model.get_text_embedding_batch,
+                [f"NCERT {subject}: {concept}" for concept in concept_gaps]
+            )
+            results = await self._search_batch(embeddings, subject, top_k)
+        except Exception as e:
+            logger.error(f"Error retrieving recommendations: {e}")
+            return {"recommendations": [], "subject": subject, "error": str(e)}
+        
+        recommendations = []
+        for concept, hits in zip(concept_gaps, results):
+            if not hits:
+                continue
+            recommendations.append({
+                "concept": concept,
+                **self._chapter_reference(hits),
+                "recommendations": "",
+                "sources": [
+                    {"text": hit["text"][:500], "score": hit["score"], "metadata": hit["metadata"]}
+                    for hit in hits
+                ]
+            })
+        
+        if summarize and recommendations:
+            await self._summarize_recommendations(recommendations)
         
         return {
             "recommendations": recommendations,
             "subject": subject
         }
+    
+    async def _summarize_recommendations(self, recommendations: List[Dict]):
+        """Fill each recommendation's study note with a single LLM call"""
+        sections = "\n\n".join(
+            f"[{i}] Concept: {rec['concept']}\n" + "\n".join(source["text"] for source in rec["sources"])
+            for i, rec in enumerate(recommendations, 1)
+        )
+        prompt = (
+            "For each numbered concept below, write one or two sentences telling a UPSC aspirant "
+            "what to revise from the NCERT excerpts. Answer with one line per concept, "
+            "formatted as [number] note.\n\n" + sections
+        )
+        try:
+            response = await Settings.llm.acomplete(prompt)
+        except Exception as e:
+            logger.error(f"Recommendation summary failed: {e}")
+            return
+        
+        for line in str(response).splitlines():
+            match = re.match(r"\s*\[(\d+)\]\s*(.+)", line)
+            if match and 1 <= int(match.group(1)) <= len(recommendations):
+                recommendations[int(match.group(1)) - 1]["recommendations"] = match.group(2).strip()
 
 
 # Global RAG service instance
@@ -0,0 +1,264 @@
+"""
+Client-side rate limiter for outbound LLM traffic
+
+Token buckets track requests-per-minute (RPM) and tokens-per-minute (TPM)
+per provider/model. Waiting calls are admitted in priority order, and lower
+priorities cannot dip into the headroom reserved for interactive traffic.
+Bucket state lives in memory (single process) or in Redis (shared by workers).
+"""
+import asyncio
+import enum
+import heapq
+import itertools
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(enum.IntEnum):
+    """Priority classes for LLM calls (lower value is served first)"""
+    INTERACTIVE = 0  # Real-time feedback, e.g. /evaluate/subjective
+    EVALUATION = 1  # Full assessment evaluation
+    PREGENERATION = 2  # Question generation and pool replenishment
+
+
+class RateLimitExceeded(Exception):
+    """Raised when admission control refuses an LLM call"""
+
+
+@dataclass(frozen=True)
+class Limits:
+    rpm: int
+    tpm: int
+
+
+# Share of each bucket a priority class may NOT consume. Bulk generation
+# stops at half capacity so interactive calls always find headroom.
+RESERVED_FRACTION = {
+    Priority.INTERACTIVE: 0.0,
+    Priority.EVALUATION: 0.2,
+    Priority.PREGENERATION: 0.5,
+}
+
+# Longest a call may wait in the queue before it is rejected
+MAX_WAIT_SECONDS = {
+    Priority.INTERACTIVE: 15.0,
+    Priority.EVALUATION: 60.0,
+    Priority.PREGENERATION: 180.0,
+}
+
+
+def estimate_tokens(text: str, max_tokens: int = 0) -> int:
+    """Rough token estimate for a prompt (~4 chars/token) plus completion budget"""
+    return len(text) // 4 + max_tokens
+
+
+class InMemoryBucketStore:
+    """Token buckets kept in process memory"""
+
+    def __init__(self):
+        self._buckets: Dict[str, Tuple[float, float, float]] = {}
+        self._lock = threading.Lock()
+
+    def _refill(self, key: str, limits: Limits, now: float) -> Tuple[float, float]:
+        requests, tokens, updated = self._buckets.get(key, (limits.rpm, limits.tpm, now))
+        elapsed = max(0.0, now - updated)
+        requests = min(limits.rpm, requests + elapsed * limits.rpm / 60)
+        tokens = min(limits.tpm, tokens + elapsed * limits.tpm / 60)
+        return requests, tokens
+
+    async def try_acquire(self, key: str, limits: Limits, tokens: int, reserve: float) -> float:
+        """Take one request and `tokens` tokens; return 0 on success or seconds to wait"""
+        with self._lock:
+            now = time.monotonic()
+            available_requests, available_tokens = self._refill(key, limits, now)
+            needed_requests = 1 + reserve * limits.rpm
+            needed_tokens = tokens + reserve * limits.tpm
+
+            if available_requests >= needed_requests and available_tokens >= needed_tokens:
+                self._buckets[key] = (available_requests - 1, available_tokens - tokens, now)
+                return 0.0
+
+            self._buckets[key] = (available_requests, available_tokens, now)
+            return max(
+                (needed_requests - available_requests) * 60 / limits.rpm,
+                (needed_tokens - available_tokens) * 60 / limits.tpm,
+            )
+
+    async def adjust(self, key: str, limits: Limits, token_delta: int):
+        """Charge (positive) or refund (negative) tokens after actual usage is known"""
+        with self._lock:
+            now = time.monotonic()
+            requests, tokens = self._refill(key, limits, now)
+            self._buckets[key] = (requests, min(limits.tpm, tokens - token_delta), now)
+
+
+class RedisBucketStore:
+    """Token buckets shared across workers through Redis (atomic Lua scripts)"""
+
+    ACQUIRE_SCRIPT = """
+local rpm = tonumber(ARGV[1])
+local tpm = tonumber(ARGV[2])
+local tokens = tonumber(ARGV[3])
+local reserve = tonumber(ARGV[4])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'req', 'tok', 'ts')
+local req = tonumber(state[1]) or rpm
+local tok = tonumber(state[2]) or tpm
+local ts = tonumber(state[3]) or now
+local elapsed = math.max(0, now - ts)
+req = math.min(rpm, req + elapsed * rpm / 60)
+tok = math.min(tpm, tok + elapsed * tpm / 60)
+local need_req = 1 + reserve * rpm
+local need_tok = tokens + reserve * tpm
+local wait = 0
+if req >= need_req and tok >= need_tok then
+  req = req - 1
+  tok = tok - tokens
+else
+  wait = math.max((need_req - req) * 60 / rpm, (need_tok - tok) * 60 / tpm)
+end
+redis.call('HSET', KEYS[1], 'req', req, 'tok', tok, 'ts', now)
+redis.call('EXPIRE', KEYS[1], 120)
+return tostring(wait)
+"""
+
+    ADJUST_SCRIPT = """
+local tpm = tonumber(ARGV[1])
+local delta = tonumber(ARGV[2])
+local tok = tonumber(redis.call('HGET', KEYS[1], 'tok')) or tpm
+redis.call('HSET', KEYS[1], 'tok', math.min(tpm, tok - delta))
+redis.call('EXPIRE', KEYS[1], 120)
+return 1
+"""
+
+    def __init__(self, redis_url: str):
+        import redis.asyncio as redis
+
+        self.client = redis.from_url(redis_url)
+        self._acquire = self.client.register_script(self.ACQUIRE_SCRIPT)
+        self._adjust = self.client.register_script(self.ADJUST_SCRIPT)
+
+    @staticmethod
+    def _redis_key(key: str) -> str:
+        return f"llm_ratelimit:{key}"
+
+    async def try_acquire(self, key: str, limits: Limits, tokens: int, reserve: float) -> float:
+        wait = await self._acquire(
+            keys=[self._redis_key(key)],
+            args=[limits.rpm, limits.tpm, tokens, reserve],
+        )
+        return float(wait)
+
+    async def adjust(self, key: str, limits: Limits, token_delta: int):
+        await self._adjust(keys=[self._redis_key(key)], args=[limits.tpm, token_delta])
+
+
+class RateLimiter:
+    """Priority-aware admission control in front of the bucket store"""
+
+    def __init__(self, store=None):
+        self.store = store or self._create_store()
+        self.limits = {
+            "groq": Limits(rpm=settings.GROQ_RPM_LIMIT, tpm=settings.GROQ_TPM_LIMIT),
+            "openai": Limits(rpm=settings.OPENAI_RPM_LIMIT, tpm=settings.OPENAI_TPM_LIMIT),
+        }
+        self.max_queue_depth = settings.LLM_RATE_LIMIT_MAX_QUEUE
+        # Fake and replay providers (load tests) have no quota to protect
+        self.enabled = settings.LLM_PROVIDER_MODE not in ("fake", "replay")
+        self._queues: Dict[str, List[Tuple[int, int]]] = {}
+        self._sequence = itertools.count()
+
+    @staticmethod
+    def _create_store():
+        if settings.LLM_RATE_LIMIT_BACKEND == "redis":
+            try:
+                store = RedisBucketStore(settings.REDIS_URL)
+                logger.info("LLM rate limiter using Redis bucket store")
+                return store
+            except Exception as e:
+                logger.warning(f"Redis rate limiter unavailable ({e}), using in-memory buckets")
+        return InMemoryBucketStore()
+
+    async def acquire(
+        self,
+        provider: str,
+        model: str,
+        tokens: int,
+        priority: Priority = Priority.EVALUATION
+    ) -> int:
+        """
+        Wait until a call may be sent to `provider`/`model`
+
+        Args:
+            provider: "groq" or "openai"
+            model: Model name (buckets are kept per model)
+            tokens: Estimated prompt + completion tokens
+            priority: Priority class of the call
+
+        Returns:
+            Tokens actually charged to the bucket (the estimate, capped at the
+            usable bucket size); pass this to `settle`
+
+        Raises:
+            RateLimitExceeded: If the queue is full or the call would wait too long
+        """
+        if not self.enabled:
+            return tokens
+        key = f"{provider}:{model}"
+        limits = self.limits[provider]
+        reserve = RESERVED_FRACTION[priority]
+        # A single call can never need more than the usable part of the bucket
+        tokens = min(tokens, int(limits.tpm * (1 - reserve)))
+
+        queue = self._queues.setdefault(key, [])
+        if len(queue) >= self.max_queue_depth:
+            raise RateLimitExceeded(f"{key} queue is full ({len(queue)} waiting)")
+
+        entry = (int(priority), next(self._sequence))
+        heapq.heappush(queue, entry)
+        deadline = time.monotonic() + MAX_WAIT_SECONDS[priority]
+
+        try:
+            while True:
+                if queue[0] == entry:
+                    wait = await self.store.try_acquire(key, limits, tokens, reserve)
+                    if wait <= 0:
+                        return tokens
+                else:
+                    # Someone with higher priority (or earlier arrival) goes first
+                    wait = 0.05
+
+                if time.monotonic() + wait > deadline:
+                    raise RateLimitExceeded(
+                        f"{key} rate limit: {priority.name.lower()} call would wait {wait:.1f}s"
+                    )
+                await asyncio.sleep(min(wait, 1.0))
+        finally:
+            queue.remove(entry)
+            heapq.heapify(queue)
+
+    async def settle(self, provider: str, model: str, charged_tokens: int, usage=None):
+        """Reconcile the bucket with the provider-reported token usage (`charged_tokens` as returned by acquire)"""
+        actual_tokens = getattr(usage, "total_tokens", None) if usage is not None else None
+        if not self.enabled or actual_tokens is None:
+            return
+        try:
+            await self.store.adjust(
+                f"{provider}:{model}",
+                self.limits[provider],
+                actual_tokens - charged_tokens
+            )
+        except Exception as e:
+            logger.warning(f"Failed to settle rate limit usage: {e}")
+
+
+# Global rate limiter instance
+rate_limiter = RateLimiter()
@@ -0,0 +1,297 @@
+"""
+Storage Service
+Handwritten answer images live in object storage and the database keeps only
+their keys. Uploads arrive already streamed to a temporary file (see
+image_uploads) and are handed to the backend from disk, so an image is never
+held whole in memory.
+
+Backends: Supabase Storage (default) or a local directory
+(STORAGE_BACKEND=local) for development.
+
+Answers saved before storage existed keep base64 images in the responses
+table; move them with:
+    python -m app.services.storage_service [--batch-size 100]
+"""
+import asyncio
+import base64
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+import shutil
+import tempfile
+import uuid
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1 << 20  # 1 MB
+KEY_PATTERN = re.compile(r"^[A-Za-z0-9_-]+(/[A-Za-z0-9_-]+)*(\.[A-Za-z0-9]+)?$")
+
+
+class StorageLimitError(Exception):
+    """Raised when an upload exceeds the size limit"""
+
+
+def answer_prefix(user_id: UUID, assessment_id: UUID, question_id: UUID) -> str:
+    """
+    Key prefix for one answer's page images
+
+    Keys of inline images are content hashes, so the question is part of the
+    prefix: the same image sent for two questions gets two objects, and
+    replacing one answer's pages never deletes the other's.
+    """
+    return f"answers/{user_id}/{assessment_id}/{question_id}"
+
+
+def decode_data_url(image: str, default_type: str = "image/jpeg") -> Tuple[bytes, str]:
+    """
+    Bytes and content type of a base64 image, with or without a data: URL header
+
+    Raises:
+        binascii.Error: Not valid base64
+    """
+    content_type = default_type
+    if image.startswith("data:"):
+        header, _, image = image.partition(",")
+        content_type = header[5:].split(";")[0] or default_type
+    return base64.b64decode(image), content_type
+
+
+class StorageService:
+    """Streams answer images to storage and reads them back by key"""
+
+    def __init__(self):
+        self.backend = settings.STORAGE_BACKEND
+        self.local_root = Path(settings.STORAGE_LOCAL_DIR).resolve()
+        self.max_bytes = settings.UPLOAD_MAX_BYTES
+        self._remote = None
+
+    def _supabase(self):
+        if self._remote is None:
+            from app.database import storage
+            self._remote = storage
+        return self._remote
+
+    @staticmethod
+    def new_key(prefix: str, content_type: Optional[str] = None, name: Optional[str] = None) -> str:
+        """Object key under `prefix` (random name by default) with an extension matching the content type"""
+        extension = mimetypes.guess_extension(content_type or "") or ""
+        if extension == ".jpe":
+            extension = ".jpg"
+        return f"{prefix.strip('/')}/{name or uuid.uuid4().hex}{extension}"
+
+    @staticmethod
+    def validate_key(key: str) -> str:
+        """
+        Raises:
+            ValueError: Key is not a plain relative object path
+        """
+        if not KEY_PATTERN.match(key or ""):
+            raise ValueError(f"Invalid storage key: {key!r}")
+        return key
+
+    def local_path(self, key: str) -> Optional[str]:
+        """Filesystem path of an object (local backend only, else None)"""
+        if self.backend != "local":
+            return None
+        return str(self.local_root / self.validate_key(key))
+
+    async def save_stream(
+        self,
+        chunks: AsyncIterator[bytes],
+        key: str,
+        content_type: str = "image/jpeg",
+        max_bytes: Optional[int] = None
+    ) -> str:
+        """
+        Spool a chunked upload to disk and store it under `key`
+
+        Args:
+            chunks: Upload body in chunks
+            key: Object key (see new_key), overwritten if it exists
+            max_bytes: Size limit (defaults to UPLOAD_MAX_BYTES)
+
+        Returns:
+            The storage key
+
+        Raises:
+            StorageLimitError: Upload is larger than the limit
+        """
+        limit = max_bytes or self.max_bytes
+        self.validate_key(key)
+
+        # Spool next to the destination for local storage so the final move is a rename
+        spool_dir = None
+        if self.backend == "local":
+            spool_dir = self.local_root / ".incoming"
+            spool_dir.mkdir(parents=True, exist_ok=True)
+        fd, spool_path = tempfile.mkstemp(dir=spool_dir)
+
+        try:
+            size = 0
+            with os.fdopen(fd, "wb") as spool:
+                async for chunk in chunks:
+                    size += len(chunk)
+                    if size > limit:
+                        raise StorageLimitError(f"Upload exceeds {limit // (1 << 20)} MB")
+                    await asyncio.to_thread(spool.write, chunk)
+
+            if self.backend == "local":
+                destination = Path(self.local_path(key))
+                destination.parent.mkdir(parents=True, exist_ok=True)
+                await asyncio.to_thread(shutil.move, spool_path, destination)
+            else:
+                await self._supabase().upload_local_file(key, spool_path, content_type)
+
+            logger.info(f"Stored {size} bytes as {key}")
+            return key
+
+        finally:
+            if os.path.exists(spool_path):
+                os.unlink(spool_path)
+
+    async def save_file(self, path: str, prefix: str, content_type: str = "image/jpeg") -> str:
+        """
+        Store an already spooled upload under a new key in `prefix` (see answer_prefix)
+
+        The file is moved (local backend) or uploaded from disk as is, without
+        another copy; the caller still removes `path` afterwards.
+
+        Returns:
+            The storage key
+        """
+        key = self.new_key(prefix, content_type)
+        if self.backend == "local":
+            destination = Path(self.local_path(key))
+            destination.parent.mkdir(parents=True, exist_ok=True)
+            await asyncio.to_thread(shutil.move, path, destination)
+        else:
+            await self._supabase().upload_local_file(key, path, content_type)
+        logger.info(f"Stored {path} as {key}")
+        return key
+
+    async def save_bytes(self, data: bytes, prefix: str, content_type: str = "image/jpeg") -> str:
+        """
+        Store an in-memory image (legacy base64 submissions)
+
+        The key is derived from the content, so saving the same image again
+        (e.g. on every autosave) reuses one object.
+        """
+        key = self.new_key(prefix, content_type, name=hashlib.sha256(data).hexdigest())
+
+        async def chunks():
+            for start in range(0, len(data), CHUNK_SIZE):
+                yield data[start:start + CHUNK_SIZE]
+
+        return await self.save_stream(chunks(), key, content_type)
+
+    async def read(self, key: str) -> bytes:
+        """Object bytes, fetched only when needed (e.g. right before OCR)"""
+        path = self.local_path(key)
+        if path is not None:
+            return await asyncio.to_thread(Path(path).read_bytes)
+        return await self._supabase().download_file(self.validate_key(key))
+
+    async def delete(self, keys: List[str]):
+        """Remove objects, logging (not raising) failures"""
+        if not keys:
+            return
+        try:
+            if self.backend == "local":
+                for key in keys:
+                    Path(self.local_path(key)).unlink(missing_ok=True)
+            else:
+                await self._supabase().delete_files([self.validate_key(key) for key in keys])
+        except Exception as e:
+            logger.error(f"Failed to delete stored objects {keys}: {e}")
+
+
+# Global storage service instance
+storage_service = StorageService()
+
+
+async def migrate_inline_images(db, batch_size: int = 100) -> Dict[str, int]:
+    """
+    Move base64 images of existing answers to storage
+
+    Each answer's images are saved under its answer prefix, image_keys is
+    set and the inline columns are cleared, one batch per commit. Recognized
+    text is kept, and a grade that was current stays current (its content
+    hash is recomputed), so migrated answers are not re-graded.
+
+    Returns:
+        Counts of migrated and failed answers
+    """
+    from sqlalchemy import or_
+    from app.models import Assessment, Question, Response
+    from app.services.evaluation_analytics import response_hash
+
+    migrated = failed = 0
+    last_id = None
+    while True:
+        query = (
+            db.query(Response, Question, Assessment.user_id)
+            .join(Question, Question.id == Response.question_id)
+            .join(Assessment, Assessment.id == Response.assessment_id)
+            .filter(
+                Response.image_keys.is_(None),
+                or_(Response.image_url.isnot(None), Response.image_pages.isnot(None))
+            )
+            .order_by(Response.id)
+        )
+        if last_id is not None:
+            query = query.filter(Response.id > last_id)
+        rows = query.limit(batch_size).all()
+        if not rows:
+            break
+        last_id = rows[-1][0].id
+
+        for response, question, user_id in rows:
+            images = response.image_pages or ([response.image_url] if response.image_url else [])
+            if not images:
+                continue  # JSON null in image_pages, nothing to move
+            prefix = answer_prefix(user_id, response.assessment_id, response.question_id)
+            try:
+                keys = []
+                for image in images:
+                    data, content_type = decode_data_url(image)
+                    keys.append(await storage_service.save_bytes(data, prefix, content_type))
+            except Exception as e:
+                logger.error(f"Could not migrate images of response {response.id}: {e}")
+                failed += 1
+                continue
+
+            graded = response.content_hash is not None and response.content_hash == response_hash(response, question)
+            response.image_keys = keys
+            response.image_url = None
+            response.image_pages = None
+            if graded:
+                response.content_hash = response_hash(response, question)
+            migrated += 1
+
+        db.commit()
+        logger.info(f"Migrated inline images of {migrated} answers so far ({failed} failed)")
+
+    return {"migrated": migrated, "failed": failed}
+
+
+if __name__ == "__main__":
+    import argparse
+    from app.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Move inline base64 answer images to storage")
+    parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        result = asyncio.run(migrate_inline_images(db, batch_size=args.batch_size))
+        print(f"{result['migrated']} answers migrated, {result['failed']} failed")
+    finally:
+        db.close()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Benchmark the LLM-bound endpoints offline
+Creates and evaluates assessments through the create_assessment and
+evaluate_assessment endpoints against the fake (or replay) provider and
+reports throughput and tail latency.
+
+Needs a scratch PostgreSQL database with the schema applied: each run adds a
+throwaway user with its own question pools, assessments and evaluations.
+Retrieval needs live embeddings, so it is served a fixed NCERT excerpt.
+
+Usage:
+    python benchmark_llm.py --database-url postgresql://... --mode fake --requests 50 --concurrency 10
+    python benchmark_llm.py --database-url postgresql://... --mode replay --error-rate 0.05
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# Add backend directory to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+SAMPLE_ANSWER = (
+    "The Mughal revenue system under Akbar was organised by Raja Todar Mal. "
+    "The zabt system measured land and fixed the revenue on the average produce "
+    "of the previous ten years, paid in cash. The empire was divided into subas, "
+    "sarkars and parganas, and the mansabdari system linked revenue assignments "
+    "(jagirs) to military obligations. This brought stability to the agrarian "
+    "economy, although jagirdari transfers later weakened the peasantry and the "
+    "state's finances. In conclusion, the system combined measurement, "
+    "classification of land and cash assessment to create a durable structure."
+)
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run(label, factory, requests, concurrency):
+    """Call factory(i) for i in range(requests), at most `concurrency` at a time; return the results"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+    results = [None] * requests
+
+    async def one(i):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                results[i] = await factory(i)
+                latencies.append((time.perf_counter() - start) * 1000)
+            except Exception:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - start
+
+    print(f"\n📊 {label}")
+    print("-" * 60)
+    print(f"   Requests:    {requests} ({errors} failed), concurrency {concurrency}")
+    print(f"   Throughput:  {requests / elapsed:.2f} req/s")
+    if latencies:
+        print(
+            f"   Latency ms:  p50={percentile(latencies, 50):.0f} "
+            f"p95={percentile(latencies, 95):.0f} p99={percentile(latencies, 99):.0f}"
+        )
+    return results
+
+
+def serve_offline_retrieval(context):
+    """Replace embedding-backed lookups with fixed results (only LLM calls are faked)"""
+    from app.api import evaluations
+    from app.services.question_generation_service import question_generator
+
+    async def relevant_content(subject, topic):
+        return context
+
+    async def evaluation_context(question, subject, topic):
+        return context
+
+    async def no_recommendations(db, concept_gaps, subject):
+        return {"recommendations": []}
+
+    async def no_pyqs(db, concept_gaps, subject):
+        return []
+
+    question_generator._get_relevant_content = relevant_content
+    evaluations.rag_service.get_context_for_evaluation = evaluation_context
+    evaluations.concept_index.get_recommendations = no_recommendations
+    evaluations.pyq_service.recommend = no_pyqs
+
+
+async def main(args):
+    from app.api.assessments import create_assessment, submit_assessment
+    from app.api.evaluations import evaluate_assessment
+    from app.database import SessionLocal
+    from app.models import User
+    from app.schemas import AssessmentCreate, AssessmentSubmit, ResponseSubmit
+    from app.services.prompt_templates import prompt_cache_stats
+
+    # Provider calls run in worker threads; size the pool so --concurrency is not capped by it
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=args.concurrency + 4))
+
+    serve_offline_retrieval("The Mughal empire's land revenue system (zabt) was devised under Akbar. " * 40)
+
+    run_id = uuid.uuid4().hex[:8]
+    db = SessionLocal()
+    try:
+        user = User(email=f"benchmark-{run_id}@example.com", password_hash="x", full_name="Benchmark")
+        db.add(user)
+        db.commit()
+        db.refresh(user)
+    finally:
+        db.close()
+
+    async def create(i):
+        # Five topics per run: the first requests generate inline, later ones reuse the pool
+        db = SessionLocal()
+        try:
+            response = await create_assessment(
+                AssessmentCreate(subject="history", topic=f"Benchmark {run_id} {i % 5}", difficulty_level="medium"),
+                current_user=user,
+                db=db
+            )
+            return json.loads(response.body)
+        finally:
+            db.close()
+
+    async def submit(assessment):
+        db = SessionLocal()
+        try:
+            await submit_assessment(
+                uuid.UUID(assessment["id"]),
+                AssessmentSubmit(responses=[
+                    ResponseSubmit(
+                        question_id=question["id"],
+                        user_answer="A" if question["type"] == "mcq" else SAMPLE_ANSWER
+                    )
+                    for question in assessment["questions"]
+                ]),
+                idempotency_key=None,
+                current_user=user,
+                db=db
+            )
+        finally:
+            db.close()
+
+    async def evaluate(i):
+        db = SessionLocal()
+        try:
+            await evaluate_assessment(uuid.UUID(assessments[i]["id"]), current_user=user, db=db)
+        finally:
+            db.close()
+
+    print("=" * 60)
+    print(f"🧪 LLM benchmark ({os.environ['LLM_PROVIDER_MODE']} provider)")
+    print("=" * 60)
+
+    assessments = [a for a in await run("create_assessment", create, args.requests, args.concurrency) if a]
+    for assessment in assessments:
+        await submit(assessment)
+    await run("evaluate_assessment", evaluate, len(assessments), args.concurrency)
+
+    print("\n🗄️  Prompt cache")
+    print("-" * 60)
+    for template, stats in prompt_cache_stats.snapshot().items():
+        print(f"   {template}: hit_rate={stats['hit_rate']} cached_token_ratio={stats['cached_token_ratio']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", required=True, help="Scratch PostgreSQL database")
+    parser.add_argument("--mode", choices=["fake", "replay"], default="fake")
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=None, help="Median fake latency")
+    parser.add_argument("--error-rate", type=float, default=None, help="Injected error rate (0-1)")
+    args = parser.parse_args()
+
+    # Settings are read at import time, so configure the database and provider first
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ["LLM_PROVIDER_MODE"] = args.mode
+    if args.latency_ms is not None:
+        os.environ["LLM_FAKE_LATENCY_MEDIAN_MS"] = str(args.latency_ms)
+    if args.error_rate is not None:
+        os.environ["LLM_FAKE_ERROR_RATE"] = str(args.error_rate)
+
+    asyncio.run(main(args))
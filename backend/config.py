@@ -28,9 +28,85 @@ class Settings(BaseSettings):
     OPENAI_API_KEY: str
     OPENAI_MODEL: str = "gpt-4o-mini"
     
+    # LLM rate limiting (client-side, per provider/model)
+    LLM_RATE_LIMIT_BACKEND: str = "memory"  # "memory" (single process) or "redis" (shared across workers)
+    LLM_RATE_LIMIT_MAX_QUEUE: int = 100  # Max calls waiting per provider/model
+    GROQ_RPM_LIMIT: int = 30
+    GROQ_TPM_LIMIT: int = 12000
+    OPENAI_RPM_LIMIT: int = 500
+    OPENAI_TPM_LIMIT: int = 200000
+    
+    # Local first-pass scoring (short-circuits trivial answers before the hosted LLM)
+    LOCAL_SCORING_ENABLED: bool = True
+    LOCAL_SCORING_MODEL: str = "all-MiniLM-L6-v2"  # sentence-transformers model, runs on CPU
+    LOCAL_SCORING_MIN_WORDS: int = 40  # Shorter answers are scored locally, capped at 20% of the marks
+    LOCAL_SCORING_ESCALATE_SIMILARITY: float = 0.45  # Short answers at least this similar to the reference go to the LLM
+    
+    # LLM provider mode: "live", "fake" (synthetic), "record" or "replay" (fixtures)
+    LLM_PROVIDER_MODE: str = "live"
+    LLM_FIXTURE_DIR: str = str(Path(__file__).parent / "fixtures" / "llm")
+    LLM_FAKE_SEED: int = 42
+    LLM_FAKE_LATENCY_MEDIAN_MS: float = 800.0  # Median time to first token
+    LLM_FAKE_LATENCY_SIGMA: float = 0.5  # Log-normal spread (tail latency)
+    LLM_FAKE_TOKENS_PER_SECOND: float = 250.0
+    LLM_FAKE_ERROR_RATE: float = 0.0
+    
+    # Question generation: max questions per parallel LLM call
+    QUESTION_GEN_MCQ_SHARD_SIZE: int = 4
+    QUESTION_GEN_SUBJECTIVE_SHARD_SIZE: int = 4
+    
+    # Question bank: background pre-generation per (subject, topic, difficulty)
+    QUESTION_REPLENISH_ENABLED: bool = True
+    QUESTION_REPLENISH_INTERVAL_SECONDS: int = 300  # Periodic scan of all pools
+    QUESTION_REPLENISH_LEASE_SECONDS: int = 600  # Lease per round; renewed before each batch
+    QUESTION_REPLENISH_MAX_ROUNDS: int = 10  # Batches per refill before giving up until the next scan
+    QUESTION_POOL_LOW_WATER_MCQ: int = 24
+    QUESTION_POOL_LOW_WATER_SUBJECTIVE: int = 12
+    QUESTION_POOL_BATCH_MCQ: int = 8  # Questions generated per replenish round
+    QUESTION_POOL_BATCH_SUBJECTIVE: int = 4
+    QUESTION_SAMPLE_OVERFETCH: int = 3  # Candidate window per sampled question (exposure balancing)
+    QUESTION_DEDUP_THRESHOLD: float = 0.6  # MinHash Jaccard above which generated questions are near-duplicates
+    
+    # Assessment payload cache (rendered question JSON per assessment)
+    ASSESSMENT_CACHE_MAX_ENTRIES: int = 5000
+    
+    # Concept -> NCERT chapter index (built offline)
+    CONCEPT_INDEX_PAGES_PER_WINDOW: int = 4
+    CONCEPT_INDEX_FUZZY_CUTOFF: float = 0.85  # difflib ratio for a name match
+    CONCEPT_INDEX_MAX_DISTANCE: float = 0.35  # Cosine distance for an embedding match
+    CONCEPT_INDEX_CACHE_TTL_SECONDS: int = 300  # How often the in-memory name index checks for rebuilds
+    
+    # Previous year question recommendations
+    PYQ_MAX_DISTANCE: float = 0.5  # Cosine distance above which a PYQ is not relevant
+    
+    # Answer image storage ("supabase" or "local" for development)
+    STORAGE_BACKEND: str = "supabase"
+    STORAGE_LOCAL_DIR: str = "./data/uploads"
+    UPLOAD_MAX_BYTES: int = 10 * 1024 * 1024  # Per image
+    UPLOAD_MAX_PDF_BYTES: int = 50 * 1024 * 1024  # Scanned multi-page answers
+    UPLOAD_MAX_REQUEST_BYTES: int = 100 * 1024 * 1024  # Whole request body (declared or chunked)
+    UPLOAD_SPOOL_DIR: Optional[str] = None  # Temporary files for uploads (system temp dir by default)
+    
     # Optional: OCR Enhancement (Tesseract is default)
     GOOGLE_VISION_API_KEY: Optional[str] = None
     
+    # OCR worker pool (Tesseract runs in separate processes)
+    OCR_WORKERS: Optional[int] = None  # Defaults to the number of CPU cores
+    OCR_MAX_PENDING: int = 32  # Images queued or running before new requests are rejected
+    OCR_TIMEOUT_SECONDS: int = 30  # Per-image Tesseract time limit
+    OCR_QUEUE_TIMEOUT_SECONDS: int = 90  # Total wait including time queued
+    OCR_PREPROCESS: bool = True  # Downscale, deskew, binarize and crop before Tesseract
+    OCR_MAX_PAGES: int = 20  # Pages per multi-page upload
+    OCR_TARGET_DPI: int = 300
+    OCR_MAX_PIXELS: int = 60_000_000  # Larger images are rejected before decoding
+    OCR_ESCALATION_ENGINE: str = "auto"  # "auto" (Google Vision if keyed, else slow Tesseract), "google_vision", "tesseract_best", "none"
+    OCR_ESCALATION_THRESHOLD: float = 60.0  # Mean word confidence below which a page is escalated
+    OCR_HEAVY_DPI: int = 400  # Resolution for the slow Tesseract pass
+    OCR_HEAVY_TESSDATA_DIR: Optional[str] = None  # e.g. tessdata_best models for the slow pass
+    OCR_CACHE_ENABLED: bool = True  # Reuse results for identical images (content-addressed)
+    OCR_CACHE_DIR: str = "./data/ocr_cache"
+    OCR_CACHE_MAX_MB: int = 256
+    
     # Optional: Email Notifications
     RESEND_API_KEY: Optional[str] = None
     FROM_EMAIL: str = "noreply@upscprep.com"
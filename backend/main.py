@@ -7,6 +7,11 @@ import logging
 from config import settings
 from app.api import router
 from app.database import init_db
+from app.middleware import BodySizeLimitMiddleware
+from app.services.prompt_templates import prompt_cache_stats
+from app.services.question_bank_service import question_bank
+from app.services.ocr_service import ocr_service
+from app.services.ocr_engines import ocr_metrics
 
 # Configure logging
 logging.basicConfig(
@@ -24,10 +29,15 @@ async def lifespan(app: FastAPI):
     await init_db()
     logger.info("Database initialized")
     
+    if settings.QUESTION_REPLENISH_ENABLED:
+        question_bank.start()
+    
     yield
     
     # Shutdown
     logger.info("Shutting down UPSC Prep API...")
+    await question_bank.stop()
+    ocr_service.shutdown()
 
 
 app = FastAPI(
@@ -39,6 +49,10 @@ app = FastAPI(
     redoc_url="/redoc" if settings.DEBUG else None,
 )
 
+# Reject oversized request bodies, declared or chunked (added before CORS so
+# the 413 still gets CORS headers)
+app.add_middleware(BodySizeLimitMiddleware, max_bytes=settings.UPLOAD_MAX_REQUEST_BYTES)
+
 # CORS Middleware - Must be added before other middleware
 app.add_middleware(
     CORSMiddleware,
@@ -72,6 +86,9 @@ async def health_check():
         "status": "healthy",
         "database": "connected",
         "vector_store": "connected",
+        "llm_prompt_cache": prompt_cache_stats.snapshot(),
+        "ocr_cache": ocr_service.cache.stats() if ocr_service.cache else None,
+        "ocr_engines": ocr_metrics.snapshot(),
     }
 
 
@@ -0,0 +1,14 @@
+-- Question pool demand tracking and refill leases (QuestionPool model)
+CREATE TABLE IF NOT EXISTS question_pools (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    subject VARCHAR NOT NULL,
+    topic VARCHAR NOT NULL,
+    difficulty VARCHAR NOT NULL,
+    demand_count INTEGER DEFAULT 0,
+    last_requested_at TIMESTAMP,
+    last_replenished_at TIMESTAMP,
+    replenishing_until TIMESTAMP,
+    CONSTRAINT uq_question_pools_key UNIQUE (subject, topic, difficulty)
+);
+
+CREATE INDEX IF NOT EXISTS ix_question_pools_id ON question_pools (id);
@@ -0,0 +1,14 @@
+-- Random pool sampling and exposure balancing (Question.random_key, Question.times_served)
+ALTER TABLE questions ADD COLUMN IF NOT EXISTS random_key DOUBLE PRECISION;
+UPDATE questions SET random_key = random() WHERE random_key IS NULL;
+ALTER TABLE questions ALTER COLUMN random_key SET DEFAULT random();
+ALTER TABLE questions ALTER COLUMN random_key SET NOT NULL;
+
+ALTER TABLE questions ADD COLUMN IF NOT EXISTS times_served INTEGER NOT NULL DEFAULT 0;
+
+CREATE INDEX IF NOT EXISTS ix_questions_pool_sample
+    ON questions (subject, topic, difficulty, type, random_key);
+
+-- Question-set lookups per assessment and unseen-question checks per question
+CREATE INDEX IF NOT EXISTS ix_assessment_questions_assessment_id ON assessment_questions (assessment_id);
+CREATE INDEX IF NOT EXISTS ix_assessment_questions_question_id ON assessment_questions (question_id);
@@ -0,0 +1,3 @@
+-- Keyset pagination of a user's assessment history, newest first
+CREATE INDEX IF NOT EXISTS ix_assessments_user_created
+    ON assessments (user_id, created_at DESC, id DESC);
@@ -0,0 +1,30 @@
+-- One answer per (assessment, question); submit and autosave upsert on this key.
+-- Older clients could insert the same answer twice, so only the newest row of
+-- each pair is kept before the constraint is added.
+ALTER TABLE assessments ADD COLUMN IF NOT EXISTS submit_idempotency_key VARCHAR;
+
+BEGIN;
+
+DELETE FROM responses r
+USING (
+    SELECT id,
+           ROW_NUMBER() OVER (
+               PARTITION BY assessment_id, question_id
+               ORDER BY created_at DESC NULLS LAST, id DESC
+           ) AS position
+    FROM responses
+) ranked
+WHERE r.id = ranked.id
+  AND ranked.position > 1;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_constraint WHERE conname = 'uq_responses_assessment_question'
+    ) THEN
+        ALTER TABLE responses
+            ADD CONSTRAINT uq_responses_assessment_question UNIQUE (assessment_id, question_id);
+    END IF;
+END $$;
+
+COMMIT;
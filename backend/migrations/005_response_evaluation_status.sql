@@ -0,0 +1,3 @@
+-- Per-answer grading state, so re-evaluation only grades pending, failed or changed answers
+ALTER TABLE responses ADD COLUMN IF NOT EXISTS evaluation_status VARCHAR NOT NULL DEFAULT 'pending';
+ALTER TABLE responses ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64);
@@ -0,0 +1,19 @@
+-- Offline-built concept -> NCERT chapter/page index (ConceptIndexEntry model)
+CREATE EXTENSION IF NOT EXISTS vector;
+
+CREATE TABLE IF NOT EXISTS concept_index (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    subject VARCHAR NOT NULL,
+    concept VARCHAR NOT NULL,
+    concept_key VARCHAR NOT NULL,
+    source_file VARCHAR NOT NULL,
+    source_hash VARCHAR(64) NOT NULL,
+    chapter VARCHAR NOT NULL,
+    page_start INTEGER NOT NULL,
+    page_end INTEGER NOT NULL,
+    embedding VECTOR(1536),
+    created_at TIMESTAMP DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS ix_concept_index_subject_key ON concept_index (subject, concept_key);
+CREATE INDEX IF NOT EXISTS ix_concept_index_source_file ON concept_index (source_file);
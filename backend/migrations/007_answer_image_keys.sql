@@ -0,0 +1,4 @@
+-- Storage keys of handwritten answer pages (Response.image_keys); the images
+-- themselves live in object storage. Existing base64 images are moved with
+--     python -m app.services.storage_service
+ALTER TABLE responses ADD COLUMN IF NOT EXISTS image_keys JSON;
@@ -0,0 +1,22 @@
+-- UPSC previous year questions with embeddings (PreviousYearQuestion model),
+-- filled by: python -m app.services.pyq_service <files>
+CREATE EXTENSION IF NOT EXISTS vector;
+
+CREATE TABLE IF NOT EXISTS previous_year_questions (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    exam VARCHAR NOT NULL DEFAULT 'UPSC CSE Mains',
+    year INTEGER NOT NULL,
+    paper VARCHAR NOT NULL,
+    question_number VARCHAR,
+    question_text TEXT NOT NULL,
+    marks INTEGER,
+    subject VARCHAR NOT NULL,
+    topic VARCHAR,
+    embedding VECTOR(1536),
+    content_hash VARCHAR(64) NOT NULL UNIQUE,
+    created_at TIMESTAMP DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS ix_pyqs_subject_year ON previous_year_questions (subject, year);
+CREATE INDEX IF NOT EXISTS ix_pyqs_embedding
+    ON previous_year_questions USING hnsw (embedding vector_cosine_ops);
@@ -0,0 +1,40 @@
+-- Per-answer grading details and concept gaps, aggregated in SQL for reports
+-- (ResponseEvaluation and ResponseConceptGap models)
+CREATE TABLE IF NOT EXISTS response_evaluations (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    response_id UUID NOT NULL UNIQUE REFERENCES responses(id) ON DELETE CASCADE,
+    assessment_id UUID NOT NULL REFERENCES assessments(id),
+    user_id UUID NOT NULL REFERENCES users(id),
+    subject VARCHAR NOT NULL,
+    score DOUBLE PRECISION NOT NULL,
+    max_marks INTEGER NOT NULL,
+    factual_recall DOUBLE PRECISION,
+    analysis DOUBLE PRECISION,
+    critical_thinking DOUBLE PRECISION,
+    structure DOUBLE PRECISION,
+    relevance DOUBLE PRECISION,
+    strengths JSON,
+    weaknesses JSON,
+    feedback TEXT,
+    model_used VARCHAR,
+    created_at TIMESTAMP DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS ix_response_evaluations_assessment_id ON response_evaluations (assessment_id);
+CREATE INDEX IF NOT EXISTS ix_response_evaluations_user_id ON response_evaluations (user_id);
+
+CREATE TABLE IF NOT EXISTS response_concept_gaps (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    response_evaluation_id UUID NOT NULL REFERENCES response_evaluations(id) ON DELETE CASCADE,
+    assessment_id UUID NOT NULL REFERENCES assessments(id),
+    user_id UUID NOT NULL REFERENCES users(id),
+    subject VARCHAR NOT NULL,
+    concept VARCHAR NOT NULL,
+    severity VARCHAR NOT NULL,
+    description TEXT
+);
+
+CREATE INDEX IF NOT EXISTS ix_response_concept_gaps_response_evaluation_id
+    ON response_concept_gaps (response_evaluation_id);
+CREATE INDEX IF NOT EXISTS ix_response_concept_gaps_assessment_id ON response_concept_gaps (assessment_id);
+CREATE INDEX IF NOT EXISTS ix_response_concept_gaps_user_concept ON response_concept_gaps (user_id, concept);
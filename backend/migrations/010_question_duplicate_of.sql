@@ -0,0 +1,2 @@
+-- Link near-duplicate questions to the pool question they repeat
+ALTER TABLE questions ADD COLUMN IF NOT EXISTS duplicate_of UUID REFERENCES questions(id);
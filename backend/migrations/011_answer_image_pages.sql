@@ -0,0 +1,3 @@
+-- Inline base64 pages of multi-page handwritten answers (Response.image_pages);
+-- moved to object storage by: python -m app.services.storage_service
+ALTER TABLE responses ADD COLUMN IF NOT EXISTS image_pages JSON;
@@ -0,0 +1,159 @@
+"""
+Query-count regression test for evaluate_assessment
+
+Grading an assessment must issue the same number of SQL statements no matter
+how many answers it has (no per-response queries). Needs a PostgreSQL
+database; point TEST_DATABASE_URL at a scratch database and run from backend/:
+    TEST_DATABASE_URL=postgresql://... python -m pytest tests
+Tables are created inside a transaction that is rolled back afterwards.
+"""
+import asyncio
+import os
+import sys
+import uuid
+from pathlib import Path
+
+import pytest
+
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+if not TEST_DATABASE_URL:
+    pytest.skip("TEST_DATABASE_URL is not set", allow_module_level=True)
+
+# Settings are read at import time; external services are never reached
+os.environ.setdefault("DATABASE_URL", TEST_DATABASE_URL)
+for name in ("SUPABASE_URL", "SUPABASE_KEY", "SECRET_KEY", "GROQ_API_KEY", "OPENAI_API_KEY"):
+    os.environ.setdefault(name, "test")
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app.api import evaluations
+from app.database import Base, QueryCounter
+from app.models import (
+    Assessment, AssessmentStatus, Evaluation, Question, QuestionType, Response,
+    ResponseConceptGap, ResponseEvaluation, User
+)
+
+TABLES = [
+    model.__table__
+    for model in (User, Assessment, Question, Response, ResponseEvaluation, ResponseConceptGap, Evaluation)
+]
+
+
+@pytest.fixture
+def db():
+    engine = create_engine(TEST_DATABASE_URL)
+    connection = engine.connect()
+    transaction = connection.begin()
+    Base.metadata.create_all(connection, tables=TABLES)
+    # Endpoint commits release savepoints; everything is rolled back at the end
+    session = Session(bind=connection, join_transaction_mode="create_savepoint")
+    try:
+        yield session
+    finally:
+        session.close()
+        transaction.rollback()
+        connection.close()
+        engine.dispose()
+
+
+@pytest.fixture(autouse=True)
+def offline_services(monkeypatch):
+    """Replace LLM, RAG and recommendation calls with fixed results"""
+    async def evaluate_answer(question, user_answer, rubric, context, max_marks=10, **kwargs):
+        return {
+            "score": max_marks / 2,
+            "skill_scores": {"factual_recall": 6.0, "analysis": 5.0},
+            "strengths": ["Clear structure"],
+            "weaknesses": ["Few examples"],
+            "feedback": "Add examples.",
+            "concept_gaps": [{"concept": "Mauryan administration", "severity": "high", "description": "Missing"}],
+            "model_used": "test"
+        }
+
+    async def get_context(question, subject, topic):
+        return ""
+
+    async def no_recommendations(db, concept_gaps, subject):
+        return {"recommendations": []}
+
+    async def no_pyqs(db, concept_gaps, subject):
+        return []
+
+    monkeypatch.setattr(evaluations.llm_service, "evaluate_answer", evaluate_answer)
+    monkeypatch.setattr(evaluations.rag_service, "get_context_for_evaluation", get_context)
+    monkeypatch.setattr(evaluations.concept_index, "get_recommendations", no_recommendations)
+    monkeypatch.setattr(evaluations.pyq_service, "recommend", no_pyqs)
+
+
+def _submitted_assessment(db: Session, user: User, num_responses: int) -> Assessment:
+    """Completed assessment with alternating MCQ and subjective answers"""
+    assessment = Assessment(
+        user_id=user.id,
+        subject="history",
+        topic="Ancient India",
+        difficulty_level="medium",
+        status=AssessmentStatus.COMPLETED.value
+    )
+    db.add(assessment)
+    db.flush()
+
+    for i in range(num_responses):
+        mcq = i % 2 == 0
+        question = Question(
+            type=QuestionType.MCQ.value if mcq else QuestionType.SUBJECTIVE.value,
+            subject="history",
+            topic="Ancient India",
+            difficulty="medium",
+            question_text=f"Question {i} about the Mauryan empire",
+            options={"A": "One", "B": "Two"} if mcq else None,
+            correct_answer="A" if mcq else None,
+            rubric=None if mcq else "Standard UPSC evaluation criteria",
+            max_marks=1 if mcq else 10
+        )
+        db.add(question)
+        db.flush()
+        db.add(Response(
+            assessment_id=assessment.id,
+            question_id=question.id,
+            user_answer="A" if mcq else "The Mauryan state was centralized."
+        ))
+
+    db.commit()
+    return assessment
+
+
+def _count_evaluation_queries(db: Session, user: User, assessment: Assessment) -> int:
+    db.expire_all()
+    with QueryCounter(bind=db.get_bind().engine) as queries:
+        asyncio.run(evaluations.evaluate_assessment(assessment.id, user, db))
+    return queries.count
+
+
+def test_evaluate_assessment_query_count_is_independent_of_response_count(db):
+    user = User(email=f"{uuid.uuid4().hex}@test.com", password_hash="x", full_name="Test User")
+    db.add(user)
+    db.commit()
+
+    small = _submitted_assessment(db, user, num_responses=2)
+    large = _submitted_assessment(db, user, num_responses=12)
+
+    small_count = _count_evaluation_queries(db, user, small)
+    large_count = _count_evaluation_queries(db, user, large)
+
+    assert small_count == large_count, f"{small_count} statements for 2 answers, {large_count} for 12"
+
+
+def test_reevaluation_skips_graded_answers_with_fixed_query_count(db):
+    user = User(email=f"{uuid.uuid4().hex}@test.com", password_hash="x", full_name="Test User")
+    db.add(user)
+    db.commit()
+
+    small = _submitted_assessment(db, user, num_responses=2)
+    large = _submitted_assessment(db, user, num_responses=12)
+    _count_evaluation_queries(db, user, small)
+    _count_evaluation_queries(db, user, large)
+
+    # Nothing changed: no grading writes, and still no per-response queries
+    assert _count_evaluation_queries(db, user, small) == _count_evaluation_queries(db, user, large)
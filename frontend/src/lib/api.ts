@@ -73,6 +73,17 @@ export const authApi = {
   },
 }
 
+// One Idempotency-Key per assessment submission, reused when a submit is retried
+const submitKey = (assessmentId: string) => {
+  const storageKey = `submit_key_${assessmentId}`
+  let key = sessionStorage.getItem(storageKey)
+  if (!key) {
+    key = crypto.randomUUID()
+    sessionStorage.setItem(storageKey, key)
+  }
+  return key
+}
+
 // Assessment API
 export const assessmentApi = {
   list: () => api.get('/assessments/'),
@@ -83,7 +94,9 @@ export const assessmentApi = {
   getById: (id: string) => api.get(`/assessments/${id}/`),
   
   submit: (id: string, responses: any[]) =>
-    api.post(`/assessments/${id}/submit/`, { responses }),
+    api.post(`/assessments/${id}/submit/`, { responses }, {
+      headers: { 'Idempotency-Key': submitKey(id) },
+    }),
 }
 
 // Evaluation API